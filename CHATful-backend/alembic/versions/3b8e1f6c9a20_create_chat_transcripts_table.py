@@ -0,0 +1,44 @@
+"""create chat_transcripts table
+
+Revision ID: 3b8e1f6c9a20
+Revises: d60a30781572
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8e1f6c9a20'
+down_revision: Union[str, Sequence[str], None] = 'd60a30781572'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chat_transcripts',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('bot_id', sa.UUID(), nullable=False),
+    sa.Column('visitor_id', sa.UUID(), nullable=False),
+    sa.Column('question', sa.Text(), nullable=False),
+    sa.Column('answer', sa.Text(), nullable=True),
+    sa.Column('status_code', sa.Integer(), nullable=False),
+    sa.Column('streamed', sa.Boolean(), nullable=False),
+    sa.Column('latency_ms', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['bot_id'], ['chatbots.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_chat_transcripts_bot_id_created_at', 'chat_transcripts', ['bot_id', 'created_at'], unique=False)
+    op.create_index(op.f('ix_chat_transcripts_visitor_id'), 'chat_transcripts', ['visitor_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_chat_transcripts_visitor_id'), table_name='chat_transcripts')
+    op.drop_index('ix_chat_transcripts_bot_id_created_at', table_name='chat_transcripts')
+    op.drop_table('chat_transcripts')
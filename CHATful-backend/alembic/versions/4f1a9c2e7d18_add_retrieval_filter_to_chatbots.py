@@ -0,0 +1,29 @@
+"""add retrieval_filter to chatbots
+
+Revision ID: 4f1a9c2e7d18
+Revises: 7c2d4e9a1b53
+Create Date: 2026-10-18 21:40:17.502913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1a9c2e7d18'
+down_revision: Union[str, Sequence[str], None] = '7c2d4e9a1b53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chatbots', sa.Column('retrieval_filter', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chatbots', 'retrieval_filter')
@@ -0,0 +1,29 @@
+"""add retrieval_weights to chatbots
+
+Revision ID: 7c2d4e9a1b53
+Revises: 3b8e1f6c9a20
+Create Date: 2026-10-18 14:03:52.118604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2d4e9a1b53'
+down_revision: Union[str, Sequence[str], None] = '3b8e1f6c9a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chatbots', sa.Column('retrieval_weights', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chatbots', 'retrieval_weights')
@@ -0,0 +1,60 @@
+"""
+IVF ANN benchmark: recall@10 and query latency against exact search, by nprobe, plus incremental insert cost.
+
+    python -m benchmarks.ann [--chunks 200000] [--topics 2000] [--queries 200] [--dim 384]
+
+Vectors are drawn around `topics` random directions so the corpus has the
+cluster structure of real site crawls (many pages per topic).
+"""
+import argparse, time
+import numpy as np
+from src.chahtbot.retrieval.store import BotIndex
+
+
+def clustered(rng: np.random.Generator, count: int, topics: np.ndarray, spread: float) -> np.ndarray:
+    vectors = topics[rng.integers(0, len(topics), count)] + spread * rng.standard_normal((count, topics.shape[1]), dtype=np.float32)
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def measure(index: BotIndex, queries: np.ndarray, truth: list[set], **kwargs) -> tuple[float, float]:
+    found, started = 0, time.perf_counter()
+    for query, expected in zip(queries, truth):
+        found += len(expected & {chunk_id for chunk_id, _ in index.search(query, 10, **kwargs)})
+    return found / (10 * len(queries)), (time.perf_counter() - started) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--topics", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    topics = rng.standard_normal((args.topics, args.dim), dtype=np.float32) / np.sqrt(args.dim)
+    vectors = clustered(rng, args.chunks, topics, 0.04)
+    queries = clustered(rng, args.queries, topics, 0.04)
+
+    index = BotIndex(args.dim)
+    index.add(vectors, [""] * len(vectors), [""] * len(vectors))
+    truth = [{chunk_id for chunk_id, _ in index.search(query, 10)} for query in queries]
+    recall, exact_latency = measure(index, queries, truth)
+    print(f"exact:          recall@10 {recall:.3f}  {exact_latency * 1e3:7.2f} ms/query")
+
+    started = time.perf_counter()
+    index.index_ann("ivf", min_rows=0)
+    print(f"ivf build:      {len(index.ann.centroids)} lists in {time.perf_counter() - started:.1f} s")
+    for nprobe in (1, 4, 8, 16, 32):
+        recall, latency = measure(index, queries, truth, nprobe=nprobe)
+        print(f"ivf nprobe={nprobe:<3} recall@10 {recall:.3f}  {latency * 1e3:7.2f} ms/query  ({exact_latency / latency:4.1f}x)")
+
+    extra = clustered(rng, args.chunks // 10, topics, 0.04)
+    index.add(extra, [""] * len(extra), [""] * len(extra))
+    started = time.perf_counter()
+    index.index_ann("ivf", min_rows=0)
+    print(f"insert +{len(extra)}:  {time.perf_counter() - started:.2f} s (assigned to existing lists, no re-clustering)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-batched vector search: throughput and latency by batch window, with concurrent callers on one bot.
+
+    python -m benchmarks.batching [--chunks 50000] [--clients 32] [--queries 40] [--windows 0,0.5,1,2,5]
+"""
+import argparse, os, random, tempfile, threading, time
+
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+import numpy as np
+from src.chahtbot.retrieval.embedder import HashingEmbedder
+from src.chahtbot.retrieval.engine import RetrievalEngine
+from src.chahtbot.retrieval.store import VectorStore
+
+
+WORDS = [f"term{i}" for i in range(5000)]
+
+
+def run(engine: RetrievalEngine, queries: list[list[str]]) -> tuple[float, list[float]]:
+    latencies: list[float] = []
+    lock = threading.Lock()
+    start = threading.Barrier(len(queries) + 1)
+
+    def client(mine: list[str]):
+        start.wait()
+        for query in mine:
+            started = time.perf_counter()
+            engine.search("bench", query, 6)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(mine,)) for mine in queries]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=40, help="queries per client")
+    parser.add_argument("--windows", default="0,0.5,1,2,5", help="batch windows in ms (0 = no batching)")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    embedder = HashingEmbedder(args.dim)
+    vectors = np.random.default_rng(7).standard_normal((args.chunks, args.dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = [[" ".join(rng.choices(WORDS, k=8)) for _ in range(args.queries)] for _ in range(args.clients)]
+
+    with tempfile.TemporaryDirectory() as root:
+        store = VectorStore(root, args.dim)
+        store.add("bench", vectors, ["chunk"] * args.chunks, ["bench"] * args.chunks)
+        store.get("bench").search(vectors[0], 6)
+
+        print(f"{args.chunks} x {args.dim} float32, {args.clients} concurrent clients x {args.queries} queries")
+        print(f"{'window ms':>9} {'queries/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for window in (float(w) for w in args.windows.split(",")):
+            engine = RetrievalEngine(embedder, store, window / 1000, max_batch=args.clients)
+            elapsed, latencies = run(engine, queries)
+            total = args.clients * args.queries
+            print(f"{window:>9.1f} {total / elapsed:>10.0f} {latencies[total // 2] * 1e3:>8.2f} {latencies[int(total * 0.99)] * 1e3:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+BM25 keyword index benchmark: build time, memory per indexed token and query latency by corpus size.
+
+    python -m benchmarks.bm25 [--sizes 10000,100000,1000000] [--words 40] [--queries 300]
+"""
+import argparse, time
+import numpy as np
+from src.chahtbot.retrieval.bm25 import Bm25Index
+
+
+VOCAB = 50_000
+
+
+def zipf_words(rng: np.random.Generator, count: int) -> np.ndarray:
+    # natural-language-like skew: a few very common terms, a long tail of rare ones (SKUs, codes)
+    return (rng.zipf(1.15, count) - 1) % VOCAB
+
+
+def build_chunks(rng: np.random.Generator, count: int, words: int) -> list[str]:
+    ids = zipf_words(rng, count * words).reshape(count, words)
+    return [" ".join(f"t{i}" for i in row) for row in ids.tolist()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--words", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    queries = [" ".join(f"t{i}" for i in zipf_words(rng, int(rng.integers(2, 7)))) for _ in range(args.queries)]
+
+    print(f"{'chunks':>9} {'build s':>8} {'postings':>11} {'index MiB':>10} {'B/token':>8} {'B/posting':>10} {'p50 ms':>7} {'p99 ms':>7}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        chunks = build_chunks(rng, size, args.words)
+        started = time.perf_counter()
+        index = Bm25Index.build(chunks)
+        build_time = time.perf_counter() - started
+        del chunks
+
+        tokens = int(index.doc_len.sum())
+        postings = len(index.gaps)
+        index.search(queries[0], 6)
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, 6)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+
+        print(f"{size:>9} {build_time:>8.1f} {postings:>11} {index.nbytes / 2**20:>10.1f} "
+              f"{index.nbytes / tokens:>8.2f} {index.nbytes / postings:>10.2f} "
+              f"{latencies[len(latencies) // 2] * 1e3:>7.2f} {latencies[int(len(latencies) * 0.99)] * 1e3:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
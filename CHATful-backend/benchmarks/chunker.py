@@ -0,0 +1,73 @@
+"""
+Chunker throughput on pymupdf4llm-style markdown (pages, headings, paragraphs, lists, tables), in MB/s.
+
+    python -m benchmarks.chunker [--mb 50] [--tokens 300] [--overlap 60]
+"""
+import argparse, random, time, tracemalloc
+from src.chahtbot.retrieval.chunker import PAGE_MARKER, iter_chunks
+
+
+WORDS = [f"word{i}" for i in range(3000)]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words)).capitalize() + "."
+
+
+def page(rng: random.Random, number: int) -> str:
+    blocks = [PAGE_MARKER.format(number)]
+    for section in range(rng.randint(1, 3)):
+        blocks.append(f"{'#' * rng.randint(1, 3)} Section {number}.{section}")
+        for _ in range(rng.randint(2, 5)):
+            kind = rng.random()
+            if kind < 0.6:
+                # now and then a paragraph longer than the budget
+                blocks.append(" ".join(sentence(rng, rng.randint(8, 25)) for _ in range(rng.randint(2, 40))))
+            elif kind < 0.85:
+                blocks.append("\n".join(f"- {sentence(rng, rng.randint(4, 14))}" for _ in range(rng.randint(3, 8))))
+            else:
+                rows = [f"| {rng.choice(WORDS)} | {rng.randint(0, 999)} | {sentence(rng, 4)} |" for _ in range(rng.randint(3, 30))]
+                blocks.append("\n".join(["| Name | Value | Notes |", "|---|---|---|", *rows]))
+    return "\n\n".join(blocks)
+
+
+def build_markdown(rng: random.Random, megabytes: float) -> str:
+    pages, size = [], 0
+    while size < megabytes * 2**20:
+        pages.append(page(rng, len(pages) + 1))
+        size += len(pages[-1]) + 2
+    return "\n\n".join(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=50)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--overlap", type=int, default=60)
+    args = parser.parse_args()
+
+    markdown = build_markdown(random.Random(7), args.mb)
+    size = len(markdown.encode("utf-8")) / 2**20
+
+    started = time.perf_counter()
+    chunks = chars = 0
+    for chunk in iter_chunks(markdown, args.tokens, args.overlap):
+        chunks += 1
+        chars += len(chunk.text)
+    elapsed = time.perf_counter() - started
+
+    # second pass under tracemalloc (slow): what chunking allocates on top of the input
+    tracemalloc.start()
+    for chunk in iter_chunks(markdown, args.tokens, args.overlap):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"markdown:   {size:.1f} MB, {markdown.count('<!-- page')} pages")
+    print(f"chunks:     {chunks} ({chars / chunks:.0f} chars avg, budget {args.tokens} tokens, overlap {args.overlap})")
+    print(f"throughput: {size / elapsed:.1f} MB/s ({elapsed:.2f} s)")
+    print(f"peak extra memory while chunking: {peak / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Filtered vs unfiltered vector search latency on one bot, by the share of chunks the filter leaves eligible.
+
+    python -m benchmarks.filters [--chunks 200000] [--files 1000] [--queries 200] [--shares 0.001,0.01,0.1,0.3,0.5,0.9]
+
+Files are selected at random until they cover the share; "post-filter" is the alternative this replaces:
+an unfiltered top-k over 10x the depth, with the ineligible hits dropped afterwards (and recall lost when
+fewer than k eligible hits are left).
+"""
+import argparse, os, tempfile, time
+
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+import numpy as np
+from src.chahtbot.retrieval.filters import ChunkFilter
+from src.chahtbot.retrieval.store import VectorStore
+
+
+def timed(fn, queries) -> tuple[float, list]:
+    started = time.perf_counter()
+    results = [fn(query) for query in queries]
+    return (time.perf_counter() - started) / len(queries) * 1e3, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--shares", default="0.001,0.01,0.1,0.3,0.5,0.9")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    vectors = rng.standard_normal((args.chunks, args.dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # files are ingested one after another, so each owns a contiguous run of rows
+    owners = [f"file{i}" for i in np.sort(rng.integers(0, args.files, args.chunks))]
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as root:
+        store = VectorStore(root, args.dim)
+        store.add("bench", vectors, ["chunk"] * args.chunks, ["bench"] * args.chunks, owners)
+        index = store.get("bench")
+        unfiltered, _ = timed(lambda q: index.search(q, args.k), queries)
+        print(f"{args.chunks} x {args.dim} float32, {args.files} files, k={args.k}: unfiltered {unfiltered:.2f} ms/query")
+        print(f"{'share':>6} {'filtered ms':>12} {'vs unfiltered':>14} {'post-filter ms':>15} {'post-filter recall':>19}")
+
+        names, sizes = np.unique(owners, return_counts=True)
+        counts = dict(zip(names, sizes))
+        for share in (float(s) for s in args.shares.split(",")):
+            picked, covered = set(), 0
+            for name in rng.permutation(names):
+                if covered >= share * args.chunks:
+                    break
+                picked.add(str(name))
+                covered += counts[name]
+            chunk_filter = ChunkFilter(files=frozenset(picked))
+            eligible, excluded = index.select(chunk_filter)
+
+            filtered, exact = timed(lambda q: index.search(q, args.k, chunk_filter=chunk_filter), queries)
+
+            def post_filter(q):
+                return [(i, s) for i, s in index.search(q, args.k * 10) if not excluded[i]][:args.k]
+            post, approximate = timed(post_filter, queries)
+            recall = np.mean([len({i for i, _ in a} & {i for i, _ in e}) / max(len(e), 1) for a, e in zip(approximate, exact)])
+            print(f"{len(eligible) / args.chunks:>6.3f} {filtered:>12.2f} {filtered / unfiltered:>13.2f}x {post:>15.2f} {recall:>19.2f}")
+
+
+if __name__ == "__main__":
+    main()
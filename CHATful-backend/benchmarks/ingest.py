@@ -0,0 +1,52 @@
+"""
+Staged ingestion of a crawl: time per page as the bot's index grows, one page per `VectorStore.add`.
+
+    python -m benchmarks.ingest [--pages 400] [--chunks-per-page 20] [--quantization pq]
+
+Each page only tokenizes, quantizes and assigns its own chunks; the columns show the per-page cost
+staying flat between refits instead of growing with the index.
+"""
+import argparse, os, random, tempfile, time
+
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+import numpy as np
+from src.chahtbot.retrieval.embedder import HashingEmbedder
+from src.chahtbot.retrieval.store import VectorStore
+
+
+WORDS = [f"term{i}" for i in range(20000)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--chunks-per-page", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--quantization", default="pq", choices=("none", "int8", "pq"))
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    embedder = HashingEmbedder(args.dim)
+    with tempfile.TemporaryDirectory() as root:
+        store = VectorStore(root, args.dim, quantization=args.quantization)
+        store.expect("bench", replace=True)
+        print(f"{args.pages} pages x {args.chunks_per_page} chunks, quantization={args.quantization}")
+        print(f"{'pages':>6} {'chunks':>7} {'ms/page':>8}")
+        started = window = time.perf_counter()
+        for page in range(1, args.pages + 1):
+            texts = [" ".join(rng.choices(WORDS, k=60)) for _ in range(args.chunks_per_page)]
+            store.add("bench", embedder.embed(texts).astype(np.float32), texts, [f"page{page}"] * len(texts),
+                      [f"page{page}"] * len(texts), staged=True)
+            if page % (args.pages // 10 or 1) == 0:
+                now = time.perf_counter()
+                print(f"{page:>6} {page * args.chunks_per_page:>7} {(now - window) * 1e3 / (args.pages // 10 or 1):>8.1f}")
+                window = now
+        store.finish_staged("bench")
+        store.publish("bench")
+        print(f"total {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
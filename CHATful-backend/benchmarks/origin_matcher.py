@@ -0,0 +1,64 @@
+"""
+Origin check microbenchmark: raw allowed_hosts list vs compiled OriginMatcher.
+
+    python -m benchmarks.origin_matcher [--hosts 500] [--number 200000]
+"""
+import argparse, itertools, random, timeit
+from src.chahtbot.origins import OriginMatcher, normalize_origin
+
+
+def build_hosts(count: int) -> list[str]:
+    hosts = [f"https://shop{i}.example{i % 37}.com" for i in range(count - count // 10)]
+    hosts += [f"https://*.tenant{i}.example.net" for i in range(count // 10)]
+    return hosts
+
+
+def build_origins(hosts: list[str], count: int) -> list[str]:
+    rng = random.Random(7)
+    origins = []
+    for _ in range(count):
+        host = rng.choice(hosts)
+        roll = rng.random()
+        if "*." in host:
+            origins.append(host.replace("*", f"app{rng.randrange(5)}"))
+        elif roll < 0.5:
+            origins.append(host)
+        else:
+            origins.append(f"https://unknown{rng.randrange(10_000)}.example.org")
+    return origins
+
+
+def linear_check(origin: str, hosts: list[str]) -> bool:
+    return "*" in hosts or origin in hosts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", type=int, default=500)
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+
+    hosts = build_hosts(args.hosts)
+    origins = build_origins(hosts, 1024)
+    matcher = OriginMatcher(hosts)
+
+    def run(check):
+        stream = itertools.cycle(origins)
+        return timeit.timeit(lambda: check(next(stream)), number=args.number)
+
+    compile_time = timeit.timeit(lambda: OriginMatcher(hosts), number=100) / 100
+    overhead = run(lambda origin: None)
+    linear = run(lambda origin: linear_check(origin, hosts))
+    compiled = run(matcher.matches)
+    referer = run(lambda origin: matcher.matches(normalize_origin(origin + "/some/page?q=1")))
+
+    print(f"allowed hosts:           {len(hosts)} ({args.hosts // 10} wildcard)")
+    print(f"harness overhead:        {overhead / args.number * 1e9:8.1f} ns/op (included below)")
+    print(f"compile matcher:         {compile_time * 1e6:8.1f} us")
+    print(f"linear list check:       {linear / args.number * 1e9:8.1f} ns/op (no wildcard support)")
+    print(f"compiled matcher:        {compiled / args.number * 1e9:8.1f} ns/op")
+    print(f"referer normalize+match: {referer / args.number * 1e9:8.1f} ns/op")
+
+
+if __name__ == "__main__":
+    main()
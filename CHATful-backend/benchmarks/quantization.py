@@ -0,0 +1,58 @@
+"""
+Embedding quantization benchmark: recall@10 against exact float32 search, memory per chunk and query latency.
+
+    python -m benchmarks.quantization [--chunks 50000] [--queries 200] [--dim 384]
+"""
+import argparse, time
+import numpy as np
+from benchmarks.bm25 import build_chunks
+from src.chahtbot.retrieval.embedder import HashingEmbedder
+from src.chahtbot.retrieval.quantization import ProductQuantizer, ScalarQuantizer
+from src.chahtbot.retrieval.store import BotIndex
+
+
+def recall_at(index: BotIndex, queries: np.ndarray, truth: list[set], k: int, rerank: int) -> tuple[float, float]:
+    found, started = 0, time.perf_counter()
+    for query, expected in zip(queries, truth):
+        found += len(expected & {chunk_id for chunk_id, _ in index.search(query, k, rerank)})
+    return found / (k * len(queries)), (time.perf_counter() - started) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    embedder = HashingEmbedder(args.dim)
+    chunks = build_chunks(rng, args.chunks, 40)
+    vectors = np.vstack([embedder.embed(chunks[i:i + 2048]) for i in range(0, len(chunks), 2048)])
+    queries = embedder.embed(build_chunks(rng, args.queries, 8))
+
+    index = BotIndex(args.dim)
+    index.add(vectors, chunks, ["bench"] * len(chunks))
+    truth = [{chunk_id for chunk_id, _ in index.search(query, 10)} for query in queries]
+
+    print(f"{'encoding':<16} {'rerank':>6} {'B/chunk':>8} {'MiB':>7} {'recall@10':>9} {'query ms':>8} {'fit s':>6}")
+    for name, fit in [
+        ("float32", None),
+        ("int8", lambda: ScalarQuantizer.fit(vectors)),
+        ("pq m=24", lambda: ProductQuantizer.fit(vectors, 24)),
+        ("pq m=48", lambda: ProductQuantizer.fit(vectors, 48)),
+        ("pq m=96", lambda: ProductQuantizer.fit(vectors, 96)),
+    ]:
+        started = time.perf_counter()
+        index.quantizer = fit() if fit else None
+        fit_time = time.perf_counter() - started
+        nbytes = index.quantizer.nbytes if index.quantizer else vectors.nbytes
+
+        for rerank in ((1, 5, 10, 20) if name.startswith("pq") else (1,)):
+            recall, latency = recall_at(index, queries, truth, 10, rerank)
+            print(f"{name:<16} {rerank if name.startswith('pq') else '-':>6} {nbytes / len(vectors):>8.1f} "
+                  f"{nbytes / 2**20:>7.1f} {recall:>9.3f} {latency * 1e3:>8.2f} {fit_time:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
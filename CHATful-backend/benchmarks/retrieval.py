@@ -0,0 +1,68 @@
+"""
+Local retrieval microbenchmark: query latency over one bot's index on a single thread,
+and the first query against a bot whose index is not mapped yet (files in the page cache).
+
+    python -m benchmarks.retrieval [--chunks 50000] [--queries 500] [--dim 384]
+"""
+import argparse, os, random, tempfile, time
+
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+import numpy as np
+from src.chahtbot.retrieval.embedder import HashingEmbedder
+from src.chahtbot.retrieval.engine import RetrievalEngine
+from src.chahtbot.retrieval.store import VectorStore
+
+
+WORDS = [f"term{i}" for i in range(5000)]
+
+
+def build_chunks(count: int, rng: random.Random) -> list[str]:
+    return [" ".join(rng.choices(WORDS, k=rng.randint(40, 120))) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    embedder = HashingEmbedder(args.dim)
+    chunks = build_chunks(args.chunks, rng)
+    queries = [" ".join(rng.choices(WORDS, k=rng.randint(3, 12))) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as root:
+        engine = RetrievalEngine(embedder, VectorStore(root, args.dim))
+
+        started = time.perf_counter()
+        vectors = np.vstack([embedder.embed(chunks[i:i + 1024]) for i in range(0, len(chunks), 1024)])
+        embed_time = time.perf_counter() - started
+        engine.store.add("bench", vectors, chunks, ["bench"] * len(chunks))
+        engine.search("bench", queries[0], 6)
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            engine.search("bench", query, 6)
+            latencies.append(time.perf_counter() - started)
+
+        cold = []
+        for query in queries[:20]:
+            fresh = RetrievalEngine(embedder, VectorStore(root, args.dim))
+            started = time.perf_counter()
+            fresh.search("bench", query, 6)
+            cold.append(time.perf_counter() - started)
+
+    latencies.sort()
+    print(f"chunks:       {args.chunks} x {args.dim} float32 ({vectors.nbytes / 2**20:.1f} MiB)")
+    print(f"embed:        {embed_time / args.chunks * 1e6:8.1f} us/chunk")
+    print(f"query p50:    {latencies[len(latencies) // 2] * 1e3:8.2f} ms")
+    print(f"query p99:    {latencies[int(len(latencies) * 0.99)] * 1e3:8.2f} ms")
+    print(f"cold query:   {sorted(cold)[len(cold) // 2] * 1e3:8.2f} ms (map + first query, median)")
+
+
+if __name__ == "__main__":
+    main()
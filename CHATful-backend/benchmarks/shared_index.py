@@ -0,0 +1,94 @@
+"""
+Memory of one bot index served by N worker processes: each worker maps the published version and queries it.
+
+    python -m benchmarks.shared_index [--chunks 50000] [--workers 1,2,4,8] [--copy]
+
+Per-worker private memory stays at the few arrays a reader computes itself while the mapped files are
+counted once per node (PSS splits shared pages between the processes that touch them). `--copy` loads
+the arrays into each worker's heap instead, which is what N copies of the index would cost.
+"""
+import argparse, multiprocessing, os, random, tempfile, time
+
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+import numpy as np
+from src.chahtbot.retrieval.embedder import HashingEmbedder
+from src.chahtbot.retrieval.store import VectorStore
+
+
+WORDS = [f"term{i}" for i in range(20000)]
+
+
+def memory() -> dict[str, int]:
+    """Rss, Pss and private bytes of this process."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as rollup:
+        for line in rollup:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {"rss": fields["Rss"], "pss": fields["Pss"], "private": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def worker(root: str, dim: int, copy: bool, queries: list[str], results, ready, done) -> None:
+    embedder = HashingEmbedder(dim)
+    query_vectors = embedder.embed(queries)
+    before = memory()
+    index = VectorStore(root, dim).get("bench")
+    if copy:
+        index._vectors = np.array(index._vectors)
+        index.keywords.gaps, index.keywords.tfs = np.array(index.keywords.gaps), np.array(index.keywords.tfs)
+    for query, vector in zip(queries, query_vectors):
+        index.search(vector, 6)
+        index.keywords.search(query, 6)
+    # measure once every worker holds the index, so shared pages are split between all of them
+    ready.wait()
+    after = memory()
+    results.put({key: after[key] - before[key] for key in after})
+    done.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--copy", action="store_true", help="give every worker a private copy of the arrays")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    texts = [" ".join(rng.choices(WORDS, k=60)) for _ in range(args.chunks)]
+    vectors = np.random.default_rng(7).standard_normal((args.chunks, args.dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = [" ".join(rng.choices(WORDS, k=6)) for _ in range(20)]
+    spawn = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as root:
+        started = time.perf_counter()
+        store = VectorStore(root, args.dim)
+        store.add("bench", vectors, texts, ["bench"] * args.chunks)
+        print(f"{args.chunks} chunks x {args.dim} dims, index {store.get('bench').nbytes / 2**20:.0f} MB "
+              f"(built in {time.perf_counter() - started:.1f} s), {'private copies' if args.copy else 'shared maps'}")
+        print(f"{'workers':>7} {'private MB/worker':>18} {'rss MB/worker':>14} {'node pss MB':>12}")
+
+        for count in (int(n) for n in args.workers.split(",")):
+            results, ready, done = spawn.Queue(), spawn.Barrier(count), spawn.Event()
+            processes = [
+                spawn.Process(target=worker, args=(root, args.dim, args.copy, queries, results, ready, done))
+                for _ in range(count)
+            ]
+            for process in processes:
+                process.start()
+            measured = [results.get() for _ in processes]
+            done.set()
+            for process in processes:
+                process.join()
+            private = sum(m["private"] for m in measured) / count / 2**20
+            rss = sum(m["rss"] for m in measured) / count / 2**20
+            pss = sum(m["pss"] for m in measured) / 2**20
+            print(f"{count:>7} {private:>18.1f} {rss:>14.1f} {pss:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ from fastapi import HTTPException, status
 from src.hashing import hash_password
 from src.auth.models import LoginCode
 from src.config import settings
+from src.http_clients import http_clients
 
 
 
@@ -39,17 +40,17 @@ def get_google_login_url():
 async def google_tokens(code: str):
     for _ in range(0,3):
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                data = {
-                    "code": code,
-                    "client_id": settings.google_client_id,
-                    "client_secret": settings.google_client_secret,
-                    "redirect_uri": settings.google_redirect_uri,
-                    "grant_type": "authorization_code",
-                }
-                response = await client.post(settings.google_token_url, data=data)
-                response.raise_for_status()
-                return response.json()
+            client = http_clients.get("google")
+            data = {
+                "code": code,
+                "client_id": settings.google_client_id,
+                "client_secret": settings.google_client_secret,
+                "redirect_uri": settings.google_redirect_uri,
+                "grant_type": "authorization_code",
+            }
+            response = await client.post(settings.google_token_url, data=data)
+            response.raise_for_status()
+            return response.json()
         except httpx.RequestError as e:
             continue
             
@@ -72,13 +73,13 @@ async def google_tokens(code: str):
         
 
 async def get_user_info(token: dict):
-    async with httpx.AsyncClient() as client:
-        headers = {"Authorization": f"Bearer {token['access_token']}"} 
-        response = await client.get(settings.google_userinfo_url, headers=headers)
-        response.raise_for_status()
-        email = response.json().get("email")
-        username = response.json().get("name").replace(" ", "_")+str(random.randint(1000, 9999))
-        return email , username
+    client = http_clients.get("google")
+    headers = {"Authorization": f"Bearer {token['access_token']}"} 
+    response = await client.get(settings.google_userinfo_url, headers=headers)
+    response.raise_for_status()
+    email = response.json().get("email")
+    username = response.json().get("name").replace(" ", "_")+str(random.randint(1000, 9999))
+    return email , username
     
 
 def get_github_login_url():
@@ -98,24 +99,24 @@ async def github_tokens(code: str):
             
         for _ in range(0,3):
             try:
-                async with httpx.AsyncClient(timeout=10) as client:
-                    token_res = await client.post(
-                        settings.github_token_url,
-                        data={
-                            "client_id": settings.github_client_id,
-                            "client_secret": settings.github_client_secret,
-                            "code": code,
-                            "redirect_uri": settings.github_redirect_uri,
-                        },
-                        headers={"Accept": "application/json"},
-                    )
-                    token_res.raise_for_status()
-
-                    token_data = token_res.json()
-                    access_token = token_data.get("access_token")
-                    if not access_token:
-                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="GitHub token exchange failed")
-                    return access_token
+                client = http_clients.get("github")
+                token_res = await client.post(
+                    settings.github_token_url,
+                    data={
+                        "client_id": settings.github_client_id,
+                        "client_secret": settings.github_client_secret,
+                        "code": code,
+                        "redirect_uri": settings.github_redirect_uri,
+                    },
+                    headers={"Accept": "application/json"},
+                )
+                token_res.raise_for_status()
+
+                token_data = token_res.json()
+                access_token = token_data.get("access_token")
+                if not access_token:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="GitHub token exchange failed")
+                return access_token
             except httpx.RequestError as e:
                 continue
             
@@ -138,15 +139,15 @@ async def github_tokens(code: str):
 
 
 async def get_github_user_info(token: str):
-    async with httpx.AsyncClient() as client:
-        headers = {"Authorization": f"Bearer {token}"}
-        response = await client.get(settings.github_user_api, headers=headers)
-        response.raise_for_status()
-        email_res = await client.get(settings.github_emails, headers=headers)
-        email_res.raise_for_status()
-        emails = email_res.json()
-        primary_email = next((e["email"] for e in emails if e["primary"]), None)
-        email = primary_email
-        username = response.json().get("login")
-
-        return email, username
+    client = http_clients.get("github")
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.get(settings.github_user_api, headers=headers)
+    response.raise_for_status()
+    email_res = await client.get(settings.github_emails, headers=headers)
+    email_res.raise_for_status()
+    emails = email_res.json()
+    primary_email = next((e["email"] for e in emails if e["primary"]), None)
+    email = primary_email
+    username = response.json().get("login")
+
+    return email, username
@@ -5,6 +5,8 @@ from src.billing.service import PlanService, SubscriptionService, PaymentService
 from src.billing import schemas
 from src.billing.dependencies import plan_dependency, subscription_dependency, payment_dependency
 from src.auth.dependencies import repo_dependency
+from src.chahtbot.dependencies import chatbot_dependency
+from src.dependencies import redis_dependency
 from src.auth_bearer import  user_dependency, admin_user_dependency
 
 
@@ -77,8 +79,9 @@ async def upgrade_subscription(data: schemas.SubscribeRequest, user: user_depend
 @router.post("/stripe/webhook")
 @limiter.exempt
 async def stripe_webhook(request: Request, sub_dep: subscription_dependency, plan_dep: plan_dependency,
-        payment_dep: payment_dependency, stripe_signature: str = Header(..., alias="Stripe-Signature")):
-    await SubscriptionService.stripe_webhook(request, stripe_signature, sub_dep, plan_dep, payment_dep)
+        payment_dep: payment_dependency, chat_repo: chatbot_dependency, redis: redis_dependency,
+        stripe_signature: str = Header(..., alias="Stripe-Signature")):
+    await SubscriptionService.stripe_webhook(request, stripe_signature, sub_dep, plan_dep, payment_dep, chat_repo, redis)
     return True
 
 
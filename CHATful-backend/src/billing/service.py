@@ -16,6 +16,8 @@ from src.billing.utils import serialize_subscription
 from src.billing.stripe_gateway import StripeGateway
 from src.auth.models import User
 from src.auth.repository import UserRepository
+from src.chahtbot.repository import ChatbotRepository
+from src.chahtbot.settings_cache import chatbot_settings_cache
 from src.logging import get_logger
 
 
@@ -234,7 +236,7 @@ class SubscriptionService:
 
     @staticmethod
     async def stripe_webhook(request, stripe_signature, sub_repo: SubscriptionRepoistory,
-        plan_repo: PlanRepository, payment_repo: PaymentRepository):
+        plan_repo: PlanRepository, payment_repo: PaymentRepository, bot_repo: ChatbotRepository, redis):
         payload = await request.body()
         try:
             event = await run_in_threadpool(
@@ -250,6 +252,7 @@ class SubscriptionService:
         event_type = event["type"]
         data_object = event["data"]["object"]
         logger.info(f"Processing Stripe webhook event_type={event_type}")
+        sub = None
 
         if event_type == "checkout.session.completed":
             session = data_object
@@ -318,6 +321,18 @@ class SubscriptionService:
                 )
                 send_payment_failed_email_task.delay(serialize_subscription(sub))
 
+        if sub:
+            await SubscriptionService.invalidate_bot_settings(sub.user_id, bot_repo, redis)
+
+
+    @staticmethod
+    async def invalidate_bot_settings(user_id: UUID, bot_repo: ChatbotRepository, redis):
+        # the owner's plan tier is cached with each bot's chat settings
+        bots = await bot_repo.my_bots(user_id)
+        for bot in bots:
+            await chatbot_settings_cache.invalidate(bot.id, redis)
+        logger.info(f"Invalidated chatbot settings after subscription change user_id={str(user_id)}, bots={len(bots)}")
+
 
 
 class PaymentService:
@@ -7,7 +7,7 @@ celery_app = Celery(
     "worker",
     broker=settings.celery_worker_url,
     backend=None,
-    include=["src.tasks", "src.billing.tasks"]
+    include=["src.tasks", "src.billing.tasks", "src.chahtbot.tasks"]
 )
 
 
@@ -0,0 +1,269 @@
+import hashlib, json, re, time
+from uuid import UUID
+from src.config import settings
+
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+class AnswerCache:
+    """
+    Per-bot cache of upstream answers, keyed by a normalized form of the question.
+
+    Each bot has a generation counter; entries written under an older generation
+    are ignored, so bumping it (on re-ingestion) invalidates everything at once,
+    including answers still in flight when the bump happened.
+    """
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        return " ".join(_NON_WORD.sub(" ", message.casefold()).split())
+
+
+    @staticmethod
+    def digest(normalized: str) -> str:
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+    @staticmethod
+    def simhash(normalized: str) -> int:
+        words = normalized.split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        weights = [0] * 64
+        for feature in features:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+            for bit in range(64):
+                weights[bit] += 1 if (h >> bit) & 1 else -1
+
+        return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+    @staticmethod
+    def bands(sketch: int) -> list[str]:
+        """
+        The sketch cut into `answer_cache_simhash_distance + 1` bands. Sketches
+        within that Hamming distance agree on at least one whole band, so a
+        lookup only compares against the sketches sharing one of its bands.
+        """
+        count = settings.answer_cache_simhash_distance + 1
+        bounds = [64 * i // count for i in range(count + 1)]
+        return [f"{i}:{(sketch >> low) & ((1 << (high - low)) - 1):x}" for i, (low, high) in enumerate(zip(bounds, bounds[1:]))]
+
+
+    @staticmethod
+    def _keys(bot_id: UUID) -> dict[str, str]:
+        base = f"chatbot:answers:{bot_id}"
+        return {
+            "gen": f"{base}:gen",
+            "entries": f"{base}:entries",
+            "sketches": f"{base}:sketches",
+            "bands": f"{base}:bands",
+            "stats": f"{base}:stats",
+            "stale": f"{base}:stale",
+            "stale_order": f"{base}:stale_order",
+        }
+
+
+    @staticmethod
+    def _band_keys(keys: dict[str, str], generation: int, sketch: int) -> list[str]:
+        # per generation, so invalidation orphans the old buckets and they expire with the entries
+        return [f"{keys['bands']}:{generation}:{band}" for band in AnswerCache.bands(sketch)]
+
+
+    @staticmethod
+    def _is_fresh(raw: str | None, generation: int) -> str | None:
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        if entry["gen"] != generation or entry["ts"] + settings.answer_cache_ttl < time.time():
+            return None
+        return entry["answer"]
+
+
+    @staticmethod
+    async def get(redis, bot_id: UUID, message: str) -> tuple[str | None, int]:
+        """Returns the cached answer (or None) and the generation it was looked up under."""
+        if not settings.answer_cache_enabled:
+            return None, 0
+
+        keys = AnswerCache._keys(bot_id)
+        normalized = AnswerCache.normalize(message)
+        digest = AnswerCache.digest(normalized)
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.get(keys["gen"])
+        pipe.hget(keys["entries"], digest)
+        generation, raw = await pipe.execute()
+        generation = int(generation or 0)
+
+        answer = AnswerCache._is_fresh(raw, generation)
+        if answer is not None:
+            await redis.hincrby(keys["stats"], "hits", 1)
+            return answer, generation
+
+        if raw:
+            await AnswerCache._evict(redis, keys, [digest])
+
+        if settings.answer_cache_near_duplicates and normalized:
+            answer = await AnswerCache._get_near_duplicate(redis, keys, normalized, generation)
+            if answer is not None:
+                await redis.hincrby(keys["stats"], "near_hits", 1)
+                return answer, generation
+
+        await redis.hincrby(keys["stats"], "misses", 1)
+        return None, generation
+
+
+    @staticmethod
+    async def _get_near_duplicate(redis, keys: dict[str, str], normalized: str, generation: int) -> str | None:
+        sketch = AnswerCache.simhash(normalized)
+        best_digest, best_distance = None, settings.answer_cache_simhash_distance + 1
+
+        pipe = redis.pipeline(transaction=False)
+        for band_key in AnswerCache._band_keys(keys, generation, sketch):
+            pipe.smembers(band_key)
+        candidates = set().union(*await pipe.execute())
+
+        for member in candidates:
+            value, digest = member.split(":", 1)
+            distance = (int(value, 16) ^ sketch).bit_count()
+            if distance < best_distance:
+                best_digest, best_distance = digest, distance
+
+        if best_digest is None:
+            return None
+
+        return AnswerCache._is_fresh(await redis.hget(keys["entries"], best_digest), generation)
+
+
+    @staticmethod
+    async def set(redis, bot_id: UUID, message: str, answer: str, generation: int):
+        if not settings.answer_cache_enabled:
+            return
+
+        keys = AnswerCache._keys(bot_id)
+        normalized = AnswerCache.normalize(message)
+        digest = AnswerCache.digest(normalized)
+        now = time.time()
+
+        value = json.dumps({"answer": answer, "ts": now, "gen": generation})
+        stale = json.dumps({"answer": answer, "ts": now})
+        pipe = redis.pipeline(transaction=False)
+        pipe.hstrlen(keys["entries"], digest)
+        pipe.hstrlen(keys["stale"], digest)
+        old_size, old_stale_size = await pipe.execute()
+
+        pipe = redis.pipeline(transaction=False)
+        # fallback copy that survives expiry and re-ingestion, served only while n8n is unavailable
+        pipe.hset(keys["stale"], digest, stale)
+        pipe.zadd(keys["stale_order"], {digest: now})
+        pipe.expire(keys["stale"], settings.answer_cache_stale_ttl)
+        pipe.expire(keys["stale_order"], settings.answer_cache_stale_ttl)
+        pipe.hincrby(keys["stats"], "stale_bytes", len(stale.encode("utf-8")) - old_stale_size)
+        sketch = AnswerCache.simhash(normalized)
+        member = f"{sketch:016x}:{digest}"
+        pipe.hset(keys["entries"], digest, value)
+        pipe.zadd(keys["sketches"], {member: now})
+        pipe.expire(keys["entries"], settings.answer_cache_ttl * 2)
+        pipe.expire(keys["sketches"], settings.answer_cache_ttl * 2)
+        for band_key in AnswerCache._band_keys(keys, generation, sketch):
+            pipe.sadd(band_key, member)
+            pipe.expire(band_key, settings.answer_cache_ttl * 2)
+        pipe.hincrby(keys["stats"], "bytes", len(value.encode("utf-8")) - old_size)
+        pipe.zcard(keys["stale_order"])
+        pipe.zcard(keys["sketches"])
+        *_, stale_size, size = await pipe.execute()
+
+        overflow = size - settings.answer_cache_max_entries
+        if overflow > 0:
+            oldest = await redis.zpopmin(keys["sketches"], overflow)
+            pipe = redis.pipeline(transaction=False)
+            for member, _ in oldest:
+                for band_key in AnswerCache._band_keys(keys, generation, int(member.split(":", 1)[0], 16)):
+                    pipe.srem(band_key, member)
+            await pipe.execute()
+            await AnswerCache._evict(redis, keys, [member.split(":", 1)[1] for member, _ in oldest])
+
+        # stale copies outlive their entries, so they are capped on their own
+        overflow = stale_size - settings.answer_cache_max_entries
+        if overflow > 0:
+            oldest = await redis.zpopmin(keys["stale_order"], overflow)
+            await AnswerCache._evict_stale(redis, keys, [digest for digest, _ in oldest])
+
+
+    @staticmethod
+    async def get_stale(redis, bot_id: UUID, message: str) -> str | None:
+        if not settings.answer_cache_enabled:
+            return None
+        keys = AnswerCache._keys(bot_id)
+        raw = await redis.hget(keys["stale"], AnswerCache.digest(AnswerCache.normalize(message)))
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        if entry["ts"] + settings.answer_cache_stale_ttl < time.time():
+            return None
+        await redis.hincrby(keys["stats"], "stale_hits", 1)
+        return entry["answer"]
+
+
+    @staticmethod
+    async def _evict_stale(redis, keys: dict[str, str], digests: list[str]):
+        pipe = redis.pipeline(transaction=False)
+        for digest in digests:
+            pipe.hstrlen(keys["stale"], digest)
+        sizes = await pipe.execute()
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.hdel(keys["stale"], *digests)
+        pipe.hincrby(keys["stats"], "stale_bytes", -sum(sizes))
+        await pipe.execute()
+
+
+    @staticmethod
+    async def _evict(redis, keys: dict[str, str], digests: list[str]):
+        pipe = redis.pipeline(transaction=False)
+        for digest in digests:
+            pipe.hstrlen(keys["entries"], digest)
+        sizes = await pipe.execute()
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.hdel(keys["entries"], *digests)
+        pipe.hincrby(keys["stats"], "bytes", -sum(sizes))
+        pipe.hincrby(keys["stats"], "evictions", sum(1 for size in sizes if size))
+        await pipe.execute()
+
+
+    @staticmethod
+    async def invalidate(redis, bot_id: UUID):
+        keys = AnswerCache._keys(bot_id)
+        pipe = redis.pipeline(transaction=True)
+        pipe.incr(keys["gen"])
+        pipe.hlen(keys["entries"])
+        pipe.delete(keys["entries"], keys["sketches"])
+        pipe.hset(keys["stats"], "bytes", 0)
+        _, dropped, *_ = await pipe.execute()
+
+        if dropped:
+            await redis.hincrby(keys["stats"], "evictions", dropped)
+
+
+    @staticmethod
+    async def stats(redis, bot_id: UUID) -> dict:
+        keys = AnswerCache._keys(bot_id)
+        pipe = redis.pipeline(transaction=False)
+        pipe.hgetall(keys["stats"])
+        pipe.hlen(keys["entries"])
+        pipe.hlen(keys["stale"])
+        raw, entries, stale_entries = await pipe.execute()
+
+        counts = {
+            name: int(raw.get(name, 0))
+            for name in ("hits", "near_hits", "misses", "bytes", "evictions", "stale_hits", "stale_bytes")
+        }
+        lookups = counts["hits"] + counts["near_hits"] + counts["misses"]
+        return {
+            **counts,
+            "entries": entries,
+            "stale_entries": stale_entries,
+            "hit_rate": (counts["hits"] + counts["near_hits"]) / lookups if lookups else 0.0,
+        }
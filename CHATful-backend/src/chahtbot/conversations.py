@@ -0,0 +1,104 @@
+import math
+from uuid import UUID
+from src.config import settings
+
+
+class ConversationStore:
+    """
+    Per-visitor chat history on a capped Redis Stream, one stream per (bot, visitor).
+
+    Appends are XADD with approximate MAXLEN trimming and reads are a bounded
+    XREVRANGE, so both stay constant-time regardless of how long the visitor
+    has been chatting. The key expires after `conversation_idle_ttl` seconds
+    without activity.
+    """
+
+    @staticmethod
+    def _key(bot_id: UUID, visitor_id: UUID) -> str:
+        return f"chatbot:conversation:{bot_id}:{visitor_id}"
+
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        # ~4 characters per token is close enough for budgeting English prompts
+        return max(1, math.ceil(len(text) / 4))
+
+
+    @staticmethod
+    async def append(redis, bot_id: UUID, visitor_id: UUID, *turns: tuple[str, str]):
+        """Appends (role, content) turns in order, e.g. the question and its answer."""
+        if not settings.conversation_enabled or not turns:
+            return
+
+        key = ConversationStore._key(bot_id, visitor_id)
+        pipe = redis.pipeline(transaction=False)
+        for role, content in turns:
+            pipe.xadd(
+                key,
+                {"role": role, "content": content, "tokens": ConversationStore.estimate_tokens(content)},
+                maxlen=settings.conversation_max_messages,
+                approximate=True,
+            )
+        pipe.expire(key, settings.conversation_idle_ttl)
+        await pipe.execute()
+
+
+    @staticmethod
+    async def exists(redis, bot_id: UUID, visitor_id: UUID) -> bool:
+        """Whether the visitor has talked to the bot before, i.e. the next question is a follow-up."""
+        if not settings.conversation_enabled:
+            return False
+        return bool(await redis.exists(ConversationStore._key(bot_id, visitor_id)))
+
+
+    @staticmethod
+    async def history(redis, bot_id: UUID, visitor_id: UUID, token_budget: int | None = None) -> list[dict]:
+        """
+        Most recent turns, oldest first, that fit in `token_budget`. The latest
+        exchange is always included; when it alone is over budget its longest
+        turns are cut so that they share it.
+        """
+        if not settings.conversation_enabled:
+            return []
+
+        budget = settings.conversation_history_tokens if token_budget is None else token_budget
+        key = ConversationStore._key(bot_id, visitor_id)
+        entries = await redis.xrevrange(key, count=settings.conversation_history_max_messages)
+
+        def tokens(fields) -> int:
+            return int(fields.get("tokens") or ConversationStore.estimate_tokens(fields["content"]))
+
+        # the latest exchange: the newest turns up to and including the visitor's last question
+        split = next((i + 1 for i, (_, fields) in enumerate(entries) if fields["role"] == "user"), len(entries))
+        latest = [(fields, tokens(fields)) for _, fields in entries[:split]]
+        turns = ConversationStore._fit(latest, budget)
+        budget -= sum(size for _, size in latest)
+
+        for _, fields in entries[split:]:
+            budget -= tokens(fields)
+            if budget < 0:
+                break
+            turns.append({"role": fields["role"], "content": fields["content"]})
+
+        turns.reverse()
+        return turns
+
+
+    @staticmethod
+    def _fit(turns: list[tuple[dict, int]], budget: int) -> list[dict]:
+        # over budget, every turn gets an equal share and what shorter turns leave goes to the longer ones
+        shares = [size for _, size in turns]
+        if sum(shares) > budget:
+            left = max(budget, len(turns))
+            for n, i in enumerate(sorted(range(len(turns)), key=shares.__getitem__)):
+                shares[i] = min(shares[i], left // (len(turns) - n))
+                left -= shares[i]
+        return [
+            {"role": fields["role"], "content": fields["content"] if share >= size else fields["content"][:share * 4]}
+            for (fields, size), share in zip(turns, shares)
+        ]
+
+
+    @staticmethod
+    async def clear(redis, bot_id: UUID, visitor_id: UUID):
+        await redis.delete(ConversationStore._key(bot_id, visitor_id))
@@ -2,7 +2,7 @@ from uuid import uuid4, UUID as PyUUID
 from datetime import datetime, timezone
 from enum import Enum
 from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy import String, ForeignKey, DateTime, Enum as SAEnum, Text, Boolean
+from sqlalchemy import String, ForeignKey, DateTime, Enum as SAEnum, Text, Boolean, Integer, Index
 from sqlalchemy.orm import mapped_column, Mapped, relationship
 from src.database import Base
 
@@ -29,6 +29,8 @@ class Chatbot(Base):
     status: Mapped[BotStatus] = mapped_column(SAEnum(BotStatus), default=BotStatus.PENDING)
 
     allowed_hosts: Mapped[list[str]] = mapped_column(JSONB, nullable=False, default=lambda: ["*"], server_default='["*"]')
+    retrieval_weights: Mapped[dict[str, float] | None] = mapped_column(JSONB, nullable=True)
+    retrieval_filter: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), 
                                     default=lambda: datetime.now(timezone.utc))
@@ -79,7 +81,24 @@ class BotWidgetSettings(Base):
                                     default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True),
                 default=lambda: datetime.now(timezone.utc),onupdate=lambda: datetime.now(timezone.utc))
-    
 
 
 
+class ChatTranscript(Base):
+    __tablename__ = "chat_transcripts"
+    __table_args__ = (
+        Index("ix_chat_transcripts_bot_id_created_at", "bot_id", "created_at"),
+    )
+
+    id: Mapped[PyUUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    bot_id: Mapped[PyUUID] = mapped_column(UUID(as_uuid=True), ForeignKey("chatbots.id", ondelete="CASCADE"), nullable=False)
+    visitor_id: Mapped[PyUUID] = mapped_column(UUID(as_uuid=True), nullable=False, index=True)
+
+    question: Mapped[str] = mapped_column(Text, nullable=False)
+    answer: Mapped[str | None] = mapped_column(Text, nullable=True)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    streamed: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    latency_ms: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True),
+                                    default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,95 @@
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_WILDCARD = "*"
+
+
+@lru_cache(maxsize=4096)
+def normalize_origin(value: str | None) -> str | None:
+    """Reduces an Origin header, Referer URL or allowed_hosts entry to scheme://host[:port]."""
+    if not value:
+        return None
+
+    try:
+        parts = urlsplit(value.strip())
+        port = parts.port
+    except ValueError:
+        return None
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if scheme not in _DEFAULT_PORTS or not host:
+        return None
+
+    if ":" in host:
+        host = f"[{host}]"
+    if port is None or port == _DEFAULT_PORTS[scheme]:
+        return f"{scheme}://{host}"
+    return f"{scheme}://{host}:{port}"
+
+
+class OriginMatcher:
+    """
+    Compiled form of a bot's allowed_hosts.
+
+    Exact origins live in a set. Wildcard entries (https://*.example.com) go in
+    a trie keyed by scheme/port and then by host labels in reverse order, so a
+    lookup costs one set probe plus one step per label of the request host. A
+    wildcard matches any subdomain depth but not the bare domain itself.
+    """
+
+    __slots__ = ("allow_all", "exact", "wildcards")
+
+    def __init__(self, allowed_hosts: list[str]) -> None:
+        self.allow_all = False
+        self.exact: set[str] = set()
+        self.wildcards: dict[str, dict] = {}
+
+        for host in allowed_hosts:
+            if host.strip() == _WILDCARD:
+                self.allow_all = True
+                continue
+
+            origin = normalize_origin(host)
+            if origin is None:
+                continue
+
+            scheme, _, netloc = origin.partition("://")
+            if not netloc.startswith("*."):
+                self.exact.add(origin)
+                continue
+
+            name, _, port = netloc[2:].partition(":")
+            node = self.wildcards.setdefault(f"{scheme}:{port}", {})
+            for label in reversed(name.split(".")):
+                node = node.setdefault(label, {})
+            node[_WILDCARD] = True
+
+
+    def matches(self, origin: str | None) -> bool:
+        """`origin` must already be normalized (see normalize_origin)."""
+        if self.allow_all:
+            return True
+        if origin is None:
+            return False
+        if origin in self.exact:
+            return True
+        if not self.wildcards or "[" in origin:
+            return False
+
+        scheme, _, netloc = origin.partition("://")
+        name, _, port = netloc.partition(":")
+        node = self.wildcards.get(f"{scheme}:{port}")
+        if node is None:
+            return False
+
+        labels = name.split(".")
+        for depth, label in enumerate(reversed(labels), start=1):
+            node = node.get(label)
+            if node is None:
+                return False
+            if _WILDCARD in node and depth < len(labels):
+                return True
+        return False
@@ -0,0 +1,27 @@
+import fitz
+import pymupdf4llm
+from io import BytesIO
+from src.chahtbot.retrieval.chunker import PAGE_MARKER
+
+
+def pdf_to_markdown(file_bytes: bytes) -> str:
+    """CPU-bound; call it from a worker thread or a Celery task, never on the event loop."""
+    doc = fitz.open(stream=BytesIO(file_bytes), filetype="pdf")
+
+    all_pages = []
+
+    for page_num in range(len(doc)):
+        # Create a temporary single-page document
+        single_page_doc = fitz.open()
+        single_page_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
+
+        markdown = pymupdf4llm.to_markdown(single_page_doc)
+
+        # Page markers let the local chunker cite page numbers; pymupdf4llm's own numbering is not used
+        all_pages.append(f"{PAGE_MARKER.format(page_num + 1)}\n\n{markdown.strip()}")
+        single_page_doc.close()
+
+    doc.close()
+
+    final_markdown = "\n\n".join(all_pages)
+    return final_markdown
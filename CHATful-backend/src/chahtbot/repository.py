@@ -1,7 +1,9 @@
 from uuid import UUID
+from datetime import datetime, timezone
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.chahtbot.models import FileStatus, KnowledgeBase, Chatbot, BotWidgetSettings, BotStatus
+from src.billing.models import Plan, PlanTier, Subscription, SubscriptionStatus
 
 
 
@@ -17,6 +19,28 @@ class ChatbotRepository:
         return result.scalar_one_or_none()
 
 
+    async def get_chatbot_for_user(self, bot_id: UUID, user_id: UUID) -> Chatbot | None:
+        result = await self.db.execute(
+            select(Chatbot).where(Chatbot.id == bot_id, Chatbot.user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+
+    async def get_owner_plan_tier(self, user_id: UUID) -> PlanTier:
+        result = await self.db.execute(
+            select(Plan.tier)
+            .join(Subscription, Subscription.plan_id == Plan.id)
+            .where(
+                Subscription.user_id == user_id,
+                Subscription.current_period_end > datetime.now(timezone.utc),
+                Subscription.status.in_([SubscriptionStatus.ACTIVE, SubscriptionStatus.CANCELED]),
+            )
+            .order_by(Plan.tier.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none() or PlanTier.FREE
+
+
     async def my_bots(self, user_id: UUID) -> list[Chatbot]:
         stmt = (
             select(Chatbot)
@@ -56,6 +80,14 @@ class ChatbotRepository:
         return bot
 
 
+    async def add_knowledgebase_file(self, *, user_id: UUID, bot_id: UUID, filename: str) -> KnowledgeBase:
+        kb = KnowledgeBase(user_id=user_id, bot_id=bot_id, filename=filename)
+        self.db.add(kb)
+        await self.db.commit()
+        await self.db.refresh(kb)
+        return kb
+
+
     async def update_chatbot_status(self, bot_id, status: BotStatus):
         bot = (await self.db.execute(
             select(Chatbot).where(Chatbot.id == bot_id)
@@ -69,6 +101,20 @@ class ChatbotRepository:
         await self.db.refresh(bot)
 
 
+    async def update_retrieval_weights(self, bot: Chatbot, weights: dict[str, float]) -> Chatbot:
+        bot.retrieval_weights = weights
+        await self.db.commit()
+        await self.db.refresh(bot)
+        return bot
+
+
+    async def update_retrieval_filter(self, bot: Chatbot, chunk_filter: dict) -> Chatbot:
+        bot.retrieval_filter = chunk_filter
+        await self.db.commit()
+        await self.db.refresh(bot)
+        return bot
+
+
 class KnowledgebaseRepository:
     def __init__(self, db: AsyncSession) -> None:
         self.db = db
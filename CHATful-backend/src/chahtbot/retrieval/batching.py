@@ -0,0 +1,69 @@
+import threading
+from typing import Any, Callable
+from src.metrics import metrics
+
+
+batch_sizes = metrics.histogram(
+    "retrieval_query_batch_size", "Queries scored together in one micro-batch.",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self.items: list = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results: list | None = None
+        self.error: BaseException | None = None
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent queries for the same key (bot) into one call of
+    `run(key, items)`, which returns one result per item.
+
+    Callers are threadpool threads. The first caller for a key opens a batch
+    and waits up to `window` seconds (less if `max_batch` callers join), then
+    runs it for everyone; the others block until their result is ready.
+    """
+
+    def __init__(self, run: Callable[[str, list], list], window: float, max_batch: int) -> None:
+        self.run = run
+        self.window = window
+        self.max_batch = max_batch
+        self._open: dict[str, _Batch] = {}
+        self._lock = threading.Lock()
+
+
+    def submit(self, key: str, item: Any) -> Any:
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            position = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch:
+                # closed: later callers open the next batch
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            batch_sizes.observe(len(batch.items))
+            try:
+                batch.results = self.run(key, batch.items)
+            except BaseException as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[position]
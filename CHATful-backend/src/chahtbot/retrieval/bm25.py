@@ -0,0 +1,293 @@
+import re, zlib
+from collections import Counter
+from typing import Callable, Iterable, Sequence
+import numpy as np
+from src.chahtbot.retrieval.strings import PackedStrings
+
+
+# keeps SKUs, versions and error codes (ABC-123, v2.1.0, E_502) together as one token
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*", re.UNICODE)
+_PART = re.compile(r"\w+", re.UNICODE)
+
+BLOCK_SIZE = 128
+
+
+def tokenize(text: str) -> list[str]:
+    """Compound tokens are indexed whole and by their parts, so "ABC-123" also matches "123"."""
+    tokens = []
+    for match in _TOKEN.findall(text.casefold()):
+        tokens.append(match)
+        if not match.isalnum():
+            tokens.extend(part for part in _PART.findall(match) if part != match)
+    return tokens
+
+
+class Bm25Index:
+    """
+    Okapi BM25 over a bot's chunks.
+
+    Postings are stored per term as one flat buffer of delta-encoded doc ids
+    (uint32) and term frequencies (uint16), split into blocks of BLOCK_SIZE
+    with the last doc id of every block kept for skipping. Queries run
+    term-at-a-time in MaxScore order: once the remaining terms' upper bounds
+    cannot lift an unseen chunk into the top k, only the blocks that hold
+    current candidates are decoded.
+
+    Terms are looked up through their crc32 in a sorted hash table rather
+    than a dict, and idf and length norms are stored with the postings, so a
+    loaded index is nothing but memory maps that every worker process shares.
+
+    `extend` appends chunks without tokenizing the existing ones again; idf
+    and length norms keep the values fitted on `fit` = (chunks, average
+    length) until the caller asks for a refit.
+    """
+
+    ARRAYS = ("df", "upper", "post_offsets", "gaps", "tfs", "block_offsets", "block_last", "doc_len")
+    # derived from the above; indexes written before they were stored compute them on load
+    DERIVED = ("vocab_hashes", "vocab_order", "idf", "norm", "fit")
+
+    def __init__(self, vocab: Sequence[str], arrays: dict[str, np.ndarray], k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1, self.b = k1, b
+        self.vocab = vocab
+        self.df = arrays["df"]
+        self.upper = arrays["upper"]
+        self.post_offsets = arrays["post_offsets"]
+        self.gaps = arrays["gaps"]
+        self.tfs = arrays["tfs"]
+        self.block_offsets = arrays["block_offsets"]
+        self.block_last = arrays["block_last"]
+        self.doc_len = arrays["doc_len"]
+
+        if "vocab_hashes" in arrays:
+            self.vocab_hashes, self.vocab_order = arrays["vocab_hashes"], arrays["vocab_order"]
+        else:
+            hashes = np.fromiter((zlib.crc32(term.encode("utf-8")) for term in vocab), dtype=np.uint32, count=len(vocab))
+            self.vocab_order = np.argsort(hashes, kind="stable").astype(np.int32)
+            self.vocab_hashes = hashes[self.vocab_order]
+        count = len(self.doc_len)
+        avgdl = max(float(self.doc_len.mean()), 1.0) if count else 1.0
+        if "idf" in arrays:
+            self.idf, self.norm = arrays["idf"], arrays["norm"]
+        else:
+            self.idf = np.log1p((count - self.df + 0.5) / (self.df + 0.5)).astype(np.float32)
+            self.norm = (k1 * (1 - b + b * self.doc_len / avgdl)).astype(np.float32)
+        self.fit = arrays["fit"] if "fit" in arrays else np.asarray([count, avgdl], dtype=np.float64)
+
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS + self.DERIVED)
+
+
+    def term_id(self, term: str) -> int | None:
+        key = zlib.crc32(term.encode("utf-8"))
+        i = int(np.searchsorted(self.vocab_hashes, key))
+        # crc32 collides now and then; the run of equal hashes is checked against the term itself
+        while i < len(self.vocab_hashes) and self.vocab_hashes[i] == key:
+            if self.vocab[self.vocab_order[i]] == term:
+                return int(self.vocab_order[i])
+            i += 1
+        return None
+
+
+    @property
+    def fitted_docs(self) -> int:
+        return int(self.fit[0])
+
+
+    @staticmethod
+    def _count(texts: Iterable[str], term_id: Callable[[str], int], first: int = 0):
+        term_ids, doc_ids, freqs, doc_len = [], [], [], []
+        for doc, text in enumerate(texts, start=first):
+            counts = Counter(tokenize(text))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(term_id(term))
+                doc_ids.append(doc)
+                freqs.append(tf)
+        tfs = np.minimum(np.asarray(freqs, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)
+        return (np.asarray(term_ids, dtype=np.int32), np.asarray(doc_ids, dtype=np.int64), tfs,
+                np.asarray(doc_len, dtype=np.uint32))
+
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "Bm25Index":
+        vocab: dict[str, int] = {}
+        terms, docs, tfs, doc_len = cls._count(texts, lambda term: vocab.setdefault(term, len(vocab)))
+        return cls._assemble(list(vocab), terms, docs, tfs, doc_len, {}, k1, b)
+
+
+    @classmethod
+    def _assemble(cls, vocab: Sequence[str], terms: np.ndarray, docs: np.ndarray, tfs: np.ndarray, doc_len: np.ndarray,
+                  stats: dict[str, np.ndarray], k1: float, b: float) -> "Bm25Index":
+        # docs were appended in order, so a stable sort by term leaves every posting list ascending
+        order = np.argsort(terms, kind="stable")
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+
+        df = np.bincount(terms, minlength=len(vocab)).astype(np.uint32)
+        post_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=post_offsets[1:])
+
+        gaps = np.diff(docs, prepend=0)
+        gaps[post_offsets[:-1][df > 0]] = docs[post_offsets[:-1][df > 0]]
+
+        blocks_per_term = (df.astype(np.int64) + BLOCK_SIZE - 1) // BLOCK_SIZE
+        block_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(blocks_per_term, out=block_offsets[1:])
+        # block b of term t ends at posting min(start_t + (b + 1) * BLOCK_SIZE, end_t) - 1
+        block_term = np.repeat(np.arange(len(vocab)), blocks_per_term)
+        block_rank = np.arange(block_offsets[-1]) - block_offsets[:-1][block_term]
+        block_end = np.minimum(post_offsets[:-1][block_term] + (block_rank + 1) * BLOCK_SIZE, post_offsets[1:][block_term])
+        block_last = docs[block_end - 1].astype(np.uint32)
+
+        index = cls(vocab, {
+            "df": df, "upper": np.zeros(len(vocab), dtype=np.float32), "post_offsets": post_offsets,
+            "gaps": gaps.astype(np.uint32), "tfs": tfs, "block_offsets": block_offsets,
+            "block_last": block_last, "doc_len": doc_len, **stats,
+        }, k1, b)
+        if len(terms):
+            index.upper = np.zeros(len(vocab), dtype=np.float32)
+            starts = post_offsets[:-1][df > 0]
+            index.upper[df > 0] = np.maximum.reduceat(index._score(terms, docs, tfs), starts)
+        return index
+
+
+    def extend(self, texts: Sequence[str], refit: bool = False) -> "Bm25Index":
+        """
+        Index for the current chunks plus `texts` appended after them; only
+        `texts` are tokenized. Without `refit`, existing terms keep their idf
+        and new chunks are normalized by the fitted average length; new terms
+        take their idf from the current counts.
+        """
+        ids: dict[str, int] = {}
+        added: list[str] = []
+
+        def term_id(term: str) -> int:
+            if term not in ids:
+                found = self.term_id(term)
+                if found is None:
+                    found = len(self.vocab) + len(added)
+                    added.append(term)
+                ids[term] = found
+            return ids[term]
+
+        new_terms, new_docs, new_tfs, new_len = self._count(texts, term_id, len(self))
+        # existing postings decoded back to doc ids: a term's first gap is absolute
+        cumulative = np.cumsum(self.gaps, dtype=np.int64)
+        used = np.flatnonzero(self.df)
+        starts = self.post_offsets[used]
+        bases = np.where(starts > 0, cumulative[np.maximum(starts - 1, 0)], 0)
+        docs = cumulative - np.repeat(bases, self.df[used].astype(np.int64))
+
+        vocab = PackedStrings.of(self.vocab).extended(added)
+        hashes = np.concatenate([self.vocab_hashes, np.fromiter(
+            (zlib.crc32(term.encode("utf-8")) for term in added), dtype=np.uint32, count=len(added),
+        )])
+        order = np.argsort(hashes, kind="stable")
+        stats = {
+            "vocab_hashes": hashes[order],
+            "vocab_order": np.concatenate([self.vocab_order, np.arange(len(self.vocab), len(vocab), dtype=np.int32)])[order],
+        }
+        doc_len = np.concatenate([self.doc_len, new_len])
+        if not refit:
+            count, avgdl = len(doc_len), float(self.fit[1])
+            df = np.bincount(new_terms[new_terms >= len(self.vocab)] - len(self.vocab), minlength=len(added))
+            stats["idf"] = np.concatenate([self.idf, np.log1p((count - df + 0.5) / (df + 0.5))]).astype(np.float32)
+            stats["norm"] = np.concatenate([self.norm, self.k1 * (1 - self.b + self.b * new_len / avgdl)]).astype(np.float32)
+            stats["fit"] = self.fit
+        return self._assemble(
+            vocab,
+            np.concatenate([np.repeat(np.arange(len(self.vocab), dtype=np.int32), self.df.astype(np.int64)), new_terms]),
+            np.concatenate([docs, new_docs]),
+            np.concatenate([np.asarray(self.tfs), new_tfs]),
+            doc_len, stats, self.k1, self.b,
+        )
+
+
+    def to_arrays(self) -> tuple[Sequence[str], dict[str, np.ndarray]]:
+        return self.vocab, {name: getattr(self, name) for name in self.ARRAYS + self.DERIVED}
+
+
+    def _score(self, term, docs: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        tf = tfs.astype(np.float32)
+        return self.idf[term] * tf * (self.k1 + 1) / (tf + self.norm[docs])
+
+
+    def _postings(self, term: int, within: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.post_offsets[term], self.post_offsets[term + 1]
+        if within is None:
+            return np.cumsum(self.gaps[start:end], dtype=np.int64), self.tfs[start:end]
+
+        # decode only the blocks that can contain one of `within` (sorted doc ids)
+        b0, b1 = self.block_offsets[term], self.block_offsets[term + 1]
+        lasts = self.block_last[b0:b1]
+        blocks = np.searchsorted(lasts, within)
+        blocks = blocks[np.r_[True, blocks[1:] != blocks[:-1]] & (blocks < b1 - b0)]
+        if not len(blocks):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint16)
+
+        starts = start + blocks * BLOCK_SIZE
+        lengths = np.minimum(starts + BLOCK_SIZE, end) - starts
+        firsts = np.zeros(len(blocks), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=firsts[1:])
+        positions = np.arange(lengths.sum()) + np.repeat(starts - firsts, lengths)
+
+        # a block's first gap is relative to the previous block's last doc id
+        gaps = self.gaps[positions]
+        cumulative = np.cumsum(gaps, dtype=np.int64)
+        bases = np.where(blocks > 0, lasts[np.maximum(blocks - 1, 0)], 0).astype(np.int64)
+        docs = cumulative + np.repeat(bases - cumulative[firsts] + gaps[firsts], lengths)
+
+        found = np.searchsorted(within, docs)
+        keep = (found < len(within)) & (within[np.minimum(found, len(within) - 1)] == docs)
+        return docs[keep], self.tfs[positions][keep]
+
+
+    def search(self, query: str, k: int, exclude: np.ndarray | None = None, tokens: list[str] | None = None) -> list[tuple[int, float]]:
+        """
+        `exclude` is a per-chunk mask of tombstoned chunks that must not be
+        returned; `tokens` are the query's, if already tokenized.
+        """
+        if tokens is None:
+            tokens = tokenize(query)
+        terms = sorted({t for t in map(self.term_id, tokens) if t is not None}, key=lambda t: -self.upper[t])
+        if not terms or k <= 0 or not len(self):
+            return []
+
+        # remaining[i]: the most any chunk can still gain from terms[i:]
+        remaining = np.cumsum(self.upper[terms][::-1])[::-1]
+        scores = np.zeros(len(self), dtype=np.float32)
+        if exclude is not None:
+            # -inf never reaches the k-th score, so excluded chunks cannot raise the pruning threshold
+            scores[exclude] = -np.inf
+        seen = np.zeros(len(self), dtype=bool)
+        candidates = None
+
+        for i, term in enumerate(terms):
+            if candidates is None and i:
+                touched = np.flatnonzero(seen)
+                if len(touched) >= k and remaining[i] < np.partition(scores[touched], -k)[-k]:
+                    candidates = touched
+
+            if candidates is None:
+                docs, tfs = self._postings(term)
+                seen[docs] = True
+            else:
+                threshold = np.partition(scores[candidates], -k)[-k]
+                candidates = candidates[scores[candidates] + remaining[i] >= threshold]
+                docs, tfs = self._postings(term, candidates)
+            scores[docs] += self._score(term, docs, tfs)
+
+        pool = candidates if candidates is not None else np.flatnonzero(seen)
+        if exclude is not None:
+            pool = pool[~exclude[pool]]
+        if not len(pool):
+            return []
+        k = min(k, len(pool))
+        top = pool[np.argpartition(scores[pool], -k)[-k:]]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(i), float(scores[i])) for i in top]
@@ -0,0 +1,195 @@
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+
+# written by ChatbotService.convert_to_markdown at the start of every PDF page
+PAGE_MARKER = "<!-- page {} -->"
+
+_PAGE = re.compile(r"^<!-- page (\d+) -->$")
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*$")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+_TABLE_RULE = re.compile(r"^\|[\s:|-]+\|$")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token: coarser than packing.count_tokens, but free at ingestion speed
+    return (len(text) + 3) // 4
+
+
+@dataclass(slots=True)
+class Chunk:
+    text: str
+    page: int | None
+    heading: str
+
+    def label(self, source: str) -> str:
+        """Source as shown with a retrieved passage, e.g. "manual.pdf, p. 3, Setup > Network"."""
+        parts = [source]
+        if self.page is not None:
+            parts.append(f"p. {self.page}")
+        if self.heading:
+            parts.append(self.heading)
+        return ", ".join(parts)
+
+
+def _blocks(lines: Iterable[str]) -> Iterator[tuple[str, object]]:
+    """
+    pymupdf4llm markdown as a stream of ("page", n), ("heading", (level, title))
+    and ("text" | "list" | "table", block) events. Every list item is a block
+    of its own; a table is one block.
+    """
+    block: list[str] = []
+    kind = "text"
+    for raw in lines:
+        line = raw.rstrip()
+        stripped = line.strip()
+        page = _PAGE.match(stripped)
+        heading = _HEADING.match(line)
+        if page or heading or not stripped:
+            if block:
+                yield kind, "\n".join(block)
+                block = []
+            kind = "text"
+            if page:
+                yield "page", int(page.group(1))
+            elif heading:
+                yield "heading", (len(heading.group(1)), heading.group(2))
+            continue
+
+        if stripped.startswith("|"):
+            line_kind = "table"
+        elif _LIST_ITEM.match(line):
+            line_kind = "list"
+        else:
+            # plain lines continue the current paragraph or list item
+            line_kind = "text" if kind == "table" else kind
+        if block and (line_kind != kind or line_kind == "list" and _LIST_ITEM.match(line)):
+            yield kind, "\n".join(block)
+            block = []
+        kind = line_kind
+        block.append(line)
+
+    if block:
+        yield kind, "\n".join(block)
+
+
+def _lines(text: str) -> Iterator[str]:
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+
+def _windows(text: str, max_tokens: int, overlap: int) -> Iterator[str]:
+    """Word windows of at most `max_tokens`, each repeating about `overlap` tokens of the previous one."""
+    # cut points are searched in the string rather than by walking words
+    text = " ".join(text.split())
+    limit, keep = 4 * max_tokens, 4 * overlap
+    start = 0
+    while len(text) - start > limit:
+        end = text.rfind(" ", start, start + limit + 1)
+        if end <= start:
+            # a single "word" longer than the budget
+            end = text.find(" ", start + limit)
+            if end == -1:
+                break
+        yield text[start:end]
+        back = text.find(" ", max(end - keep, start), end)
+        start = back + 1 if start < back else end + 1
+    yield text[start:]
+
+
+def _table_pieces(table: str, max_tokens: int) -> Iterator[str]:
+    """Row groups within the budget; every piece repeats the header so it reads on its own."""
+    rows = table.split("\n")
+    header = rows[:2] if len(rows) > 1 and _TABLE_RULE.match(rows[1]) else rows[:1]
+    piece, size = list(header), sum(len(row) + 1 for row in header)
+    for row in rows[len(header):]:
+        if len(piece) > len(header) and size + len(row) + 1 > 4 * max_tokens:
+            yield "\n".join(piece)
+            piece, size = list(header), sum(len(r) + 1 for r in header)
+        piece.append(row)
+        size += len(row) + 1
+    if len(piece) > len(header) or not rows[len(header):]:
+        yield "\n".join(piece)
+
+
+def _tail(text: str, overlap: int) -> str:
+    if overlap <= 0:
+        return ""
+    if len(text) <= 4 * overlap:
+        return text
+    tail = text[-4 * overlap:]
+    return tail[tail.find(" ") + 1:] if " " in tail else ""
+
+
+def iter_chunks(markdown: str | Iterable[str], max_tokens: int = 300, overlap: int = 60) -> Iterator[Chunk]:
+    """
+    Splits (pymupdf4llm) markdown into chunks of at most ~`max_tokens`.
+
+    Chunks break at headings, and paragraphs, list items and tables are packed
+    whole; only a block larger than the budget is cut (tables between rows).
+    A chunk that had to be closed mid-section starts with ~`overlap` tokens of
+    the previous one. Lines are consumed lazily and chunks are yielded as soon
+    as they are complete, so a document is never held as a list of chunks.
+    """
+    lines = _lines(markdown) if isinstance(markdown, str) else markdown
+    headings: list[tuple[int, str]] = []
+    page = None
+
+    parts: list[str] = []
+    used = 0
+    has_body = False
+    chunk_page, chunk_heading = page, ""
+
+    for kind, value in _blocks(lines):
+        if kind == "page":
+            page = value
+            if not has_body:
+                chunk_page = page
+            continue
+
+        if kind == "heading":
+            level, title = value
+            if has_body:
+                yield Chunk("\n\n".join(parts), chunk_page, chunk_heading)
+                parts, used, has_body = [], 0, False
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, title))
+            # headings without a body yet stay at the top of the section's first chunk
+            line = f"{'#' * level} {title}"
+            parts.append(line)
+            used += estimate_tokens(line) + 1
+            chunk_page, chunk_heading = page, " > ".join(title for _, title in headings)
+            continue
+
+        # overlap is carried into the next chunk only after whole text blocks; cut blocks overlap already
+        carry = kind != "table" and estimate_tokens(value) <= max_tokens
+        if estimate_tokens(value) <= max_tokens:
+            pieces = (value,)
+        elif kind == "table":
+            pieces = _table_pieces(value, max_tokens)
+        else:
+            pieces = _windows(value, max_tokens, overlap)
+
+        for piece in pieces:
+            cost = estimate_tokens(piece) + 1
+            # a section's heading lines stay with its first block even if that overshoots the budget
+            if has_body and used + cost > max_tokens:
+                previous = parts[-1]
+                yield Chunk("\n\n".join(parts), chunk_page, chunk_heading)
+                carried = _tail(previous, min(overlap, max_tokens - cost)) if carry and not previous.startswith("|") else ""
+                parts = [carried] if carried else []
+                used = estimate_tokens(carried) + 1 if carried else 0
+                chunk_page = page
+            parts.append(piece)
+            used += cost
+            has_body = True
+
+    if has_body:
+        yield Chunk("\n\n".join(parts), chunk_page, chunk_heading)
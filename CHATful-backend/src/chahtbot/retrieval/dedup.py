@@ -0,0 +1,87 @@
+import zlib
+import numpy as np
+
+
+NUM_PERM = 64
+BANDS = 16  # 16 bands of 4 rows: pairs above ~0.65 Jaccard share a band with >95% probability
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+class MinHasher:
+    """
+    MinHash signatures over word trigrams. Shingles are hashed with crc32 so
+    signatures are stable across processes and can be stored with an index.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle: int = 3, seed: int = 7) -> None:
+        rng = np.random.default_rng(seed)
+        # h_i(x) = (a_i * x + b_i) mod 2^64, high 32 bits; odd a_i keeps every h_i a bijection
+        self.a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self.shingle = shingle
+
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in text.casefold().split()), dtype=np.uint64)
+        if len(words) < self.shingle:
+            return words if len(words) else np.zeros(1, dtype=np.uint64)
+        hashes = np.zeros(len(words) - self.shingle + 1, dtype=np.uint64)
+        for offset in range(self.shingle):
+            hashes = hashes * np.uint64(0x100000001B3) ^ words[offset:len(words) - self.shingle + 1 + offset]
+        return hashes
+
+
+    def signatures(self, texts) -> np.ndarray:
+        out = np.empty((len(texts), len(self.a)), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            hashed = np.multiply.outer(self._shingles(text), self.a) + self.b
+            out[i] = ((hashed >> np.uint64(32)) & _MASK32).min(axis=0)
+        return out
+
+
+def band_keys(signatures: np.ndarray, bands: int = BANDS) -> np.ndarray:
+    rows = signatures.shape[1] // bands
+    grouped = signatures[:, :bands * rows].reshape(len(signatures), bands, rows).astype(np.uint64)
+    # FNV-style fold of each band's rows into one 64-bit bucket key
+    keys = np.full((len(signatures), bands), 0xCBF29CE484222325, dtype=np.uint64)
+    for j in range(rows):
+        keys = (keys ^ grouped[:, :, j]) * np.uint64(0x100000001B3)
+    return keys
+
+
+def near_duplicates(signatures: np.ndarray, start: int, threshold: float, bands: int = BANDS) -> np.ndarray:
+    """
+    For every row from `start` on, the earliest row it is a near-duplicate of
+    (estimated Jaccard >= `threshold`), or itself. Candidates are the rows
+    sharing an LSH band bucket; results always point at rows that are kept.
+    """
+    rows = len(signatures)
+    target = np.arange(rows)
+    if rows == start:
+        return target[start:]
+
+    keys = band_keys(signatures, bands)
+    ids = np.arange(rows)
+    new = ids[start:]
+    for band in range(bands):
+        order = np.lexsort((ids, keys[:, band]))
+        sorted_keys = keys[order, band]
+        group_start = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        # earliest row in every bucket, spread back to each of its rows
+        earliest = np.empty(rows, dtype=np.int64)
+        earliest[order] = order[np.maximum.accumulate(np.where(group_start, np.arange(rows), 0))]
+
+        candidate = earliest[start:]
+        check = (candidate < new) & (target[start:] == new)
+        if not check.any():
+            continue
+        similar = (signatures[new[check]] == signatures[candidate[check]]).mean(axis=1) >= threshold
+        target[new[check][similar]] = candidate[check][similar]
+
+    # a duplicate of a duplicate points at the row that is kept
+    while True:
+        resolved = target[target]
+        if np.array_equal(resolved, target):
+            return target[start:]
+        target = resolved
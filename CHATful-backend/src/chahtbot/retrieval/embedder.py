@@ -0,0 +1,74 @@
+import math, re, zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Protocol, Sequence
+import numpy as np
+
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+class Embedder(Protocol):
+    """
+    Turns texts into L2-normalized float32 vectors of a fixed size. `version`
+    changes whenever the same text would get a different vector.
+    """
+
+    dim: int
+    version: str
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray: ...
+
+
+@lru_cache(maxsize=200_000)
+def _bucket(feature: str, dim: int) -> tuple[int, float]:
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dim, 1.0 if h & 0x80000000 else -1.0
+
+
+class HashingEmbedder:
+    """
+    CPU-only embedder: word unigrams and bigrams are hashed into `dim` signed
+    buckets (the hashing trick) and weighted by sublinear term frequency
+    (1 + log tf). No vocabulary or model file; vectors are stable across
+    processes because the hash is crc32, not Python's salted hash().
+    """
+
+    def __init__(self, dim: int = 384, ngrams: int = 2) -> None:
+        self.dim = dim
+        self.ngrams = ngrams
+
+
+    @property
+    def version(self) -> str:
+        return f"hashing-crc32-{self.dim}-{self.ngrams}"
+
+
+    def tokenize(self, text: str) -> list[str]:
+        return _TOKEN.findall(text.casefold())
+
+
+    def features(self, text: str) -> Counter:
+        tokens = self.tokenize(text)
+        counts = Counter(tokens)
+        for n in range(2, self.ngrams + 1):
+            counts.update(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return counts
+
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            for feature, tf in self.features(text).items():
+                col, sign = _bucket(feature, self.dim)
+                rows.append(row)
+                cols.append(col)
+                values.append(sign * (1.0 + math.log(tf)))
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if values:
+            np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(values, dtype=np.float32))
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
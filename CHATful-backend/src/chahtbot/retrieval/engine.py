@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+from itertools import islice
+import numpy as np
+from redis import Redis, RedisError
+from src.config import settings
+from src.logging import get_logger
+from src.chahtbot.retrieval.chunker import iter_chunks
+from src.chahtbot.retrieval.embedder import Embedder, HashingEmbedder
+from src.chahtbot.retrieval.store import IngestReport, VectorStore
+from src.chahtbot.retrieval.batching import QueryBatcher
+from src.chahtbot.retrieval.query_cache import QueryCache
+from src.chahtbot.retrieval.bm25 import tokenize
+from src.chahtbot.retrieval.filters import ChunkFilter
+
+logger = get_logger("retrieval")
+
+
+@dataclass(slots=True)
+class Hit:
+    chunk_id: int
+    score: float
+    text: str
+    source: str
+    vector: np.ndarray | None = None
+
+
+class RetrievalEngine:
+    """
+    Chunks, embeds and indexes bot documents, and answers top-k queries against them.
+
+    With a `batch_window` (seconds), concurrent vector searches against the
+    same bot are collected for up to that long (or `max_batch` queries) and
+    embedded and scored together. With a `query_cache`, queries seen before
+    reuse their embedding and keyword tokens.
+    """
+
+    def __init__(self, embedder: Embedder, store: VectorStore, batch_window: float = 0.0, max_batch: int = 32,
+                 query_cache: QueryCache | None = None) -> None:
+        self.embedder = embedder
+        self.store = store
+        self.batcher = QueryBatcher(self._search_batch, batch_window, max_batch) if batch_window > 0 else None
+        self.query_cache = query_cache
+
+
+    def index_document(self, bot_id, text: str, source: str, file_id=None, staged: bool = False,
+                       source_type: str | None = None) -> IngestReport:
+        """With `staged`, the document goes into the bot's next version, announced earlier with `store.expect`."""
+        try:
+            # chunks are embedded batch by batch as the chunker produces them
+            chunks = iter_chunks(text, settings.retrieval_chunk_tokens, settings.retrieval_chunk_overlap_tokens)
+            texts, sources, vectors = [], [], []
+            while batch := list(islice(chunks, settings.retrieval_embed_batch_size)):
+                texts.extend(chunk.text for chunk in batch)
+                sources.extend(chunk.label(source) for chunk in batch)
+                vectors.append(self.embedder.embed([chunk.text for chunk in batch]))
+            if not texts:
+                return IngestReport(0, 0, 0)
+            return self.store.add(
+                bot_id, np.vstack(vectors), texts, sources, [str(file_id or "")] * len(texts), staged,
+                [source_type or ""] * len(texts),
+            )
+        finally:
+            # a failed document must not hold back the publish either
+            if staged:
+                self.store.finish_staged(bot_id)
+
+
+    def archive_file(self, bot_id, file_id) -> float:
+        """Hides the file's chunks right away and returns the share of the bot's chunks that are now tombstoned."""
+        self.store.tombstone(bot_id, [str(file_id)])
+        index = self.store.get(bot_id)
+        if index is None or not len(index):
+            return 0.0
+        return index.tombstoned / len(index)
+
+
+    def keyword_search(self, bot_id, query: str, k: int, chunk_filter: ChunkFilter | None = None) -> list[Hit]:
+        index = self.store.get(bot_id)
+        if index is None or index.keywords is None:
+            return []
+        tokens = self.query_cache.lookup([query])[0][1] if self.query_cache is not None else tokenize(query)
+        exclude = index.select(chunk_filter)[1] if chunk_filter is not None else index.deleted
+        return [
+            Hit(chunk_id, score, index.texts[chunk_id], index.sources[chunk_id], index.vectors[chunk_id])
+            for chunk_id, score in index.keywords.search(query, k, exclude, tokens)
+        ]
+
+
+    def search(self, bot_id, query: str, k: int, chunk_filter: ChunkFilter | None = None) -> list[Hit]:
+        if self.batcher is not None:
+            return self.batcher.submit(str(bot_id), (query, k, chunk_filter))
+        return self._search_batch(str(bot_id), [(query, k, chunk_filter)])[0]
+
+
+    def _search_batch(self, bot_id: str, requests: list[tuple[str, int, ChunkFilter | None]]) -> list[list[Hit]]:
+        index = self.store.get(bot_id)
+        if index is None or not len(index):
+            return [[] for _ in requests]
+
+        queries = [query for query, _, _ in requests]
+        if self.query_cache is not None:
+            query_vectors = np.vstack([vector for vector, _ in self.query_cache.lookup(queries)])
+        else:
+            query_vectors = self.embedder.embed(queries)
+        # queries under the same filter share a scan
+        groups: dict[ChunkFilter | None, list[int]] = {}
+        for i, (_, _, chunk_filter) in enumerate(requests):
+            groups.setdefault(chunk_filter, []).append(i)
+        ranked: list[list[tuple[int, float]]] = [[] for _ in requests]
+        for chunk_filter, members in groups.items():
+            results = index.search_many(
+                query_vectors[members], max(requests[i][1] for i in members),
+                settings.retrieval_pq_rerank, settings.retrieval_ivf_nprobe, chunk_filter,
+            )
+            for i, hits in zip(members, results):
+                ranked[i] = hits
+        return [
+            [
+                Hit(chunk_id, score, index.texts[chunk_id], index.sources[chunk_id], index.vectors[chunk_id])
+                for chunk_id, score in hits[:k]
+                if score >= settings.retrieval_min_score
+            ]
+            for (_, k, _), hits in zip(requests, ranked)
+        ]
+
+
+
+_redis: Redis | None = None
+_redis_failed = False
+
+
+def _sync_redis() -> Redis | None:
+    """Sync client for the retrieval thread pool, created on first use; None when `redis_url` is unusable."""
+    global _redis, _redis_failed
+    if _redis is None and not _redis_failed:
+        try:
+            _redis = Redis.from_url(settings.redis_url)
+        except ValueError as e:
+            _redis_failed = True
+            logger.warning(f"Retrieval runs without Redis: {e}")
+    return _redis
+
+
+def _announce_version(bot_id: str, version: int) -> None:
+    # other services watch this key to notice a new index version without polling the manifest
+    redis = _sync_redis()
+    if redis is None:
+        return
+    try:
+        redis.set(f"retrieval:index_version:{bot_id}", version)
+    except RedisError as e:
+        logger.warning(f"Could not announce index version {version} for bot_id={bot_id}: {e}")
+
+
+_embedder = HashingEmbedder(settings.retrieval_dim)
+
+retrieval_engine = RetrievalEngine(
+    _embedder,
+    VectorStore(
+        settings.retrieval_data_dir, settings.retrieval_dim, settings.retrieval_memory_budget_mb * 2**20,
+        settings.retrieval_quantization, settings.retrieval_pq_subspaces,
+        settings.retrieval_ann, settings.retrieval_ann_min_chunks, settings.retrieval_ivf_lists,
+        settings.retrieval_ivf_retrain_growth, settings.retrieval_dedup_threshold, _announce_version,
+        settings.retrieval_refit_growth,
+    ),
+    settings.retrieval_batch_window_ms / 1000,
+    settings.retrieval_batch_max,
+    QueryCache(
+        _embedder, settings.retrieval_query_cache_size,
+        _sync_redis if settings.retrieval_query_cache_redis_ttl > 0 else None, settings.retrieval_query_cache_redis_ttl,
+    ) if settings.retrieval_query_cache_size > 0 else None,
+)
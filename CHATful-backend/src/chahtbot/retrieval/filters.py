@@ -0,0 +1,31 @@
+from dataclasses import dataclass
+
+
+# a file's source type is stored as its position here; 0 when the ingestion didn't say
+SOURCE_TYPES = ("", "file", "webpage", "website")
+
+
+@dataclass(frozen=True, slots=True)
+class ChunkFilter:
+    """
+    Which chunks a query may return. Every field is a set of accepted values
+    (any of them matches) and the fields must all match; None accepts any
+    value. `files` are knowledge base file ids; a file counts as archived
+    once it is tombstoned, until compaction drops its chunks.
+    """
+
+    files: frozenset[str] | None = None
+    source_types: frozenset[str] | None = None
+    statuses: frozenset[str] = frozenset({"active"})
+
+    @classmethod
+    def parse(cls, data: dict | None) -> "ChunkFilter | None":
+        """The filter stored in a bot's settings, or None when it restricts nothing beyond the default."""
+        if not data:
+            return None
+        chunk_filter = cls(
+            frozenset(map(str, data["files"])) if data.get("files") is not None else None,
+            frozenset(data["source_types"]) if data.get("source_types") is not None else None,
+            frozenset(data.get("statuses") or ("active",)),
+        )
+        return None if chunk_filter == cls() else chunk_filter
@@ -0,0 +1,82 @@
+import asyncio, time
+from fastapi.concurrency import run_in_threadpool
+from src.logging import get_logger
+from src.metrics import metrics
+from src.chahtbot.retrieval.engine import Hit, RetrievalEngine
+from src.chahtbot.retrieval.filters import ChunkFilter
+
+
+stage_seconds = metrics.histogram(
+    "retrieval_stage_seconds", "Time spent in each local retrieval stage.", ("stage",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+stage_timeouts = metrics.counter("retrieval_stage_timeouts_total", "Retrieval stages dropped at the query deadline.", ("stage",))
+stage_errors = metrics.counter("retrieval_stage_errors_total", "Retrieval stages dropped because they raised.", ("stage",))
+
+logger = get_logger("retrieval")
+
+
+def rrf_fuse(rankings: dict[str, list[Hit]], weights: dict[str, float], k: int, rrf_k: int = 60) -> list[Hit]:
+    """Reciprocal-rank fusion: each list adds weight / (rrf_k + rank) to the chunks it returned."""
+    fused: dict[int, Hit] = {}
+    for name, hits in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.get(hit.chunk_id)
+            if entry is None:
+                entry = fused[hit.chunk_id] = Hit(hit.chunk_id, 0.0, hit.text, hit.source, hit.vector)
+            entry.score += weight / (rrf_k + rank)
+    return sorted(fused.values(), key=lambda hit: hit.score, reverse=True)[:k]
+
+
+async def _timed(stage: str, fn, *args) -> tuple[list[Hit], float]:
+    started = time.perf_counter()
+    hits = await run_in_threadpool(fn, *args)
+    elapsed = time.perf_counter() - started
+    stage_seconds.observe(elapsed, stage=stage)
+    return hits, elapsed
+
+
+async def hybrid_search(engine: RetrievalEngine, bot_id, query: str, k: int, weights: dict[str, float],
+                        deadline: float, rrf_k: int = 60, timings: dict | None = None,
+                        chunk_filter: ChunkFilter | None = None) -> list[Hit]:
+    """
+    Runs keyword and vector search side by side and fuses them. Whatever has
+    not finished by `deadline` seconds, or raised, is dropped and the other
+    side's ranking is used alone; if neither succeeded, no hits are returned.
+    `timings` collects per-stage durations in ms (None for a stage dropped at
+    the deadline, "error" for one that failed).
+    """
+    started = time.perf_counter()
+    depth = 2 * k
+    tasks = {
+        "keyword": asyncio.ensure_future(_timed("keyword", engine.keyword_search, bot_id, query, depth, chunk_filter)),
+        "vector": asyncio.ensure_future(_timed("vector", engine.search, bot_id, query, depth, chunk_filter)),
+    }
+    await asyncio.wait(tasks.values(), timeout=deadline)
+
+    rankings: dict[str, list[Hit]] = {}
+    for stage, task in tasks.items():
+        if task.done() and task.exception() is not None:
+            stage_errors.inc(stage=stage)
+            logger.warning(f"Retrieval stage failed, fusing without it stage={stage} bot_id={bot_id} error={task.exception()!r}")
+            if timings is not None:
+                timings[stage] = "error"
+        elif task.done():
+            rankings[stage], elapsed = task.result()
+            if timings is not None:
+                timings[stage] = elapsed * 1000
+        else:
+            # the worker thread cannot be interrupted; it finishes in the background and is ignored
+            task.cancel()
+            stage_timeouts.inc(stage=stage)
+            if timings is not None:
+                timings[stage] = None
+
+    fusion_started = time.perf_counter()
+    hits = rrf_fuse(rankings, weights, k, rrf_k)
+    if timings is not None:
+        timings["fusion"] = (time.perf_counter() - fusion_started) * 1000
+        timings["retrieval"] = (time.perf_counter() - started) * 1000
+    stage_seconds.observe(time.perf_counter() - started, stage="hybrid")
+    return hits
@@ -0,0 +1,85 @@
+import math
+import numpy as np
+from src.chahtbot.retrieval.quantization import kmeans
+
+
+_ASSIGN_ROWS = 16_384
+
+
+class IvfIndex:
+    """
+    Inverted-file ANN index: k-means centroids split the chunks into lists,
+    and a query only scans the lists of its `nprobe` nearest centroids.
+
+    New rows are assigned to the existing centroids without re-clustering;
+    callers retrain (build) once the index has grown well past the size it
+    was trained on.
+    """
+
+    def __init__(self, centroids: np.ndarray, labels: np.ndarray, trained_rows: int,
+                 members: np.ndarray | None = None, offsets: np.ndarray | None = None) -> None:
+        self.centroids = centroids
+        self.labels = labels  # list id of every row
+        self.trained_rows = trained_rows
+        self._centroid_norms = (centroids ** 2).sum(axis=1)
+        if members is None:
+            # rows grouped by list: list p holds members[offsets[p]:offsets[p + 1]]
+            members = np.argsort(labels, kind="stable").astype(np.int32)
+            offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(labels, minlength=len(centroids)), out=offsets[1:])
+        self.members = members
+        self.offsets = offsets
+
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+
+    @staticmethod
+    def default_lists(rows: int) -> int:
+        return max(1, int(math.sqrt(rows)))
+
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, lists: int = 0, iterations: int = 10, seed: int = 7) -> "IvfIndex":
+        rows = len(vectors)
+        lists = min(lists or cls.default_lists(rows), rows)
+        rng = np.random.default_rng(seed)
+        sample = min(rows, 64 * lists)
+        training = np.asarray(vectors[np.sort(rng.choice(rows, sample, replace=False))], dtype=np.float32)
+        centroids = kmeans(training, lists, iterations, rng).astype(np.float32)
+        return cls(centroids, cls._assign(centroids, vectors), rows)
+
+
+    @staticmethod
+    def _assign(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        norms = (centroids ** 2).sum(axis=1)
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _ASSIGN_ROWS):
+            labels[start:start + _ASSIGN_ROWS] = (norms - 2 * vectors[start:start + _ASSIGN_ROWS] @ centroids.T).argmin(axis=1)
+        return labels
+
+
+    def extend(self, vectors: np.ndarray) -> "IvfIndex":
+        """Index for the current rows plus `vectors` appended after them."""
+        return IvfIndex(self.centroids, np.concatenate([self.labels, self._assign(self.centroids, vectors)]), self.trained_rows)
+
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        distances = self._centroid_norms - 2 * self.centroids @ query
+        nprobe = min(nprobe, len(distances))
+        probes = np.argpartition(distances, nprobe - 1)[:nprobe]
+        # ascending row ids keep reads from the mapped vectors sequential
+        return np.sort(np.concatenate([self.members[self.offsets[p]:self.offsets[p + 1]] for p in probes]))
+
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "centroids": self.centroids, "labels": self.labels, "members": self.members, "offsets": self.offsets,
+            "trained_rows": np.asarray([self.trained_rows], dtype=np.int64),
+        }
+
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> "IvfIndex":
+        return cls(arrays["centroids"], arrays["labels"], int(arrays["trained_rows"][0]), arrays["members"], arrays["offsets"])
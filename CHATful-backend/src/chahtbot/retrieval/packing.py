@@ -0,0 +1,85 @@
+import re
+from dataclasses import dataclass
+import numpy as np
+from src.metrics import metrics
+
+
+context_tokens = metrics.histogram(
+    "retrieval_context_tokens", "Approximate tokens of retrieved context sent upstream per request.",
+    buckets=(100, 250, 500, 1000, 1500, 2000, 3000, 5000),
+)
+context_tokens_saved = metrics.counter(
+    "retrieval_context_tokens_saved_total", "Candidate passage tokens left out of the context by budgeting and MMR.",
+)
+
+# words, numbers and single punctuation marks: roughly where a BPE tokenizer starts a new token
+_PIECE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate BPE token count: one per word or punctuation mark, plus one
+    for every further 6 characters of a long word (codes, URLs, compounds).
+    """
+    pieces = _PIECE.findall(text)
+    return len(pieces) + sum(len(piece) // 6 for piece in pieces if len(piece) > 6)
+
+
+@dataclass(slots=True)
+class PackedContext:
+    text: str
+    tokens: int
+    candidate_tokens: int
+    passages: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.candidate_tokens - self.tokens
+
+
+def pack_context(hits: list, token_budget: int, mmr_lambda: float = 0.7, max_passages: int | None = None) -> PackedContext:
+    """
+    Orders the candidates by maximal marginal relevance and adds them as
+    numbered passages while they fit `token_budget`.
+
+    A candidate's MMR score is lambda * relevance - (1 - lambda) * its highest
+    cosine similarity to a passage already chosen, so a chunk that repeats one
+    already in the context loses its place to one that adds something new.
+    Relevance is the retrieval score scaled to the best hit. Hits without a
+    vector are taken in retrieval order.
+    """
+    passages = [f"({hit.source})\n{hit.text}" for hit in hits]
+    costs = np.asarray([count_tokens(passage) + 4 for passage in passages], dtype=np.int64)  # + "[n] " and separator
+    limit = len(hits) if max_passages is None else min(max_passages, len(hits))
+
+    chosen: list[int] = []
+    used = 0
+    if hits and all(hit.vector is not None for hit in hits):
+        vectors = np.vstack([hit.vector for hit in hits]).astype(np.float32)
+        similarity = vectors @ vectors.T
+        scores = np.asarray([hit.score for hit in hits], dtype=np.float32)
+        relevance = scores / scores.max() if scores.max() > 0 else np.ones(len(hits), dtype=np.float32)
+        redundancy = np.zeros(len(hits), dtype=np.float32)
+        open_ = np.ones(len(hits), dtype=bool)
+        while len(chosen) < limit:
+            open_ &= costs <= token_budget - used
+            if not open_.any():
+                break
+            mmr = np.where(open_, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+            best = int(np.argmax(mmr))
+            chosen.append(best)
+            used += int(costs[best])
+            open_[best] = False
+            np.maximum(redundancy, similarity[best], out=redundancy)
+    else:
+        for i in range(len(hits)):
+            if len(chosen) == limit or used + costs[i] > token_budget:
+                break
+            chosen.append(i)
+            used += int(costs[i])
+
+    text = "\n\n".join(f"[{n}] {passages[i]}" for n, i in enumerate(chosen, start=1))
+    packed = PackedContext(text, used, int(costs.sum()), len(chosen))
+    context_tokens.observe(packed.tokens)
+    context_tokens_saved.inc(packed.tokens_saved)
+    return packed
@@ -0,0 +1,206 @@
+import numpy as np
+
+
+# rows widened to float32 per step; small enough for the working copy to stay in cache
+_BLOCK_ROWS = 1024
+
+
+class ScalarQuantizer:
+    """
+    Per-dimension int8 quantization: x ~ offset + scale * (code + 128).
+    Inner products are computed on the codes directly,
+    q.x ~ q.(offset + 128 * scale) + (q * scale).code, so a quarter of the
+    float32 memory is read per query.
+
+    Rows appended later are encoded with the fitted range (values outside it
+    clip); `trained_rows` tells callers when a refit is due.
+    """
+
+    kind = "int8"
+
+    def __init__(self, offset: np.ndarray, scale: np.ndarray, codes: np.ndarray, trained_rows: int | None = None) -> None:
+        self.offset = offset
+        self.scale = scale
+        self.codes = codes
+        self.trained_rows = len(codes) if trained_rows is None else trained_rows
+
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray) -> "ScalarQuantizer":
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        scale = np.maximum(high - low, 1e-12) / 255
+        quantizer = cls(low.astype(np.float32), scale.astype(np.float32), np.zeros((0, vectors.shape[1]), dtype=np.int8))
+        quantizer.codes, quantizer.trained_rows = quantizer.encode(vectors), len(vectors)
+        return quantizer
+
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.rint((vectors - self.offset) / self.scale - 128).clip(-128, 127).astype(np.int8)
+
+
+    def extend(self, vectors: np.ndarray) -> "ScalarQuantizer":
+        """Quantizer for the current rows plus `vectors` appended after them."""
+        return ScalarQuantizer(self.offset, self.scale, np.concatenate([self.codes, self.encode(vectors)]), self.trained_rows)
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.offset.nbytes + self.scale.nbytes
+
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        weights = query * self.scale
+        base = float(query @ self.offset + 128 * weights.sum())
+        out = np.empty(self.codes.shape[0], dtype=np.float32)
+        for start in range(0, len(out), _BLOCK_ROWS):
+            out[start:start + _BLOCK_ROWS] = self.codes[start:start + _BLOCK_ROWS].astype(np.float32) @ weights
+        return out + base
+
+
+    def scores_many(self, queries: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """Scores of rows start:stop for several queries at once, shape (queries, rows)."""
+        weights = queries * self.scale
+        base = queries @ self.offset + 128 * weights.sum(axis=1)
+        out = np.empty((len(queries), stop - start), dtype=np.float32)
+        for block in range(start, stop, _BLOCK_ROWS):
+            end = min(block + _BLOCK_ROWS, stop)
+            out[:, block - start:end - start] = weights @ self.codes[block:end].astype(np.float32).T
+        return out + base[:, None]
+
+
+    def score_rows(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        weights = query * self.scale
+        return self.codes[rows].astype(np.float32) @ weights + float(query @ self.offset + 128 * weights.sum())
+
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "offset": self.offset, "scale": self.scale, "codes": self.codes,
+            "trained_rows": np.asarray([self.trained_rows], dtype=np.int64),
+        }
+
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> "ScalarQuantizer":
+        trained = arrays.get("trained_rows")
+        return cls(arrays["offset"], arrays["scale"], arrays["codes"], int(trained[0]) if trained is not None else None)
+
+
+def kmeans(points: np.ndarray, clusters: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = points[rng.choice(len(points), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (centroids ** 2).sum(axis=1) - 2 * points @ centroids.T
+        assign = distances.argmin(axis=1)
+        counts = np.bincount(assign, minlength=clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, points)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # re-seed clusters that lost all their points
+        centroids[empty] = points[rng.choice(len(points), int(empty.sum()))]
+    return centroids
+
+
+class ProductQuantizer:
+    """
+    Product quantization: each vector is split into `subspaces` slices and
+    every slice is replaced by the id of its nearest of 256 k-means
+    centroids, so a vector costs `subspaces` bytes. Queries use asymmetric
+    distance computation: the float query is scored against every centroid
+    once, and a chunk's score is the sum of its slices' table entries.
+
+    Rows appended later are encoded with the existing codebooks; k-means
+    only runs again when the caller refits.
+    """
+
+    kind = "pq"
+
+    def __init__(self, centroids: np.ndarray, codes: np.ndarray, trained_rows: int | None = None) -> None:
+        self.centroids = centroids  # (subspaces, clusters, dim // subspaces)
+        self.codes = codes          # (subspaces, rows) uint8, subspace-major so each lookup is one contiguous take
+        self.trained_rows = codes.shape[1] if trained_rows is None else trained_rows
+
+
+    def __len__(self) -> int:
+        return self.codes.shape[1]
+
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, subspaces: int, sample: int = 16_384, iterations: int = 12, seed: int = 7) -> "ProductQuantizer":
+        rows, dim = vectors.shape
+        if dim % subspaces:
+            raise ValueError(f"dim {dim} is not divisible by {subspaces} subspaces")
+
+        rng = np.random.default_rng(seed)
+        training = vectors[rng.choice(rows, min(rows, sample), replace=False)] if rows > sample else np.asarray(vectors)
+        clusters = min(256, len(training))
+        width = dim // subspaces
+
+        centroids = np.stack([
+            kmeans(np.ascontiguousarray(training[:, j * width:(j + 1) * width]), clusters, iterations, rng)
+            for j in range(subspaces)
+        ]).astype(np.float32)
+        quantizer = cls(centroids, np.zeros((subspaces, 0), dtype=np.uint8))
+        quantizer.codes, quantizer.trained_rows = quantizer.encode(vectors), rows
+        return quantizer
+
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        subspaces, _, width = self.centroids.shape
+        norms = (self.centroids ** 2).sum(axis=2)
+        codes = np.empty((subspaces, len(vectors)), dtype=np.uint8)
+        for start in range(0, len(vectors), 16 * _BLOCK_ROWS):
+            block = vectors[start:start + 16 * _BLOCK_ROWS].reshape(-1, subspaces, width)
+            for j in range(subspaces):
+                distances = norms[j] - 2 * block[:, j] @ self.centroids[j].T
+                codes[j, start:start + len(block)] = distances.argmin(axis=1)
+        return codes
+
+
+    def extend(self, vectors: np.ndarray) -> "ProductQuantizer":
+        """Quantizer for the current rows plus `vectors` appended after them."""
+        return ProductQuantizer(self.centroids, np.concatenate([self.codes, self.encode(vectors)], axis=1), self.trained_rows)
+
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.centroids.nbytes
+
+
+    def _table(self, query: np.ndarray) -> np.ndarray:
+        subspaces, _, width = self.centroids.shape
+        return np.einsum("jcw,jw->jc", self.centroids, query.reshape(subspaces, width))
+
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        table = self._table(query)
+        out = np.zeros(self.codes.shape[1], dtype=np.float32)
+        for j in range(len(table)):
+            out += table[j].take(self.codes[j])
+        return out
+
+
+    def score_rows(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        table = self._table(query)
+        codes = self.codes[:, rows]
+        out = np.zeros(len(rows), dtype=np.float32)
+        for j in range(len(table)):
+            out += table[j].take(codes[j])
+        return out
+
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {"centroids": self.centroids, "codes": self.codes, "trained_rows": np.asarray([self.trained_rows], dtype=np.int64)}
+
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> "ProductQuantizer":
+        trained = arrays.get("trained_rows")
+        return cls(arrays["centroids"], arrays["codes"], int(trained[0]) if trained is not None else None)
+
+
+QUANTIZERS = {quantizer.kind: quantizer for quantizer in (ScalarQuantizer, ProductQuantizer)}
@@ -0,0 +1,129 @@
+import hashlib, threading
+from collections import OrderedDict
+from typing import Callable, Sequence
+import numpy as np
+from redis import Redis, RedisError
+from src.logging import get_logger
+from src.metrics import metrics
+from src.chahtbot.retrieval.bm25 import tokenize
+from src.chahtbot.retrieval.embedder import Embedder
+
+logger = get_logger("retrieval")
+
+
+query_cache_lookups = metrics.counter(
+    "retrieval_query_cache_lookups_total", "Query embedding cache lookups by result (hit, redis_hit, miss).", ("result",),
+)
+query_cache_bytes = metrics.gauge("retrieval_query_cache_bytes", "Bytes of query entries held by this process's cache.")
+
+
+def normalize_query(query: str) -> str:
+    # the embedder and the keyword tokenizer both casefold and never keep whitespace inside a token,
+    # so case and spacing never change a query's entry
+    return " ".join(query.casefold().split())
+
+
+class QueryCache:
+    """
+    Bounded LRU from normalized query text to its keyword tokens and
+    embedding, so a question asked again skips tokenizing and embedding.
+
+    An entry is one bytes value: the float32 vector followed by the
+    space-joined tokens, decoded on access without copying the vector.
+    Entries are keyed by `embedder.version`, so a different model never
+    sees another one's vectors. With `redis` (called for the client on first
+    use, None when Redis isn't available), entries evicted here are written
+    there for `redis_ttl` seconds and local misses look there first, which
+    lets workers share a warm cache.
+    """
+
+    def __init__(self, embedder: Embedder, max_entries: int, redis: Callable[[], Redis | None] | None = None,
+                 redis_ttl: int = 3600) -> None:
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.redis = redis
+        self.redis_ttl = redis_ttl
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+
+    def _redis_key(self, key: str) -> str:
+        # the local key already starts with the embedder version; it is repeated here to keep Redis keys readable
+        return f"retrieval:query:{self.embedder.version}:{hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()}"
+
+
+    def _decode(self, entry: bytes) -> tuple[np.ndarray, list[str]]:
+        size = self.embedder.dim * 4
+        return np.frombuffer(entry, dtype=np.float32, count=self.embedder.dim), entry[size:].decode("utf-8").split()
+
+
+    def _client(self) -> Redis | None:
+        return self.redis() if self.redis is not None else None
+
+
+    def _fetch(self, keys: list[str]) -> list[bytes | None]:
+        redis = self._client() if keys else None
+        if redis is None:
+            return [None] * len(keys)
+        try:
+            return redis.mget([self._redis_key(key) for key in keys])
+        except RedisError as e:
+            logger.warning(f"Query cache lookup in Redis failed: {e}")
+            return [None] * len(keys)
+
+
+    def _spill(self, evicted: list[tuple[str, bytes]]) -> None:
+        redis = self._client() if evicted else None
+        if redis is None:
+            return
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for key, entry in evicted:
+                pipe.set(self._redis_key(key), entry, ex=self.redis_ttl)
+            pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Query cache spill to Redis failed: {e}")
+
+
+    def lookup(self, queries: Sequence[str]) -> list[tuple[np.ndarray, list[str]]]:
+        """Vector and keyword tokens of every query, computed only for queries not cached."""
+        normalized = [normalize_query(query) for query in queries]
+        keys = [f"{self.embedder.version}\x00{query}" for query in normalized]
+        entries: list[bytes | None] = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                entries.append(entry)
+
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        query_cache_lookups.inc(len(keys) - len(missing), result="hit")
+        fetched = self._fetch([keys[i] for i in missing])
+        computed = [i for i, entry in zip(missing, fetched) if entry is None]
+        for i, entry in zip(missing, fetched):
+            entries[i] = entry
+        query_cache_lookups.inc(len(missing) - len(computed), result="redis_hit")
+        query_cache_lookups.inc(len(computed), result="miss")
+        if computed:
+            vectors = self.embedder.embed([normalized[i] for i in computed]).astype(np.float32, copy=False)
+            for i, vector in zip(computed, vectors):
+                entries[i] = vector.tobytes() + " ".join(tokenize(normalized[i])).encode("utf-8")
+
+        evicted = []
+        if missing:
+            with self._lock:
+                for i in missing:
+                    if keys[i] not in self._entries:
+                        self._bytes += len(entries[i])
+                    else:
+                        self._bytes += len(entries[i]) - len(self._entries[keys[i]])
+                    self._entries[keys[i]] = entries[i]
+                while len(self._entries) > self.max_entries:
+                    key, entry = self._entries.popitem(last=False)
+                    self._bytes -= len(entry)
+                    evicted.append((key, entry))
+                query_cache_bytes.set(self._bytes)
+        self._spill(evicted)
+        return [self._decode(entry) for entry in entries]
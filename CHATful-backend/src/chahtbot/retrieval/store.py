@@ -0,0 +1,947 @@
+import fcntl, json, os, shutil, socket, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+import numpy as np
+from src.metrics import metrics
+from src.chahtbot.retrieval.bm25 import Bm25Index
+from src.chahtbot.retrieval.quantization import QUANTIZERS, ProductQuantizer, ScalarQuantizer
+from src.chahtbot.retrieval.ivf import IvfIndex
+from src.chahtbot.retrieval.dedup import MinHasher, near_duplicates
+from src.chahtbot.retrieval.filters import SOURCE_TYPES, ChunkFilter
+from src.chahtbot.retrieval.strings import PackedStrings, pack_strings
+
+
+index_lookups = metrics.counter("retrieval_index_lookups_total", "Bot index lookups by residency result (hit, miss).", ("result",))
+index_evictions = metrics.counter("retrieval_index_evictions_total", "Bot indexes unmapped to stay within the memory budget.")
+resident_bytes = metrics.gauge("retrieval_resident_bytes", "Bytes of bot index files mapped by this process.")
+resident_bots = metrics.gauge("retrieval_resident_bots", "Bot indexes mapped by this process.")
+compactions = metrics.counter("retrieval_compactions_total", "Bot indexes rewritten without their tombstoned chunks.")
+ingested_chunks = metrics.counter("retrieval_ingested_chunks_total", "Chunks offered for indexing by outcome (kept, merged).", ("result",))
+dedup_saved_bytes = metrics.counter("retrieval_dedup_saved_bytes_total", "Vector and text bytes not written because a chunk was a near-duplicate.")
+publishes = metrics.counter("retrieval_index_publishes_total", "Bot index versions swapped in as the published one.")
+versions_collected = metrics.counter("retrieval_index_versions_collected_total", "Bot index versions removed once no reader held them.")
+
+
+_HOST = socket.gethostname()
+# leases taken on other hosts can't be checked for a live process and expire unless refreshed
+_LEASE_TTL = 3600.0
+# the writer keeps the indexes it saved last in memory, so the next document of an ingestion appends to them
+_WRITTEN_KEPT = 2
+
+
+def _lease_live(lease: Path) -> bool:
+    host, pid, _ = lease.name.rsplit(".", 2)
+    if host != _HOST:
+        try:
+            return time.time() - lease.stat().st_mtime < _LEASE_TTL
+        except FileNotFoundError:
+            return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# rows scored per step when several queries share one scan: (queries x 32768) float32 stays small
+_SCAN_ROWS = 32_768
+# below this share of a bot's chunks, a filtered query gathers and scores only the eligible rows;
+# above it, a full scan with the rest masked out is cheaper than the gather
+_GATHER_SHARE = 0.15
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[0])
+    top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+
+@dataclass(slots=True)
+class IngestReport:
+    chunks: int
+    merged: int
+    bytes_saved: int
+
+    @property
+    def dedup_ratio(self) -> float:
+        return self.merged / self.chunks if self.chunks else 0.0
+
+
+class BotIndex:
+    """
+    Chunk texts, their vectors and a BM25 keyword index for one bot, with
+    brute-force inner-product search. A loaded index is a set of read-only
+    memory maps; nothing is deserialized until a chunk or the keyword index
+    is actually used.
+
+    With a quantizer, the scan runs over its codes instead of the float32
+    vectors; product-quantized candidates are re-scored against the full
+    vectors, of which only the candidates' pages are read from disk. With an
+    IVF index, only the rows in the probed lists are scored.
+
+    Every chunk records the file it came from (`owners`). Archived files are
+    tombstoned: `deleted` masks their chunks out of every search until a
+    compaction rewrites the index without them.
+
+    With MinHash `signatures`, near-duplicate chunks are not stored again;
+    their source and file are recorded as an alias of the chunk they match,
+    which stays searchable while any of its files is active.
+
+    Every file also records its source type (`owner_kinds`), and the rows of
+    each file (aliases included) are kept as a sorted posting list. A
+    `ChunkFilter` is resolved over files with boolean masks, one per field,
+    AND-ed together. The matching files' postings then give the eligible rows,
+    cached per filter. Selective filters score only those rows.
+    """
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+        self.version = 0
+        self.texts: list[str] | PackedStrings = []
+        self.sources: list[str] | PackedStrings = []
+        self.owner_names: list[str] | PackedStrings = []
+        self.owners = np.zeros(0, dtype=np.int32)  # index into owner_names for every chunk
+        self.owner_kinds = np.zeros(0, dtype=np.uint8)  # index into SOURCE_TYPES for every file
+        self._owner_ids: dict[str, int] | None = None
+        self._owner_rows: np.ndarray | None = None
+        self._owner_offsets: np.ndarray | None = None
+        self._selections: OrderedDict[ChunkFilter, tuple[np.ndarray, np.ndarray]] = OrderedDict()
+        self._selections_lock = threading.Lock()  # queries run on threadpool threads
+        self.deleted: np.ndarray | None = None
+        self._dead = np.zeros(0, dtype=np.int32)
+        self.signatures: np.ndarray | None = None
+        self.alias_rows = np.zeros(0, dtype=np.int32)
+        self.alias_owners = np.zeros(0, dtype=np.int32)
+        self.alias_sources: list[str] | PackedStrings = []
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._keywords: Bm25Index | None = None
+        self._keyword_arrays: dict[str, np.ndarray] | None = None
+        self.quantizer: ScalarQuantizer | ProductQuantizer | None = None
+        self.ann: IvfIndex | None = None
+        self._mapped: list[np.ndarray] = []
+
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self.texts)]
+
+
+    @property
+    def tombstoned(self) -> int:
+        return int(self.deleted.sum()) if self.deleted is not None else 0
+
+
+    @property
+    def nbytes(self) -> int:
+        if not self._mapped:
+            return self._vectors.nbytes
+        # quantized indexes only ever touch the re-ranked rows of the float32 vectors
+        skip = self._vectors if self.quantizer is not None else None
+        return sum(array.nbytes for array in self._mapped if array is not skip)
+
+
+    @property
+    def keywords(self) -> Bm25Index | None:
+        if self._keywords is None and self._keyword_arrays is not None:
+            arrays = self._keyword_arrays
+            self._keywords = Bm25Index(PackedStrings(arrays["vocab"], arrays["vocab_offsets"]), arrays)
+            self._keyword_arrays = None
+        return self._keywords
+
+
+    @keywords.setter
+    def keywords(self, keywords: Bm25Index | None) -> None:
+        self._keywords, self._keyword_arrays = keywords, None
+
+
+    def provenance(self, chunk_id: int) -> list[str]:
+        """The chunk's source followed by the sources of the near-duplicates merged into it."""
+        return [self.sources[chunk_id]] + [self.alias_sources[i] for i in np.flatnonzero(self.alias_rows == chunk_id)]
+
+
+    def add(self, vectors: np.ndarray, texts: list[str], sources: list[str], owners: list[str] | None = None,
+            signatures: np.ndarray | None = None, dedup_threshold: float = 0.0, kinds: list[str] | None = None) -> np.ndarray:
+        """
+        Appends the chunks and returns which of them were kept (the rest
+        merged as near-duplicates). `kinds` are the chunks' source types; a
+        file takes the first known one. Keyword, quantized and ANN indexes
+        keep covering the earlier rows until they are extended.
+        """
+        size = len(self.texts)
+        if self._owner_ids is None:
+            self._owner_ids = {name: i for i, name in enumerate(self.owner_names)}
+        names = self._owner_ids
+        known = len(names)
+        owner_ids = np.asarray([names.setdefault(owner, len(names)) for owner in (owners or [""] * len(texts))], dtype=np.int32)
+        self.owner_names = PackedStrings.of(self.owner_names).extended(list(names)[known:])
+        codes = np.asarray([SOURCE_TYPES.index(kind) if kind in SOURCE_TYPES else 0 for kind in (kinds or [""] * len(texts))], dtype=np.uint8)
+        self.owner_kinds = np.concatenate([self.owner_kinds, np.zeros(len(names) - len(self.owner_kinds), dtype=np.uint8)])
+        unknown = self.owner_kinds[owner_ids] == 0
+        self.owner_kinds[owner_ids[unknown]] = codes[unknown]
+
+        kept = np.ones(len(texts), dtype=bool)
+        dedup = signatures is not None and dedup_threshold > 0 and (self.signatures is not None or not size)
+        if dedup:
+            existing = self.signatures if self.signatures is not None else signatures[:0]
+            targets = near_duplicates(np.concatenate([existing, signatures]), size, dedup_threshold)
+            kept = targets == np.arange(size, size + len(texts))
+            if not kept.all():
+                # merged chunks point at existing rows or at kept rows of this batch, renumbered after the merge
+                new_rows = size + np.cumsum(kept) - 1
+                rows = np.where(targets < size, targets, new_rows[np.maximum(targets - size, 0)])
+                merged = np.flatnonzero(~kept)
+                self.alias_rows = np.concatenate([self.alias_rows, rows[merged].astype(np.int32)])
+                self.alias_owners = np.concatenate([self.alias_owners, owner_ids[merged]])
+                self.alias_sources = PackedStrings.of(self.alias_sources).extended([sources[i] for i in merged])
+                vectors = vectors[kept]
+                texts = [text for text, keep in zip(texts, kept) if keep]
+                sources = [source for source, keep in zip(sources, kept) if keep]
+                owner_ids, signatures = owner_ids[kept], signatures[kept]
+        self.signatures = np.concatenate([existing, signatures]) if dedup else None
+
+        needed = size + len(texts)
+        if needed > self._vectors.shape[0] or not self._vectors.flags.writeable:
+            # amortized O(1) appends: grow capacity geometrically (and copy off a read-only map)
+            grown = np.zeros((max(needed, 2 * self._vectors.shape[0], 64), self.dim), dtype=np.float32)
+            grown[:size] = self._vectors[:size]
+            self._vectors = grown
+        self._vectors[size:needed] = vectors
+        # strings stay packed, so only the new ones are ever encoded
+        self.texts = PackedStrings.of(self.texts).extended(texts)
+        self.sources = PackedStrings.of(self.sources).extended(sources)
+        self.owners = np.concatenate([self.owners, owner_ids])
+        self._owner_rows = self._owner_offsets = None
+        with self._selections_lock:
+            self.deleted = None
+            self._selections = OrderedDict()
+        return kept
+
+
+    def apply_tombstones(self, owners: set[str]) -> None:
+        dead = np.asarray([i for i, name in enumerate(self.owner_names) if name in owners], dtype=np.int32)
+        deleted = None
+        if len(dead):
+            deleted = np.isin(self.owners, dead)
+            # a chunk merged from several files stays visible while one of them is still active
+            deleted[self.alias_rows[~np.isin(self.alias_owners, dead)]] = False
+            deleted = deleted if deleted.any() else None
+        # swapped together, so a selection computed from the old tombstones can't land in the new cache
+        with self._selections_lock:
+            self._dead = dead
+            self.deleted = deleted
+            self._selections = OrderedDict()
+
+
+    def compacted(self) -> "BotIndex":
+        """A copy without the tombstoned chunks; keyword, quantized and ANN indexes are left to the caller."""
+        live = np.flatnonzero(~self.deleted) if self.deleted is not None else np.arange(len(self))
+        remap = np.full(len(self), -1, dtype=np.int64)
+        remap[live] = np.arange(len(live))
+        owners, sources = np.array(self.owners), list(self.sources)
+
+        aliases = (remap[self.alias_rows] >= 0) & ~np.isin(self.alias_owners, self._dead)
+        # chunks kept only through an alias of an active file take over that alias's source and file
+        orphaned = np.flatnonzero(aliases & np.isin(owners[self.alias_rows], self._dead))
+        _, first = np.unique(self.alias_rows[orphaned], return_index=True)
+        for alias in orphaned[first]:
+            owners[self.alias_rows[alias]] = self.alias_owners[alias]
+            sources[self.alias_rows[alias]] = self.alias_sources[alias]
+            aliases[alias] = False
+
+        index = BotIndex(self.dim)
+        index.version = self.version
+        index._vectors = self.vectors[live]
+        index.texts = [self.texts[i] for i in live]
+        index.sources = [sources[i] for i in live]
+        if self.signatures is not None:
+            index.signatures = self.signatures[live]
+
+        alias_ids = np.flatnonzero(aliases)
+        used, inverse = np.unique(np.concatenate([owners[live], self.alias_owners[alias_ids]]), return_inverse=True)
+        names = list(self.owner_names)
+        index.owner_names = [names[i] for i in used]
+        index.owner_kinds = self.owner_kinds[used]
+        index.owners = inverse[:len(live)].astype(np.int32)
+        index.alias_owners = inverse[len(live):].astype(np.int32)
+        index.alias_rows = remap[self.alias_rows[alias_ids]].astype(np.int32)
+        index.alias_sources = [self.alias_sources[i] for i in alias_ids]
+        if self.ann is not None:
+            # surviving rows keep their lists, so compaction never re-clusters
+            index.ann = IvfIndex(np.asarray(self.ann.centroids), self.ann.labels[live], self.ann.trained_rows)
+        return index
+
+
+    def owner_postings(self) -> tuple[np.ndarray, np.ndarray]:
+        """Rows of every file, its aliases included: file i owns rows[offsets[i]:offsets[i + 1]], ascending."""
+        if self._owner_offsets is None:
+            size = max(len(self), 1)
+            owners = np.concatenate([self.owners, self.alias_owners]).astype(np.int64)
+            rows = np.concatenate([np.arange(len(self)), self.alias_rows]).astype(np.int64)
+            # one sort orders by file, then row, and drops a row merged into its own file twice
+            keys = np.unique(owners * size + rows)
+            self._owner_rows = (keys % size).astype(np.int32)
+            self._owner_offsets = np.zeros(len(self.owner_names) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(keys // size, minlength=len(self.owner_names)), out=self._owner_offsets[1:])
+        return self._owner_rows, self._owner_offsets
+
+
+    def select(self, chunk_filter: ChunkFilter) -> tuple[np.ndarray, np.ndarray]:
+        """The rows `chunk_filter` lets a query return (ascending), and the mask of the rows it doesn't."""
+        with self._selections_lock:
+            selections, dead = self._selections, self._dead
+            cached = selections.get(chunk_filter)
+            if cached is not None:
+                selections.move_to_end(chunk_filter)
+                return cached
+
+        files = len(self.owner_names)
+        allowed = np.ones(files, dtype=bool)
+        if chunk_filter.files is not None:
+            allowed &= np.fromiter((name in chunk_filter.files for name in self.owner_names), dtype=bool, count=files)
+        if chunk_filter.source_types is not None:
+            allowed &= np.isin(self.owner_kinds, [SOURCE_TYPES.index(kind) for kind in chunk_filter.source_types if kind in SOURCE_TYPES])
+        archived = np.zeros(files, dtype=bool)
+        archived[dead] = True
+        if "active" not in chunk_filter.statuses:
+            allowed &= archived
+        if "archived" not in chunk_filter.statuses:
+            allowed &= ~archived
+
+        rows, offsets = self.owner_postings()
+        # a chunk is eligible when any of its files is; rows shared with an alias come up twice
+        eligible = np.unique(rows[np.repeat(allowed, np.diff(offsets))])
+        excluded = np.ones(len(self), dtype=bool)
+        excluded[eligible] = False
+        with self._selections_lock:
+            # tombstones applied meanwhile replaced the cache; this selection is only good for this query
+            if self._selections is selections:
+                selections[chunk_filter] = (eligible, excluded)
+                selections.move_to_end(chunk_filter)
+                while len(selections) > 16:
+                    selections.popitem(last=False)
+        return eligible, excluded
+
+
+    def quantize(self, mode: str, pq_subspaces: int = 48, retrain_growth: float = 2.0) -> None:
+        """Encodes new rows with the fitted quantizer, refitting only after enough growth (or a change of settings)."""
+        quantizer = self.quantizer
+        if not len(self) or mode not in QUANTIZERS:
+            self.quantizer = None
+        elif (quantizer is None or quantizer.kind != mode or len(self) > quantizer.trained_rows * retrain_growth
+              or (mode == "pq" and quantizer.centroids.shape[0] != pq_subspaces)):
+            self.quantizer = ScalarQuantizer.fit(self.vectors) if mode == "int8" else ProductQuantizer.fit(self.vectors, pq_subspaces)
+        elif len(self) > len(quantizer):
+            self.quantizer = quantizer.extend(self.vectors[len(quantizer):])
+
+
+    def index_ann(self, mode: str, min_rows: int, lists: int = 0, retrain_growth: float = 2.0) -> None:
+        """Exact search below `min_rows`; otherwise extend the IVF lists, re-clustering only after enough growth."""
+        if mode != "ivf" or len(self) < min_rows:
+            self.ann = None
+        elif self.ann is None or len(self) > self.ann.trained_rows * retrain_growth:
+            self.ann = IvfIndex.build(self.vectors, lists)
+        elif len(self) > len(self.ann):
+            self.ann = self.ann.extend(self.vectors[len(self.ann):])
+
+
+    def search(self, query: np.ndarray, k: int, rerank: int = 10, nprobe: int = 8,
+               chunk_filter: ChunkFilter | None = None) -> list[tuple[int, float]]:
+        if not len(self) or k <= 0:
+            return []
+
+        # a float64 query would upcast every row it touches
+        query = np.asarray(query, dtype=np.float32)
+        deleted, rows, eligible = self.deleted, None, None
+        if chunk_filter is not None:
+            eligible, deleted = self.select(chunk_filter)
+            if not len(eligible):
+                return []
+            if len(eligible) <= len(self) * _GATHER_SHARE:
+                # scored exactly, whatever lists the ANN index would have probed
+                rows, deleted = eligible, None
+        if rows is None and self.ann is not None:
+            rows = self.ann.candidates(query, nprobe)
+            if deleted is not None:
+                rows = rows[~deleted[rows]]
+        if rows is not None and not len(rows):
+            return []
+        if rows is None:
+            scores = self.quantizer.scores(query) if self.quantizer is not None else self.vectors @ query
+            if eligible is not None:
+                # only eligible scores compete: a top k over an array that is mostly -inf partitions slowly
+                rows, scores, deleted = eligible, scores[eligible], None
+            elif deleted is not None:
+                scores[deleted] = -np.inf
+        elif self.quantizer is not None:
+            scores = self.quantizer.score_rows(query, rows)
+        else:
+            scores = self._vectors.take(rows, axis=0) @ query
+
+        if self.quantizer is not None and self.quantizer.kind == "pq":
+            top = _top_k(scores, k * rerank)
+            rows = np.sort(top if rows is None else rows[top])
+            if deleted is not None:
+                rows = rows[~deleted[rows]]
+            scores = self._vectors[rows] @ query
+
+        top = _top_k(scores, k)
+        ids = top if rows is None else rows[top]
+        return [(int(i), float(s)) for i, s in zip(ids, scores[top]) if s > -np.inf]
+
+
+    def search_many(self, queries: np.ndarray, k: int, rerank: int = 10, nprobe: int = 8,
+                    chunk_filter: ChunkFilter | None = None) -> list[list[tuple[int, float]]]:
+        """
+        `search` for several queries. Exact float32 and int8 scans read every
+        row once for the whole batch (one matrix product per block of rows);
+        IVF and PQ indexes, and filters selective enough to gather their
+        rows, score each query on its own.
+        """
+        if not len(self) or k <= 0:
+            return [[] for _ in queries]
+        queries = np.asarray(queries, dtype=np.float32)
+        deleted, eligible = self.deleted, None
+        if chunk_filter is not None:
+            eligible, _ = self.select(chunk_filter)
+        if (len(queries) == 1 or self.ann is not None or (self.quantizer is not None and self.quantizer.kind != "int8")
+                or (eligible is not None and len(eligible) <= len(self) * _GATHER_SHARE)):
+            return [self.search(query, k, rerank, nprobe, chunk_filter) for query in queries]
+
+        k = min(k, len(self))
+        best_rows, best_scores = [], []
+        for start in range(0, len(self), _SCAN_ROWS):
+            stop = min(start + _SCAN_ROWS, len(self))
+            if self.quantizer is not None:
+                scores = self.quantizer.scores_many(queries, start, stop)
+            else:
+                scores = queries @ self._vectors[start:stop].T
+            ids = np.arange(start, stop)
+            if eligible is not None:
+                ids = eligible[np.searchsorted(eligible, start):np.searchsorted(eligible, stop)]
+                scores = scores[:, ids - start]
+            elif deleted is not None:
+                scores[:, deleted[start:stop]] = -np.inf
+            # per-query top k of this block; the blocks' winners compete at the end
+            top = np.argpartition(scores, -k, axis=1)[:, -k:] if len(ids) > k else np.broadcast_to(np.arange(len(ids)), (len(queries), len(ids)))
+            best_rows.append(ids[top])
+            best_scores.append(np.take_along_axis(scores, top, axis=1))
+
+        rows, scores = np.concatenate(best_rows, axis=1), np.concatenate(best_scores, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return [
+            [(int(i), float(s)) for i, s in zip(row_ids[ranked], row_scores[ranked]) if s > -np.inf]
+            for row_ids, row_scores, ranked in zip(rows, scores, order)
+        ]
+
+
+    def save(self, directory: Path, version: int) -> str:
+        """Writes the index as version directory `v{version}` and returns its name; publishing it is up to the caller."""
+        directory.mkdir(parents=True, exist_ok=True)
+        self.version = version
+        arrays = {"vectors": self.vectors}
+        arrays["texts"], arrays["text_offsets"] = pack_strings(self.texts)
+        arrays["sources"], arrays["source_offsets"] = pack_strings(self.sources)
+        arrays["owners"] = self.owners
+        arrays["owner_names"], arrays["owner_name_offsets"] = pack_strings(self.owner_names)
+        arrays["owner_kinds"] = self.owner_kinds
+        arrays["owner_rows"], arrays["owner_offsets"] = self.owner_postings()
+        arrays["alias_rows"], arrays["alias_owners"] = self.alias_rows, self.alias_owners
+        arrays["alias_sources"], arrays["alias_source_offsets"] = pack_strings(self.alias_sources)
+        if self.signatures is not None:
+            arrays["signatures"] = self.signatures
+        if self.keywords is not None:
+            vocab, keyword_arrays = self.keywords.to_arrays()
+            arrays.update({f"bm25_{key}": value for key, value in keyword_arrays.items()})
+            arrays["bm25_vocab"], arrays["bm25_vocab_offsets"] = pack_strings(vocab)
+        if self.quantizer is not None:
+            arrays.update({f"{self.quantizer.kind}_{key}": value for key, value in self.quantizer.to_arrays().items()})
+        if self.ann is not None:
+            arrays.update({f"ivf_{key}": value for key, value in self.ann.to_arrays().items()})
+
+        # one flat .npy file per array so readers can map each of them directly
+        name = f"v{version}"
+        tmp = directory / f".{name}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir()
+        for key, array in arrays.items():
+            np.save(tmp / f"{key}.npy", np.ascontiguousarray(array))
+        shutil.rmtree(directory / name, ignore_errors=True)
+        os.replace(tmp, directory / name)
+        return name
+
+
+    @classmethod
+    def load(cls, directory: Path, name: str | None = None) -> "BotIndex | None":
+        """Maps the published version, or version directory `name`."""
+        try:
+            if name is None:
+                name = json.loads((directory / "manifest.json").read_text())["dir"]
+            arrays = {path.stem: np.load(path, mmap_mode="r") for path in (directory / name).glob("*.npy")}
+        except FileNotFoundError:
+            return None
+        if "vectors" not in arrays:
+            return None
+
+        index = cls(arrays["vectors"].shape[1])
+        index.version = int(name[1:])
+        index._vectors = arrays["vectors"]
+        index.texts = PackedStrings(arrays["texts"], arrays["text_offsets"])
+        index.sources = PackedStrings(arrays["sources"], arrays["source_offsets"])
+        if "owners" in arrays:
+            index.owner_names = PackedStrings(arrays["owner_names"], arrays["owner_name_offsets"])
+            index.owners = arrays["owners"]
+        else:
+            # written before chunks recorded their file
+            index.owner_names, index.owners = [""], np.zeros(len(index), dtype=np.int32)
+        if "alias_rows" in arrays:
+            index.alias_rows, index.alias_owners = arrays["alias_rows"], arrays["alias_owners"]
+            index.alias_sources = PackedStrings(arrays["alias_sources"], arrays["alias_source_offsets"])
+        # written before files recorded their source type and rows; the postings are rebuilt on first use
+        index.owner_kinds = arrays.get("owner_kinds", np.zeros(len(index.owner_names), dtype=np.uint8))
+        index._owner_rows, index._owner_offsets = arrays.get("owner_rows"), arrays.get("owner_offsets")
+        index.signatures = arrays.get("signatures")
+        index._keyword_arrays = {key[5:]: value for key, value in arrays.items() if key.startswith("bm25_")} or None
+        for kind, quantizer in QUANTIZERS.items():
+            prefix = f"{kind}_"
+            quantized = {key[len(prefix):]: value for key, value in arrays.items() if key.startswith(prefix)}
+            if quantized:
+                index.quantizer = quantizer.from_arrays(quantized)
+        ivf = {key[4:]: value for key, value in arrays.items() if key.startswith("ivf_")}
+        if ivf:
+            index.ann = IvfIndex.from_arrays(ivf)
+        index._mapped = list(arrays.values())
+        return index
+
+
+class VectorStore:
+    """
+    Per-bot indexes persisted under `root/<bot_id>/`. Every write produces an
+    immutable version directory (`v1`, `v2`, ...); a version is published by
+    atomically replacing `manifest.json`, and `on_publish(bot_id, version)`
+    is called after each swap. Readers map the published version on first
+    query, remap when the manifest changes, and hold a lease on the version
+    they mapped. Versions that are neither published nor staged are removed
+    once no live reader holds a lease on them. Only the indexing task builds
+    a version; every worker process on a node maps the same files, so they
+    share one copy of the index in the page cache.
+
+    Re-ingestion is staged: `expect` announces a pending document, staged
+    `add`s build the next version beside the published one (from scratch
+    when the staging was opened with `replace`), `finish_staged` marks a
+    document done, and `publish` swaps the staged version in as soon as no
+    document is pending. `discard` drops a staged version.
+
+    Archiving a file only adds it to the bot's `tombstones.json`, which
+    readers pick up on their next lookup; `compact` rewrites the index
+    without those chunks under the writer lock while readers keep serving the
+    previous version.
+
+    With a `dedup_threshold`, chunks whose estimated Jaccard similarity to a
+    chunk already in the bot's index (or earlier in the same batch) reaches it
+    are merged instead of stored.
+
+    Mapped indexes are kept in LRU order and the least recently queried ones
+    are dropped once their mapped size exceeds `memory_budget` bytes.
+    `quantization` ("none", "int8" or "pq") and `ann` ("none" or "ivf", for
+    bots of at least `ann_min_rows` chunks) apply to indexes written here.
+
+    Adding chunks is incremental: only the new chunks are tokenized,
+    quantized and assigned to IVF lists. BM25 statistics and quantizer
+    codebooks are refit once the bot has grown `refit_growth` times past the
+    size they were fitted on, IVF clusters after `ivf_retrain_growth`.
+    """
+
+    def __init__(self, root: str, dim: int, memory_budget: int | None = None,
+                 quantization: str = "none", pq_subspaces: int = 48,
+                 ann: str = "none", ann_min_rows: int = 20_000, ivf_lists: int = 0, ivf_retrain_growth: float = 2.0,
+                 dedup_threshold: float = 0.0, on_publish: Callable[[str, int], None] | None = None,
+                 refit_growth: float = 2.0) -> None:
+        self.root = Path(root)
+        self.dim = dim
+        self.memory_budget = memory_budget
+        self.quantization = quantization
+        self.pq_subspaces = pq_subspaces
+        self.ann = ann
+        self.ann_min_rows = ann_min_rows
+        self.ivf_lists = ivf_lists
+        self.ivf_retrain_growth = ivf_retrain_growth
+        self.dedup_threshold = dedup_threshold
+        self.on_publish = on_publish
+        self.hasher = MinHasher()
+        self.refit_growth = refit_growth
+        self._indexes: OrderedDict[str, tuple[int, int, BotIndex, Path]] = OrderedDict()
+        self._written: OrderedDict[str, tuple[tuple[str, int] | None, BotIndex]] = OrderedDict()
+        self._resident = 0
+        self._leases_touched = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    def _dir(self, bot_id) -> Path:
+        return self.root / str(bot_id)
+
+
+    def save_upload(self, name: str, data: bytes) -> str:
+        """Park an uploaded file beside the indexes for the indexing task, which runs on the same volume."""
+        path = self.root / ".uploads" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return str(path)
+
+
+    @staticmethod
+    def take_upload(path: str) -> bytes:
+        """The parked upload's bytes; the file is removed."""
+        upload = Path(path)
+        data = upload.read_bytes()
+        upload.unlink(missing_ok=True)
+        return data
+
+
+    def _forget(self, bot_key: str) -> None:
+        entry = self._indexes.pop(bot_key, None)
+        if entry is not None:
+            self._resident -= entry[2].nbytes
+            entry[3].unlink(missing_ok=True)
+
+
+    def _publish_residency(self) -> None:
+        resident_bytes.set(self._resident)
+        resident_bots.set(len(self._indexes))
+
+
+    @staticmethod
+    def _tombstones(directory: Path) -> tuple[int, set[str]]:
+        try:
+            path = directory / "tombstones.json"
+            return path.stat().st_mtime_ns, set(json.loads(path.read_text()))
+        except FileNotFoundError:
+            return 0, set()
+
+
+    def _open(self, directory: Path) -> tuple[BotIndex, Path] | None:
+        # the lease is taken before mapping; a version collected in between shows up as missing files,
+        # and the manifest is read again
+        for _ in range(3):
+            try:
+                name = json.loads((directory / "manifest.json").read_text())["dir"]
+                readers = directory / name / ".readers"
+                readers.mkdir(exist_ok=True)
+                lease = readers / f"{_HOST}.{os.getpid()}.{id(self):x}"
+                lease.touch()
+            except FileNotFoundError:
+                continue
+            index = BotIndex.load(directory, name)
+            if index is not None:
+                return index, lease
+            lease.unlink(missing_ok=True)
+        return None
+
+
+    def _refresh_leases(self) -> None:
+        # readers on other hosts can't be checked for liveness, so their leases expire unless touched
+        now = time.monotonic()
+        if now - self._leases_touched < _LEASE_TTL / 4:
+            return
+        self._leases_touched = now
+        with self._lock:
+            leases = [entry[3] for entry in self._indexes.values()]
+        for lease in leases:
+            try:
+                os.utime(lease)
+            except FileNotFoundError:
+                pass
+
+
+    def get(self, bot_id) -> BotIndex | None:
+        bot_key = str(bot_id)
+        directory = self._dir(bot_key)
+        self._refresh_leases()
+        try:
+            mtime = (directory / "manifest.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(bot_key)
+                self._publish_residency()
+            return None
+
+        try:
+            tombstoned_at = (directory / "tombstones.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            tombstoned_at = 0
+        with self._lock:
+            cached = self._indexes.get(bot_key)
+            if cached is not None and cached[0] == mtime:
+                self._indexes.move_to_end(bot_key)
+                index_lookups.inc(result="hit")
+                if cached[1] == tombstoned_at:
+                    return cached[2]
+
+        if cached is not None and cached[0] == mtime:
+            # only the tombstones changed: recompute the mask, the mapped files stay as they are
+            tombstoned_at, owners = self._tombstones(directory)
+            cached[2].apply_tombstones(owners)
+            with self._lock:
+                if bot_key in self._indexes:
+                    self._indexes[bot_key] = (mtime, tombstoned_at, cached[2], cached[3])
+            return cached[2]
+
+        index_lookups.inc(result="miss")
+        opened = self._open(directory)
+        index = opened[0] if opened is not None else None
+        if index is not None:
+            tombstoned_at, owners = self._tombstones(directory)
+            index.apply_tombstones(owners)
+        with self._lock:
+            self._forget(bot_key)
+            if index is not None:
+                self._indexes[bot_key] = (mtime, tombstoned_at, index, opened[1])
+                self._resident += index.nbytes
+                while self.memory_budget is not None and self._resident > self.memory_budget and len(self._indexes) > 1:
+                    self._forget(next(iter(self._indexes)))
+                    index_evictions.inc()
+            self._publish_residency()
+        return index
+
+
+    @contextmanager
+    def _locked(self, bot_id, name: str = ".lock", blocking: bool = True):
+        directory = self._dir(bot_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / name, "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield None
+                return
+            try:
+                yield directory
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+    @staticmethod
+    def _staging(directory: Path) -> dict:
+        try:
+            return json.loads((directory / "staging.json").read_text())
+        except FileNotFoundError:
+            return {"version": None, "pending": 0, "publish": False, "replace": False}
+
+
+    @staticmethod
+    def _write_json(path: Path, data) -> None:
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, path)
+
+
+    def _published(self, bot_id, name: str) -> None:
+        self._write_json(self._dir(bot_id) / "manifest.json", {"version": int(name[1:]), "dir": name})
+        with self._lock:
+            self._forget(str(bot_id))
+            self._publish_residency()
+        publishes.inc()
+        if self.on_publish is not None:
+            self.on_publish(str(bot_id), int(name[1:]))
+
+
+    def _next_version(self, directory: Path) -> int:
+        # never reuses a number while its directory exists, including staged and leased ones
+        return max((int(path.name[1:]) for path in directory.glob("v*") if path.name[1:].isdigit()), default=0) + 1
+
+
+    def _collect(self, directory: Path) -> None:
+        # caller holds the writer lock, so no version directory is half-registered
+        try:
+            keep = {json.loads((directory / "manifest.json").read_text())["dir"]}
+        except FileNotFoundError:
+            keep = set()
+        keep.add(self._staging(directory)["version"])
+        for path in directory.glob("v*"):
+            if not path.is_dir() or path.name in keep:
+                continue
+            readers = path / ".readers"
+            if readers.is_dir() and any(_lease_live(lease) for lease in readers.iterdir()):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            versions_collected.inc()
+
+
+    def collect(self, bot_id) -> None:
+        """Removes unused versions unless a writer is busy with the bot (it collects when it finishes)."""
+        with self._locked(bot_id, blocking=False) as directory:
+            if directory is not None:
+                self._collect(directory)
+
+
+    def _rebuild(self, index: BotIndex) -> None:
+        # rows past what the keyword, quantized and ANN indexes cover are appended to them;
+        # BM25 statistics, codebooks and clusters are refit only once the bot has grown enough
+        keywords = index.keywords
+        if keywords is None or len(keywords) > len(index):
+            index.keywords = Bm25Index.build(index.texts)
+        elif len(index) > len(keywords):
+            index.keywords = keywords.extend(
+                [index.texts[i] for i in range(len(keywords), len(index))],
+                refit=len(index) > keywords.fitted_docs * self.refit_growth,
+            )
+        index.quantize(self.quantization, self.pq_subspaces, self.refit_growth)
+        index.index_ann(self.ann, self.ann_min_rows, self.ivf_lists, self.ivf_retrain_growth)
+
+
+    def _writable(self, directory: Path, staged: bool) -> BotIndex:
+        """The index a write starts from: the staged version, or the published one."""
+        name = None
+        if staged:
+            staging = self._staging(directory)
+            name = staging["version"]
+            if name is None and staging["replace"]:
+                return BotIndex(self.dim)
+        if name is None:
+            try:
+                name = json.loads((directory / "manifest.json").read_text())["dir"]
+            except FileNotFoundError:
+                return BotIndex(self.dim)
+        with self._lock:
+            cached = self._written.pop(directory.name, None)
+        # this process wrote that version last: reuse it in memory instead of mapping and copying it again
+        # (the inode tells a version number reused after its directory was collected apart)
+        if cached is not None and cached[0] is not None and cached[0] == self._identity(directory, name):
+            return cached[1]
+        return BotIndex.load(directory, name) or BotIndex(self.dim)
+
+
+    @staticmethod
+    def _identity(directory: Path, name: str) -> tuple[str, int] | None:
+        try:
+            return name, (directory / name).stat().st_ino
+        except FileNotFoundError:
+            return None
+
+
+    def add(self, bot_id, vectors: np.ndarray, texts: list[str], sources: list[str], owners: list[str] | None = None,
+            staged: bool = False, kinds: list[str] | None = None) -> IngestReport:
+        """Adds chunks and publishes the result, or with `staged` adds them to the bot's next version."""
+        with self._locked(bot_id) as directory:
+            index = self._writable(directory, staged)
+            signatures = None
+            if self.dedup_threshold > 0:
+                if index.signatures is None and len(index):
+                    # indexed before dedup was enabled
+                    index.signatures = self.hasher.signatures(index.texts)
+                signatures = self.hasher.signatures(texts)
+            kept = index.add(vectors, texts, sources, owners, signatures, self.dedup_threshold, kinds)
+            self._rebuild(index)
+            name = index.save(directory, self._next_version(directory))
+            with self._lock:
+                self._written[directory.name] = (self._identity(directory, name), index)
+                while len(self._written) > _WRITTEN_KEPT:
+                    self._written.popitem(last=False)
+            if staged:
+                with self._locked(bot_id, ".staging.lock"):
+                    staging = self._staging(directory)
+                    staging["version"] = name
+                    self._write_json(directory / "staging.json", staging)
+            else:
+                self._published(bot_id, name)
+            self._collect(directory)
+
+        merged = np.flatnonzero(~kept)
+        saved = sum(len(texts[i].encode("utf-8")) for i in merged) + len(merged) * vectors[:1].nbytes
+        ingested_chunks.inc(int(kept.sum()), result="kept")
+        ingested_chunks.inc(len(merged), result="merged")
+        dedup_saved_bytes.inc(saved)
+        return IngestReport(len(texts), len(merged), saved)
+
+
+    def expect(self, bot_id, replace: bool = False) -> None:
+        """Counts one more document towards the bot's staged version; `replace` starts a new staging from an empty index."""
+        with self._locked(bot_id, ".staging.lock") as directory:
+            staging = self._staging(directory)
+            if staging["version"] is None and not staging["pending"]:
+                staging["replace"] = replace
+            staging["pending"] += 1
+            self._write_json(directory / "staging.json", staging)
+
+
+    def _release(self, bot_id, done: bool) -> int | None:
+        with self._locked(bot_id, ".staging.lock") as directory:
+            staging = self._staging(directory)
+            if done:
+                staging["pending"] = max(staging["pending"] - 1, 0)
+            else:
+                staging["publish"] = True
+            if staging["pending"] or not staging["publish"]:
+                if staging["pending"] or staging["version"] is not None:
+                    self._write_json(directory / "staging.json", staging)
+                return None
+            (directory / "staging.json").unlink(missing_ok=True)
+            if staging["version"] is not None:
+                self._published(bot_id, staging["version"])
+        self.collect(bot_id)
+        return None if staging["version"] is None else int(staging["version"][1:])
+
+
+    def finish_staged(self, bot_id) -> int | None:
+        """Marks one expected document as indexed (or failed); publishes if that was the last one and a publish was requested."""
+        return self._release(bot_id, done=True)
+
+
+    def publish(self, bot_id) -> int | None:
+        """Swaps the staged version in now, or once the pending documents are indexed; returns the version published now."""
+        return self._release(bot_id, done=False)
+
+
+    def discard(self, bot_id) -> None:
+        with self._locked(bot_id, ".staging.lock") as directory:
+            (directory / "staging.json").unlink(missing_ok=True)
+        self.collect(bot_id)
+
+
+    def tombstone(self, bot_id, owners: list[str]) -> None:
+        """Hides the chunks of `owners` (file ids) from searches; takes effect on readers' next lookup."""
+        # a lock of its own, so archiving never waits for an indexing or compaction run
+        with self._locked(bot_id, ".tombstones.lock") as directory:
+            _, current = self._tombstones(directory)
+            self._write_json(directory / "tombstones.json", sorted(current | set(owners)))
+
+
+    def compact(self, bot_id) -> int:
+        """Rewrites the bot's index without its tombstoned chunks; returns how many were dropped."""
+        with self._locked(bot_id) as directory:
+            index = BotIndex.load(directory)
+            if index is None:
+                return 0
+            index.apply_tombstones(self._tombstones(directory)[1])
+            removed = index.tombstoned
+            if not removed:
+                return 0
+            index = index.compacted()
+            self._rebuild(index)
+            self._published(bot_id, index.save(directory, self._next_version(directory)))
+            self._collect(directory)
+        compactions.inc()
+        return removed
+
+
+    def delete(self, bot_id) -> None:
+        with self._locked(bot_id) as directory:
+            for path in directory.iterdir():
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                elif path.name not in (".lock", ".tombstones.lock", ".staging.lock"):
+                    path.unlink(missing_ok=True)
+        with self._lock:
+            self._forget(str(bot_id))
+            self._written.pop(str(bot_id), None)
+            self._publish_residency()
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+def pack_strings(values) -> tuple[np.ndarray, np.ndarray]:
+    if isinstance(values, PackedStrings):
+        return values.blob, values.offsets
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class PackedStrings:
+    """Read-only string table over a UTF-8 blob and its offsets; items are decoded on access."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self.blob = blob
+        self.offsets = offsets
+
+
+    @classmethod
+    def of(cls, values) -> "PackedStrings":
+        return values if isinstance(values, cls) else cls(*pack_strings(values))
+
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+    def extended(self, values) -> "PackedStrings":
+        """A table of these strings followed by `values`; only the new strings are encoded."""
+        blob, offsets = pack_strings(values)
+        return PackedStrings(np.concatenate([self.blob, blob]), np.concatenate([self.offsets, offsets[1:] + self.offsets[-1]]))
@@ -1,5 +1,6 @@
 from uuid import UUID
-from fastapi import APIRouter, UploadFile, File, Form, Depends, status, Header, Request, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Depends, status, Header, Request, Response, HTTPException
+from fastapi.responses import StreamingResponse
 from src.dependencies import redis_dependency
 from src.rate_limiter import limiter
 from src.auth_bearer import user_dependency
@@ -7,6 +8,7 @@ from src.database import db_dependency
 from src.chahtbot.service import KnowledgebaseService, ChatbotService
 from src.chahtbot.dependencies import knowledgebase_dependency, chatbot_dependency, bot_widget_dependency
 from src.chahtbot import schemas
+from src.chahtbot.utils import ChatbotUtils
 from strip_markdown import strip_markdown
 
 
@@ -48,8 +50,11 @@ def chatbot_form(
 
 @router.post("/send-msg")
 async def send_chat_message(data: schemas.MessageRequest, chat_repo: chatbot_dependency,
-        request: Request, redis: redis_dependency):
-    status, msg = await ChatbotService.send_msg(data, chat_repo, request, redis)
+        request: Request, response: Response, redis: redis_dependency):
+    timings: dict = {}
+    status, msg = await ChatbotService.send_msg(data, chat_repo, request, redis, timings)
+    if timings:
+        response.headers["Server-Timing"] = ChatbotUtils.server_timing(timings)
     return {
             "status_code": status,
 
@@ -58,6 +63,24 @@ async def send_chat_message(data: schemas.MessageRequest, chat_repo: chatbot_dep
         }
 
 
+@router.post("/send-msg/stream")
+async def stream_chat_message(data: schemas.MessageRequest, chat_repo: chatbot_dependency,
+        request: Request, redis: redis_dependency):
+    timings: dict = {}
+    tokens = await ChatbotService.stream_msg(data, chat_repo, request, redis, timings)
+    headers = {"Server-Timing": ChatbotUtils.server_timing(timings)} if timings else {}
+
+    # SSE by default, newline-delimited JSON for clients that can't consume event streams
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(ChatbotUtils.ndjson_events(tokens), media_type="application/x-ndjson", headers=headers)
+
+    return StreamingResponse(
+        ChatbotUtils.sse_events(tokens),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **headers},
+    )
+
+
 
 @router.post("/chatbots", status_code=status.HTTP_201_CREATED)
 async def create_chatbot(chat_repo: chatbot_dependency, current_user: user_dependency,
@@ -73,6 +96,24 @@ async def list_my_bots(current_user: user_dependency, repo_dep: chatbot_dependen
     return my_bots
 
 
+@router.get("/chatbots/{bot_id}/answer-cache", response_model=schemas.AnswerCacheStatsOut)
+async def answer_cache_stats(bot_id: UUID, current_user: user_dependency, chat_repo: chatbot_dependency,
+        redis: redis_dependency):
+    return await ChatbotService.get_answer_cache_stats(bot_id, current_user, chat_repo, redis)
+
+
+@router.put("/chatbots/{bot_id}/retrieval-weights", response_model=schemas.RetrievalWeightsOut)
+async def update_retrieval_weights(bot_id: UUID, data: schemas.RetrievalWeightsUpdate, current_user: user_dependency,
+        chat_repo: chatbot_dependency, redis: redis_dependency):
+    return await ChatbotService.update_retrieval_weights(bot_id, data, current_user, chat_repo, redis)
+
+
+@router.put("/chatbots/{bot_id}/retrieval-filter", response_model=schemas.RetrievalFilterOut)
+async def update_retrieval_filter(bot_id: UUID, data: schemas.RetrievalFilterUpdate, current_user: user_dependency,
+        chat_repo: chatbot_dependency, redis: redis_dependency):
+    return await ChatbotService.update_retrieval_filter(bot_id, data, current_user, chat_repo, redis)
+
+
 @router.post("/knowledge_base/upload")
 async def upload_knowledge_base(current_user: user_dependency, repo_deb: knowledgebase_dependency, file: UploadFile = File(...)):
     result = await KnowledgebaseService.upload_knowledgebase_files(current_user, await file.read(), file.filename, file.content_type, repo_deb) #type:ignore
@@ -113,7 +154,8 @@ async def convert_to_md(file: UploadFile = File(...)):
 async def n8n_chatbot_status(
     chat_repo: chatbot_dependency,
     request: Request,
+    redis: redis_dependency,
     x_n8n_signature: str = Header(...),
 ):
-    await ChatbotService.chatbot_webhook(request, x_n8n_signature, chat_repo)
+    await ChatbotService.chatbot_webhook(request, x_n8n_signature, chat_repo, redis)
     
\ No newline at end of file
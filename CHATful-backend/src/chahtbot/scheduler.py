@@ -0,0 +1,223 @@
+import asyncio, math, time
+from collections import deque
+from contextlib import asynccontextmanager
+from uuid import UUID
+from fastapi import HTTPException, status
+from src.billing.models import PlanTier
+from src.config import settings
+from src.metrics import metrics
+
+
+queue_depth = metrics.gauge("chatbot_upstream_queue_depth", "Chat requests waiting for an upstream slot.", ("tier",))
+in_flight = metrics.gauge("chatbot_upstream_in_flight", "Chat requests currently holding an upstream slot.")
+queue_wait = metrics.histogram("chatbot_upstream_queue_wait_seconds", "Time spent waiting for an upstream slot.", ("tier",))
+shed_total = metrics.counter("chatbot_upstream_shed_total", "Chat requests rejected by upstream admission control.", ("tier", "reason"))
+
+
+class _Waiter:
+    __slots__ = ("bot_id", "tier", "start", "finish", "future", "enqueued_at")
+
+    def __init__(self, bot_id: str, tier: PlanTier, start: float, finish: float) -> None:
+        self.bot_id = bot_id
+        self.tier = tier
+        self.start = start
+        self.finish = finish
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class _Slot:
+    """A granted upstream slot; `release` may be called more than once."""
+
+    def __init__(self, scheduler: "UpstreamScheduler", bot_key: str) -> None:
+        self.scheduler = scheduler
+        self.bot_key = bot_key
+        self.started = time.monotonic()
+        self.released = False
+
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        scheduler = self.scheduler
+        scheduler._service_time = 0.8 * scheduler._service_time + 0.2 * (time.monotonic() - self.started)
+        scheduler.release(self.bot_key)
+
+
+class UpstreamScheduler:
+    """
+    Admission control for upstream LLM calls.
+
+    At most `max_concurrency` calls run at once, and at most
+    `per_bot_concurrency` for a single bot. Extra requests wait in per-bot FIFO
+    queues. Free slots go to the waiting bot with the smallest virtual finish
+    tag (start-time fair queueing). Each request advances its bot's tag by
+    1 / tier weight, so under contention a VIP bot gets proportionally more slots
+    than a FREE one, and no bot is starved. Requests are shed with 429 when the
+    queue is full or the wait exceeds `max_wait`. Limits apply per worker process.
+    """
+
+    def __init__(self, max_concurrency: int, per_bot_concurrency: int, max_queue: int, max_wait: float, weights: dict[PlanTier, float]) -> None:
+        self.max_concurrency = max_concurrency
+        self.per_bot_concurrency = per_bot_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.weights = weights
+
+        self._active = 0
+        self._active_per_bot: dict[str, int] = {}
+        self._queues: dict[str, deque[_Waiter]] = {}
+        self._queued = 0
+        self._virtual_time = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._service_time = 1.0
+
+
+    @asynccontextmanager
+    async def slot(self, bot_id: UUID, tier: PlanTier = PlanTier.FREE):
+        held = await self.hold(bot_id, tier)
+        try:
+            yield
+        finally:
+            held.release()
+
+
+    async def hold(self, bot_id: UUID, tier: PlanTier = PlanTier.FREE) -> _Slot:
+        """Acquire a slot that outlives the caller, e.g. for a response body streamed later."""
+        bot_key = str(bot_id)
+        await self.acquire(bot_key, tier)
+        return _Slot(self, bot_key)
+
+
+    def try_hold(self, bot_id: UUID, tier: PlanTier = PlanTier.FREE) -> _Slot | None:
+        """A slot if one is free right now (nobody queued, limits not reached), else None; never waits."""
+        bot_key = str(bot_id)
+        if self._queued or not self._has_capacity(bot_key):
+            return None
+        self._grant(bot_key)
+        queue_wait.observe(0.0, tier=tier.name)
+        return _Slot(self, bot_key)
+
+
+    async def acquire(self, bot_key: str, tier: PlanTier) -> None:
+        if self._queued == 0 and self._has_capacity(bot_key):
+            self._grant(bot_key)
+            queue_wait.observe(0.0, tier=tier.name)
+            return
+
+        if self._queued >= self.max_queue:
+            self._shed(tier, "queue_full")
+
+        waiter = self._enqueue(bot_key, tier)
+        self._dispatch()
+
+        try:
+            await asyncio.wait((waiter.future,), timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        if not waiter.future.done():
+            self._abandon(waiter)
+            self._shed(tier, "timeout")
+
+        queue_wait.observe(time.monotonic() - waiter.enqueued_at, tier=tier.name)
+
+
+    def release(self, bot_key: str) -> None:
+        self._active -= 1
+        in_flight.dec()
+        remaining = self._active_per_bot.get(bot_key, 1) - 1
+        if remaining > 0:
+            self._active_per_bot[bot_key] = remaining
+        else:
+            self._active_per_bot.pop(bot_key, None)
+            if bot_key not in self._queues and self._last_finish.get(bot_key, 0.0) <= self._virtual_time:
+                self._last_finish.pop(bot_key, None)
+
+        self._dispatch()
+        if not self._active and not self._queued:
+            self._last_finish.clear()
+
+
+    def _has_capacity(self, bot_key: str) -> bool:
+        return self._active < self.max_concurrency and self._active_per_bot.get(bot_key, 0) < self.per_bot_concurrency
+
+
+    def _grant(self, bot_key: str) -> None:
+        self._active += 1
+        self._active_per_bot[bot_key] = self._active_per_bot.get(bot_key, 0) + 1
+        in_flight.inc()
+
+
+    def _enqueue(self, bot_key: str, tier: PlanTier) -> _Waiter:
+        start = max(self._virtual_time, self._last_finish.get(bot_key, 0.0))
+        finish = start + 1.0 / self.weights.get(tier, 1.0)
+        self._last_finish[bot_key] = finish
+
+        waiter = _Waiter(bot_key, tier, start, finish)
+        self._queues.setdefault(bot_key, deque()).append(waiter)
+        self._queued += 1
+        queue_depth.inc(tier=tier.name)
+        return waiter
+
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.bot_id]
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.bot_id]
+        self._queued -= 1
+        queue_depth.dec(tier=waiter.tier.name)
+
+
+    def _dispatch(self) -> None:
+        while self._queued and self._active < self.max_concurrency:
+            best = None
+            for bot_key, queue in self._queues.items():
+                if self._active_per_bot.get(bot_key, 0) >= self.per_bot_concurrency:
+                    continue
+                if best is None or queue[0].finish < best.finish:
+                    best = queue[0]
+
+            if best is None:
+                return
+
+            self._dequeue(best)
+            self._virtual_time = max(self._virtual_time, best.start)
+            self._grant(best.bot_id)
+            best.future.set_result(None)
+
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        if waiter.future.done():
+            # the slot was granted while the caller was leaving
+            self.release(waiter.bot_id)
+            return
+        self._dequeue(waiter)
+        waiter.future.cancel()
+
+
+    def _shed(self, tier: PlanTier, reason: str):
+        shed_total.inc(tier=tier.name, reason=reason)
+        retry_after = max(1, math.ceil(self._service_time * (self._queued + 1) / self.max_concurrency))
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="The assistant is busy, please try again shortly",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+
+upstream_scheduler = UpstreamScheduler(
+    max_concurrency=settings.upstream_max_concurrency,
+    per_bot_concurrency=settings.upstream_per_bot_concurrency,
+    max_queue=settings.upstream_max_queue,
+    max_wait=settings.upstream_max_queue_wait,
+    weights={
+        PlanTier.FREE: settings.upstream_weight_free,
+        PlanTier.PRO: settings.upstream_weight_pro,
+        PlanTier.VIP: settings.upstream_weight_vip,
+    },
+)
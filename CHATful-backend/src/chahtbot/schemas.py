@@ -2,7 +2,7 @@ from uuid import UUID
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional, Literal, List
 from urllib.parse import urlparse
-from src.chahtbot.models import BotStatus
+from src.chahtbot.models import BotStatus, FileStatus
 
 Position = Literal["bottom-left", "bottom-right"]
 
@@ -77,4 +77,36 @@ class WidgetSettingsUpdate(BaseModel):
 
 
 class WidgetSettingsOut(WidgetSettingsUpdate):
-    bot_id: UUID
\ No newline at end of file
+    bot_id: UUID
+
+
+class RetrievalWeightsUpdate(BaseModel):
+    keyword: float = Field(default=1.0, ge=0, le=10)
+    vector: float = Field(default=1.0, ge=0, le=10)
+
+
+class RetrievalWeightsOut(RetrievalWeightsUpdate):
+    bot_id: UUID
+
+
+class RetrievalFilterUpdate(BaseModel):
+    files: Optional[List[UUID]] = None
+    source_types: Optional[List[Literal["file", "webpage", "website"]]] = None
+    statuses: List[FileStatus] = Field(default_factory=lambda: [FileStatus.ACTIVE], min_length=1)
+
+
+class RetrievalFilterOut(RetrievalFilterUpdate):
+    bot_id: UUID
+
+
+class AnswerCacheStatsOut(BaseModel):
+    hits: int
+    near_hits: int
+    misses: int
+    hit_rate: float
+    entries: int
+    bytes: int
+    evictions: int
+    stale_hits: int
+    stale_entries: int
+    stale_bytes: int
@@ -1,13 +1,26 @@
-import httpx
+import time, weakref
 from uuid import UUID
-import fitz
-import pymupdf4llm
-from io import BytesIO
+from datetime import datetime, timezone
 from fastapi import HTTPException, status, UploadFile
 from fastapi.concurrency import run_in_threadpool
 from src.config import settings
+from src.http_clients import http_clients
 from src.chahtbot.repository import KnowledgebaseRepository, ChatbotRepository, BotWidgetRepository
-from src.chahtbot.utils import N8N, ChatbotUtils
+from src.chahtbot.utils import N8N, ChatbotUtils, MarkdownStreamStripper
+from src.chahtbot.answer_cache import AnswerCache
+from src.chahtbot.singleflight import chat_singleflight
+from src.chahtbot.settings_cache import chatbot_settings_cache
+from src.chahtbot.scheduler import upstream_scheduler
+from src.chahtbot.conversations import ConversationStore
+from src.chahtbot.transcripts import transcript_writer
+from src.resilience import n8n_breaker
+from src.chahtbot.retrieval.engine import retrieval_engine
+from src.chahtbot.retrieval.hybrid import hybrid_search
+from src.chahtbot.retrieval.packing import pack_context
+from src.chahtbot.retrieval.filters import ChunkFilter
+from src.chahtbot.pdf import pdf_to_markdown
+from src.chahtbot.tasks import index_document_task, index_file_task, compact_index_task
+from src.billing.models import PlanTier
 from src.auth.models import User
 from src.chahtbot.models import BotStatus
 
@@ -16,6 +29,11 @@ from src.chahtbot.models import BotStatus
 
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_TYPES = {"application/pdf"}
+CONTEXT_TOKENS = {
+    PlanTier.FREE: settings.retrieval_context_tokens_free,
+    PlanTier.PRO: settings.retrieval_context_tokens_pro,
+    PlanTier.VIP: settings.retrieval_context_tokens_vip,
+}
 
 
 class KnowledgebaseService:
@@ -28,8 +46,8 @@ class KnowledgebaseService:
         files = {"Upload_PDF": (filename, file, content_type)}
         data = {"user_id": str(user.id), "filename": filename}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(settings.n8n_webhook_knowledgebase, files=files, data=data)
+        client = http_clients.get("n8n")
+        response = await client.post(settings.n8n_webhook_knowledgebase, files=files, data=data)
 
 
     @staticmethod
@@ -38,6 +56,12 @@ class KnowledgebaseService:
         if not user.id == file.user_id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You can't delete this file")
         await repo.archive_file(file)
+
+        if settings.retrieval_mode != "n8n":
+            # archived chunks disappear from local retrieval at once; the index is only rewritten in the background
+            tombstoned = await run_in_threadpool(retrieval_engine.archive_file, file.bot_id, file.id)
+            if tombstoned >= settings.retrieval_compaction_ratio:
+                compact_index_task.delay(str(file.bot_id))
         return True
         
 
@@ -71,6 +95,15 @@ class ChatbotService:
             
             if len(file_bytes) > MAX_FILE_SIZE:
                 raise HTTPException(status_code=400, detail="File too large")
+
+            if settings.retrieval_mode != "n8n":
+                # the file's row lets archiving and retrieval filters find its chunks
+                kb_file = await bot_repo.add_knowledgebase_file(user_id=user.id, bot_id=bot.id, filename=file.filename)
+                # published with the rest of the bot's documents on the ingestion completed event
+                await run_in_threadpool(retrieval_engine.store.expect, str(bot.id))
+                # the worker converts the upload; only its path goes through the broker
+                path = await run_in_threadpool(retrieval_engine.store.save_upload, str(kb_file.id), file_bytes)
+                index_file_task.delay(str(bot.id), path, file.filename, str(kb_file.id), True, "file")
             
             await N8N.send_to_n8n(
                 source_type="file",
@@ -93,13 +126,192 @@ class ChatbotService:
 
         
     @staticmethod
-    async def send_msg(data, bot_repo: ChatbotRepository, request, redis):        
-        settings = await ChatbotUtils.get_chatbot_settings_cached(data.bot_id, bot_repo, redis)
-        ChatbotUtils.ensure_origin_allowed(ChatbotUtils.extract_origin(request), settings["allowed_hosts"])
-        status, msg = await N8N.send_msg_to_n8n(data.message, data.bot_id)
+    async def send_msg(data, bot_repo: ChatbotRepository, request, redis, timings: dict | None = None):
+        bot_settings = await ChatbotUtils.get_chatbot_settings_cached(data.bot_id, bot_repo, redis)
+        ChatbotUtils.ensure_origin_allowed(ChatbotUtils.extract_origin(request), bot_settings["origin_matcher"])
+
+        started = time.perf_counter()
+        follow_up = await ConversationStore.exists(redis, data.bot_id, data.visitor_id)
+        history = await ConversationStore.history(redis, data.bot_id, data.visitor_id) if follow_up else []
+        tier = PlanTier(bot_settings.get("tier", PlanTier.FREE))
+        weights = ChatbotService._retrieval_weights(bot_settings)
+        chunk_filter = ChunkFilter.parse(bot_settings.get("retrieval_filter"))
+
+        try:
+            # Follow-up questions depend on the conversation, so only opening
+            # questions are answered from the cache or coalesced across visitors.
+            if follow_up:
+                n8n_breaker.check()
+                context = await ChatbotService._local_context(data.bot_id, data.message, weights, tier, timings, chunk_filter)
+                async with upstream_scheduler.slot(data.bot_id, tier):
+                    status, msg = await N8N.ask_n8n(data.message, data.bot_id, data.visitor_id, history, context, tier)
+            else:
+                status, msg = await ChatbotService._first_turn_answer(data, redis, tier, weights, timings, chunk_filter)
+        except HTTPException as e:
+            # n8n down or circuit open: an old answer beats an error for an opening question
+            stale = None
+            if e.status_code >= 500 and not follow_up:
+                stale = await AnswerCache.get_stale(redis, data.bot_id, data.message)
+            if stale is None:
+                await ChatbotService._record_transcript(data, None, e.status_code, started)
+                raise
+            status, msg = 200, stale
+
+        answered = status == 200 and isinstance(msg, str) and msg != "No message found"
+        if answered:
+            await ConversationStore.append(redis, data.bot_id, data.visitor_id, ("user", data.message), ("assistant", msg))
+        await ChatbotService._record_transcript(data, msg if answered else None, status, started)
         return status, msg
 
 
+    @staticmethod
+    def _retrieval_weights(bot_settings: dict) -> dict[str, float]:
+        return {
+            "keyword": settings.retrieval_keyword_weight,
+            "vector": settings.retrieval_vector_weight,
+            **(bot_settings.get("retrieval_weights") or {}),
+        }
+
+
+    @staticmethod
+    async def _local_context(bot_id: UUID, message: str, weights: dict[str, float], tier: PlanTier = PlanTier.FREE,
+                             timings: dict | None = None, chunk_filter: ChunkFilter | None = None) -> str | None:
+        # None keeps retrieval in the n8n workflow (retrieval_mode=n8n, bot not indexed locally or nothing found in time)
+        if settings.retrieval_mode == "n8n":
+            return None
+
+        if settings.retrieval_mode == "hybrid":
+            hits = await hybrid_search(
+                retrieval_engine, bot_id, message, settings.retrieval_mmr_candidates, weights,
+                settings.retrieval_deadline_ms / 1000, settings.retrieval_rrf_k, timings, chunk_filter,
+            )
+        else:
+            started = time.perf_counter()
+            hits = await run_in_threadpool(retrieval_engine.search, bot_id, message, settings.retrieval_mmr_candidates, chunk_filter)
+            if timings is not None:
+                timings["vector"] = timings["retrieval"] = (time.perf_counter() - started) * 1000
+
+        if not hits:
+            return None
+
+        # more candidates than passages are retrieved so MMR can pass over near-repeats
+        started = time.perf_counter()
+        packed = pack_context(hits, CONTEXT_TOKENS.get(tier, settings.retrieval_context_tokens_free),
+                              settings.retrieval_mmr_lambda, settings.retrieval_top_k)
+        if timings is not None:
+            timings["packing"] = (time.perf_counter() - started) * 1000
+            timings["context"] = f"tokens={packed.tokens} saved={packed.tokens_saved}"
+        return packed.text or None
+
+
+    @staticmethod
+    async def _record_transcript(data, answer: str | None, status_code: int, started: float, streamed: bool = False):
+        await transcript_writer.record({
+            "bot_id": data.bot_id,
+            "visitor_id": data.visitor_id,
+            "question": data.message,
+            "answer": answer,
+            "status_code": status_code,
+            "streamed": streamed,
+            "latency_ms": int((time.perf_counter() - started) * 1000),
+            "created_at": datetime.now(timezone.utc),
+        })
+
+
+    @staticmethod
+    async def _first_turn_answer(data, redis, tier: PlanTier, weights: dict[str, float], timings: dict | None = None,
+                                 chunk_filter: ChunkFilter | None = None):
+        cached, generation = await AnswerCache.get(redis, data.bot_id, data.message)
+        if cached is not None:
+            return 200, cached
+
+        async def fetch():
+            n8n_breaker.check()
+            context = await ChatbotService._local_context(data.bot_id, data.message, weights, tier, timings, chunk_filter)
+            async with upstream_scheduler.slot(data.bot_id, tier):
+                status, msg = await N8N.ask_n8n(data.message, data.bot_id, context=context, tier=tier)
+            if status == 200 and isinstance(msg, str) and msg != "No message found":
+                await AnswerCache.set(redis, data.bot_id, data.message, msg, generation)
+            return status, msg
+
+        if not settings.singleflight_enabled:
+            return await fetch()
+
+        key = f"{data.bot_id}:{AnswerCache.digest(AnswerCache.normalize(data.message))}"
+        return tuple(await chat_singleflight.do(key, fetch, redis))
+
+
+    @staticmethod
+    async def stream_msg(data, bot_repo: ChatbotRepository, request, redis, timings: dict | None = None):
+        # Origin checks run before the response starts so a 403 is still a plain HTTP error.
+        bot_settings = await ChatbotUtils.get_chatbot_settings_cached(data.bot_id, bot_repo, redis)
+        ChatbotUtils.ensure_origin_allowed(ChatbotUtils.extract_origin(request), bot_settings["origin_matcher"])
+
+        started = time.perf_counter()
+        follow_up = await ConversationStore.exists(redis, data.bot_id, data.visitor_id)
+        history = await ConversationStore.history(redis, data.bot_id, data.visitor_id) if follow_up else []
+        generation = None
+        if not follow_up:
+            cached, generation = await AnswerCache.get(redis, data.bot_id, data.message)
+            if cached is not None:
+                return ChatbotService._replay_answer(data, redis, cached, started)
+
+        if n8n_breaker.is_open:
+            stale = None if follow_up else await AnswerCache.get_stale(redis, data.bot_id, data.message)
+            if stale is not None:
+                return ChatbotService._replay_answer(data, redis, stale, started)
+            n8n_breaker.check()
+
+        tier = PlanTier(bot_settings.get("tier", PlanTier.FREE))
+        weights = ChatbotService._retrieval_weights(bot_settings)
+        chunk_filter = ChunkFilter.parse(bot_settings.get("retrieval_filter"))
+        context = await ChatbotService._local_context(data.bot_id, data.message, weights, tier, timings, chunk_filter)
+
+        # take the upstream slot before the response starts so shedding is still a 429 with Retry-After
+        held = await upstream_scheduler.hold(data.bot_id, tier)
+        tokens = ChatbotService._stream_answer(data, redis, history, generation, started, held, context)
+        weakref.finalize(tokens, held.release)  # a body that is never iterated must not keep the slot
+        return tokens
+
+
+    @staticmethod
+    async def _replay_answer(data, redis, answer: str, started: float):
+        stripper = MarkdownStreamStripper()
+        yield stripper.feed(answer) + stripper.flush()
+        await ConversationStore.append(redis, data.bot_id, data.visitor_id, ("user", data.message), ("assistant", answer))
+        await ChatbotService._record_transcript(data, answer, 200, started, streamed=True)
+
+
+    @staticmethod
+    async def _stream_answer(data, redis, history: list[dict], generation: int | None, started: float,
+                             held, context: str | None = None):
+        stripper = MarkdownStreamStripper()
+        chunks: list[str] = []
+        try:
+            async with n8n_breaker.guard():
+                async for chunk in N8N.stream_msg_from_n8n(data.message, data.bot_id, data.visitor_id, history, context):
+                    chunks.append(chunk)
+                    text = stripper.feed(chunk)
+                    if text:
+                        yield text
+        except HTTPException as e:
+            await ChatbotService._record_transcript(data, "".join(chunks) or None, e.status_code, started, streamed=True)
+            raise
+        finally:
+            held.release()
+
+        tail = stripper.flush()
+        if tail:
+            yield tail
+
+        if chunks:
+            answer = "".join(chunks)
+            await ConversationStore.append(redis, data.bot_id, data.visitor_id, ("user", data.message), ("assistant", answer))
+            if generation is not None:
+                await AnswerCache.set(redis, data.bot_id, data.message, answer, generation)
+        await ChatbotService._record_transcript(data, "".join(chunks) or None, 200, started, streamed=True)
+
+
     @staticmethod 
     async def get_bot_widget(bot_id, repo: BotWidgetRepository):
         widget = await repo.get_bot_widget(bot_id)
@@ -122,8 +334,41 @@ class ChatbotService:
         return settings
 
 
+    @staticmethod
+    async def get_answer_cache_stats(bot_id: UUID, user: User, bot_repo: ChatbotRepository, redis):
+        bot = await bot_repo.get_chatbot_for_user(bot_id, user.id)
+        if not bot:
+            raise HTTPException(status_code=404, detail="Bot not found")
+
+        return await AnswerCache.stats(redis, bot_id)
+
+
+    @staticmethod
+    async def update_retrieval_weights(bot_id: UUID, data, user: User, bot_repo: ChatbotRepository, redis):
+        bot = await bot_repo.get_chatbot_for_user(bot_id, user.id)
+        if not bot:
+            raise HTTPException(status_code=404, detail="Bot not found")
+
+        bot = await bot_repo.update_retrieval_weights(bot, data.model_dump())
+        await chatbot_settings_cache.invalidate(bot_id, redis)
+        return {"bot_id": bot.id, **bot.retrieval_weights}
+
+
+    @staticmethod
+    async def update_retrieval_filter(bot_id: UUID, data, user: User, bot_repo: ChatbotRepository, redis):
+        bot = await bot_repo.get_chatbot_for_user(bot_id, user.id)
+        if not bot:
+            raise HTTPException(status_code=404, detail="Bot not found")
+
+        bot = await bot_repo.update_retrieval_filter(bot, data.model_dump(mode="json"))
+        await chatbot_settings_cache.invalidate(bot_id, redis)
+        # cached answers were built from the context the old filter allowed
+        await AnswerCache.invalidate(redis, bot_id)
+        return {"bot_id": bot.id, **bot.retrieval_filter}
+
+
     @staticmethod 
-    async def chatbot_webhook(request, n8n_signature, bot_repo: ChatbotRepository):
+    async def chatbot_webhook(request, n8n_signature, bot_repo: ChatbotRepository, redis):
         raw = await request.body()
         await run_in_threadpool(N8N.verify_sig, raw, n8n_signature, "SECRET")
         payload = await request.json()
@@ -131,33 +376,31 @@ class ChatbotService:
         event_type = payload["type"]
 
         if event_type == "chatbot.ingestion.completed":
+            # swaps the re-ingested index in; deferred to the last indexing task if some are still queued
+            await run_in_threadpool(retrieval_engine.store.publish, str(bot_id))
             await bot_repo.update_chatbot_status(bot_id, BotStatus.ACTIVE)
+            await chatbot_settings_cache.invalidate(bot_id, redis)
+            await AnswerCache.invalidate(redis, bot_id)
+            return True
+
+        if event_type == "chatbot.document.ready":
+            # n8n hands back the text it scraped/converted so it can be indexed for local retrieval;
+            # documents are staged until the completion event, and "replace" rebuilds the index from scratch
+            await run_in_threadpool(retrieval_engine.store.expect, str(bot_id), bool(payload.get("replace")))
+            index_document_task.delay(
+                str(bot_id), payload["content"], payload.get("source") or "document", payload.get("file_id"), True,
+                payload.get("source_type"),
+            )
             return True
 
         if event_type == "chatbot.ingestion.failed":
+            await run_in_threadpool(retrieval_engine.store.discard, str(bot_id))
             await bot_repo.update_chatbot_status(bot_id, BotStatus.FAILED)
+            await chatbot_settings_cache.invalidate(bot_id, redis)
             return True
 
         
 
     @staticmethod
     async def convert_to_markdown(file_bytes: bytes):
-        doc = fitz.open(stream=BytesIO(file_bytes), filetype="pdf")
-
-        all_pages = []
-
-        for page_num in range(len(doc)):
-            # Create a temporary single-page document
-            single_page_doc = fitz.open()
-            single_page_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
-
-            markdown = pymupdf4llm.to_markdown(single_page_doc)
-
-            # Append only the page markdown, without page numbering
-            all_pages.append(markdown.strip())
-            single_page_doc.close()
-
-        doc.close()
-
-        final_markdown = "\n\n".join(all_pages)
-        return final_markdown
\ No newline at end of file
+        return await run_in_threadpool(pdf_to_markdown, file_bytes)
@@ -0,0 +1,150 @@
+import asyncio, json, time
+from collections import OrderedDict
+from uuid import UUID
+from src.config import settings
+from src.logging import get_logger
+from src.chahtbot.origins import OriginMatcher
+
+logger = get_logger("chatbot")
+
+
+class ChatbotSettingsCache:
+    """
+    Chat-path settings per bot: a bounded in-process LRU in front of Redis.
+
+    Redis keeps one hash per bot holding a version counter and the serialized
+    settings (tagged with the version they were loaded under). Invalidation bumps
+    the version, so a reader that loaded from Postgres before the change can't
+    write stale data back, and publishes the bot id so every worker drops its
+    local copy. Unknown bot ids are cached too (negative caching). Local entries
+    also carry the compiled OriginMatcher so it is built once per load.
+    """
+
+    SCHEMA_VERSION = 4
+    CHANNEL = "chatbot:settings:invalidate"
+
+    def __init__(self, max_entries: int, local_ttl: float, redis_ttl: int, negative_ttl: int) -> None:
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[str, tuple[float, dict | None]] = OrderedDict()
+        self._listener: asyncio.Task | None = None
+
+
+    @classmethod
+    def _key(cls, bot_id) -> str:
+        return f"chatbot:settings:v{cls.SCHEMA_VERSION}:{bot_id}"
+
+
+    @staticmethod
+    def serialize(chatbot, tier: int) -> dict:
+        return {
+            "allowed_hosts": chatbot.allowed_hosts,
+            "status": chatbot.status.value if chatbot.status else None,
+            "tier": int(tier),
+            "retrieval_weights": chatbot.retrieval_weights,
+            "retrieval_filter": chatbot.retrieval_filter,
+        }
+
+
+    def _remember(self, bot_id: str, value: dict | None, keep: bool = True) -> dict | None:
+        ttl = self.local_ttl if value is not None else min(self.local_ttl, self.negative_ttl)
+        if value is not None:
+            value = {**value, "origin_matcher": OriginMatcher(value["allowed_hosts"])}
+        if not keep:
+            return value
+        self._entries[bot_id] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(bot_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+
+    async def get(self, bot_id: UUID, bot_repo, redis) -> dict | None:
+        bot_key = str(bot_id)
+        entry = self._entries.get(bot_key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(bot_key)
+            return entry[1]
+
+        key = self._key(bot_key)
+        version, raw = await redis.hmget(key, "version", "data")
+        version = int(version or 0)
+        if raw is not None:
+            cached = json.loads(raw)
+            if cached["version"] == version:
+                return self._remember(bot_key, cached["settings"])
+
+        chatbot = await bot_repo.get_chatbot_by_id(bot_id)
+        value = None
+        if chatbot:
+            value = self.serialize(chatbot, await bot_repo.get_owner_plan_tier(chatbot.user_id))
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.hset(key, "data", json.dumps({"version": version, "settings": value}))
+        pipe.expire(key, self.redis_ttl if value is not None else self.negative_ttl)
+        pipe.hget(key, "version")
+        *_, current = await pipe.execute()
+        # invalidated while loading: the invalidation message may already have been handled,
+        # so answer this caller but don't keep the value locally
+        return self._remember(bot_key, value, keep=int(current or 0) == version)
+
+
+    async def invalidate(self, bot_id: UUID, redis) -> None:
+        bot_key = str(bot_id)
+        self._entries.pop(bot_key, None)
+
+        pipe = redis.pipeline(transaction=True)
+        pipe.hincrby(self._key(bot_key), "version", 1)
+        pipe.hdel(self._key(bot_key), "data")
+        pipe.expire(self._key(bot_key), self.redis_ttl)
+        pipe.publish(self.CHANNEL, bot_key)
+        await pipe.execute()
+
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+    def start(self, redis) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen(redis))
+
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+    async def _listen(self, redis) -> None:
+        while True:
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                # messages may have been missed while (re)connecting
+                self.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._entries.pop(message["data"], None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Chatbot settings invalidation listener failed, retrying error={e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+
+chatbot_settings_cache = ChatbotSettingsCache(
+    max_entries=settings.chatbot_settings_cache_size,
+    local_ttl=settings.chatbot_settings_local_ttl,
+    redis_ttl=settings.chatbot_settings_redis_ttl,
+    negative_ttl=settings.chatbot_settings_negative_ttl,
+)
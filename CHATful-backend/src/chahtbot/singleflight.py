@@ -0,0 +1,166 @@
+import asyncio, json
+from uuid import uuid4
+from typing import Any, Awaitable, Callable
+from fastapi import HTTPException, status
+from src.config import settings
+from src.logging import get_logger
+
+logger = get_logger("chatbot")
+
+
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls so they share one upstream request.
+
+    Inside a worker, callers with the same key await one shared task. Across
+    workers, a Redis lock elects a leader; the others subscribe to a channel
+    and receive the leader's result (or error) when it finishes. Results are
+    keyed by the leader's lock token so only that flight's followers see them.
+    """
+
+    def __init__(self, prefix: str, max_waiters: int, wait_timeout: float, lock_ttl: float, result_ttl: float) -> None:
+        self.prefix = prefix
+        self.max_waiters = max_waiters
+        self.wait_timeout = wait_timeout
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self._inflight: dict[str, _Call] = {}
+
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], redis=None) -> Any:
+        call = self._inflight.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(self._run(key, fn, redis)))
+            self._inflight[key] = call
+            call.task.add_done_callback(lambda task: self._forget(key, call))
+        elif call.waiters >= self.max_waiters:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many identical requests in flight",
+                headers={"Retry-After": "1"},
+            )
+
+        call.waiters += 1
+        try:
+            # shield: a caller disconnecting must not cancel the call the others are waiting on
+            return await asyncio.wait_for(asyncio.shield(call.task), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Timed out waiting for upstream")
+        finally:
+            call.waiters -= 1
+
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._inflight.get(key) is call:
+            del self._inflight[key]
+        if not call.task.cancelled():
+            call.task.exception()  # mark retrieved when every waiter timed out
+
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]], redis) -> Any:
+        if redis is None:
+            return await fn()
+
+        lock_key = f"{self.prefix}:{key}:lock"
+        token = uuid4().hex
+        while True:
+            if await redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                try:
+                    return await self._lead(key, token, fn, redis)
+                finally:
+                    await redis.eval(_RELEASE_LOCK, 1, lock_key, token)
+
+            # the lock holds the leader's token, which names the flight we follow
+            leader = await redis.get(lock_key)
+            if leader is not None:
+                return await self._follow(key, leader, fn, redis)
+
+
+    async def _lead(self, key: str, token: str, fn: Callable[[], Awaitable[Any]], redis) -> Any:
+        try:
+            result = await fn()
+        except HTTPException as e:
+            await self._publish(key, token, {"status_code": e.status_code, "detail": e.detail, "headers": e.headers}, redis)
+            raise
+        except Exception:
+            await self._publish(key, token, {"status_code": status.HTTP_502_BAD_GATEWAY, "detail": "Upstream request failed"}, redis)
+            raise
+
+        await self._publish(key, token, {"result": result}, redis)
+        return result
+
+
+    async def _publish(self, key: str, token: str, payload: dict, redis) -> None:
+        message = json.dumps({"token": token, **payload})
+        pipe = redis.pipeline(transaction=False)
+        if "result" in payload:
+            # only this flight's followers read it; errors go to live followers and are never replayed
+            pipe.set(f"{self.prefix}:{key}:result:{token}", message, px=int(self.result_ttl * 1000))
+        pipe.publish(f"{self.prefix}:{key}:done", message)
+        await pipe.execute()
+
+
+    @staticmethod
+    def _unpack(payload: dict) -> Any:
+        if "result" in payload:
+            return payload["result"]
+        raise HTTPException(status_code=payload["status_code"], detail=payload["detail"], headers=payload.get("headers"))
+
+
+    async def _follow(self, key: str, leader: str, fn: Callable[[], Awaitable[Any]], redis) -> Any:
+        lock_key = f"{self.prefix}:{key}:lock"
+        result_key = f"{self.prefix}:{key}:result:{leader}"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(f"{self.prefix}:{key}:done")
+        try:
+            # the leader may have finished between reading its token and the subscribe
+            cached = await redis.get(result_key)
+            if cached:
+                return self._unpack(json.loads(cached))
+
+            while (remaining := deadline - loop.time()) > 0:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(1.0, remaining))
+                if message:
+                    payload = json.loads(message["data"])
+                    if payload["token"] == leader:
+                        return self._unpack(payload)
+                    continue
+
+                if await redis.get(lock_key) != leader:
+                    cached = await redis.get(result_key)
+                    if cached:
+                        return self._unpack(json.loads(cached))
+                    logger.warning(f"Single-flight leader vanished key={key}, calling upstream directly")
+                    return await fn()
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Timed out waiting for upstream")
+
+
+
+chat_singleflight = SingleFlight(
+    prefix="chatbot:singleflight",
+    max_waiters=settings.singleflight_max_waiters,
+    wait_timeout=settings.singleflight_wait_timeout,
+    lock_ttl=settings.singleflight_lock_ttl,
+    result_ttl=settings.singleflight_result_ttl,
+)
@@ -0,0 +1,34 @@
+from loguru import logger
+from src.celery_app import celery_app
+from src.chahtbot.pdf import pdf_to_markdown
+from src.chahtbot.retrieval.engine import retrieval_engine
+
+
+@celery_app.task(name="index_document_task")
+def index_document_task(bot_id: str, text: str, source: str, file_id: str | None = None, staged: bool = False,
+                        source_type: str | None = None):
+    report = retrieval_engine.index_document(bot_id, text, source, file_id, staged, source_type)
+    logger.info(
+        f"Indexed bot_id={bot_id} source={source} chunks={report.chunks} merged={report.merged} "
+        f"dedup_ratio={report.dedup_ratio:.2%} bytes_saved={report.bytes_saved}"
+    )
+    return {"chunks": report.chunks, "merged": report.merged, "dedup_ratio": report.dedup_ratio, "bytes_saved": report.bytes_saved}
+
+
+@celery_app.task(name="index_file_task")
+def index_file_task(bot_id: str, path: str, source: str, file_id: str | None = None, staged: bool = False,
+                    source_type: str | None = None):
+    # the API parks the upload on the shared volume so the PDF neither crosses the broker nor blocks a request
+    try:
+        markdown = pdf_to_markdown(retrieval_engine.store.take_upload(path))
+    except Exception:
+        if staged:
+            # the announced document will never arrive; don't hold the bot's next version back
+            retrieval_engine.store.finish_staged(bot_id)
+        raise
+    return index_document_task(bot_id, markdown, source, file_id, staged, source_type)
+
+
+@celery_app.task(name="compact_index_task")
+def compact_index_task(bot_id: str):
+    return retrieval_engine.store.compact(bot_id)
@@ -0,0 +1,131 @@
+import asyncio, time
+from sqlalchemy import insert
+from src.config import settings
+from src.database import async_session
+from src.logging import get_logger
+from src.metrics import metrics
+from src.chahtbot.models import ChatTranscript
+
+logger = get_logger("chatbot")
+
+
+buffered = metrics.gauge("chat_transcripts_buffered", "Transcript rows waiting to be written.")
+written_total = metrics.counter("chat_transcripts_written_total", "Transcript rows written to Postgres.")
+dropped_total = metrics.counter("chat_transcripts_dropped_total", "Transcript rows that were not written.", ("reason",))
+flush_seconds = metrics.histogram("chat_transcripts_flush_seconds", "Time taken to write one batch of transcript rows.")
+
+
+class TranscriptWriter:
+    """
+    Write-behind buffer for chat transcripts.
+
+    Requests put rows on a bounded in-process queue. A background task flushes
+    them to Postgres as one multi-row INSERT per batch, when `batch_size` rows
+    are waiting or `flush_interval` seconds have passed. When the queue is full,
+    `record` waits briefly (backpressure) and then drops the row, so a slow
+    database never holds a chat request for long. `stop` drains what is left.
+    """
+
+    def __init__(self, max_buffer: int, batch_size: int, flush_interval: float, enqueue_timeout: float,
+                 drain_timeout: float, session_factory=async_session) -> None:
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.drain_timeout = drain_timeout
+        self.session_factory = session_factory
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+
+    async def record(self, row: dict) -> bool:
+        if self._queue is None:
+            return False
+
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(row), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                dropped_total.inc(reason="buffer_full")
+                return False
+
+        buffered.inc()
+        return True
+
+
+    def start(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.max_buffer)
+            self._worker = asyncio.create_task(self._run())
+
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+
+        queue, self._queue = self._queue, None
+        try:
+            # let the worker write what is buffered, then stop it
+            await asyncio.wait_for(queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Transcript buffer not drained on shutdown pending={queue.qsize()}")
+            dropped_total.inc(queue.qsize(), reason="shutdown")
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+
+    async def _run(self) -> None:
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+
+    async def _flush(self, batch: list[dict]) -> None:
+        started = time.perf_counter()
+        try:
+            async with self.session_factory() as session:
+                await session.execute(insert(ChatTranscript), batch)
+                await session.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Transcript flush failed rows={len(batch)} error={e}")
+            dropped_total.inc(len(batch), reason="flush_error")
+        else:
+            written_total.inc(len(batch))
+        finally:
+            buffered.dec(len(batch))
+            flush_seconds.observe(time.perf_counter() - started)
+
+
+
+transcript_writer = TranscriptWriter(
+    max_buffer=settings.transcript_buffer_size,
+    batch_size=settings.transcript_batch_size,
+    flush_interval=settings.transcript_flush_interval,
+    enqueue_timeout=settings.transcript_enqueue_timeout,
+    drain_timeout=settings.transcript_drain_timeout,
+)
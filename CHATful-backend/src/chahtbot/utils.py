@@ -1,47 +1,308 @@
-import httpx, hmac, hashlib, json
+import httpx, hmac, hashlib, json, re, time
 from uuid import UUID
 from fastapi import status, HTTPException, Request, UploadFile
 from src.config import settings
+from src.http_clients import http_clients
+from src.chahtbot.settings_cache import chatbot_settings_cache
+from src.chahtbot.origins import OriginMatcher, normalize_origin
+from src.resilience import n8n_breaker, n8n_latency, hedged
+from src.chahtbot.scheduler import upstream_scheduler
+from src.billing.models import PlanTier
 
 
 
 class ChatbotUtils:
     @staticmethod
     async def get_chatbot_settings_cached(bot_id: UUID, bot_repo, redis):
-        key = f"chatbot:settings:{bot_id}"
-        cached = await redis.get(key)
-        if cached:
-            print ("Cache hit for chatbot settings")
-            return json.loads(cached)
-        chatbot =  await bot_repo.get_chatbot_by_id(bot_id)
-        settings = {
-            "allowed_hosts": chatbot.allowed_hosts
-        }
-        await redis.set(key, json.dumps(settings), ex=600)  # Cache for 10 minutes
-        print ("Cache miss for chatbot settings")
-        return settings
+        bot_settings = await chatbot_settings_cache.get(bot_id, bot_repo, redis)
+        if bot_settings is None:
+            raise HTTPException(status_code=404, detail="Bot not found")
+        return bot_settings
 
 
     @staticmethod
     def extract_origin(request: Request) -> str | None:
-        return request.headers.get("origin") or request.headers.get("referer")
+        # Referer is a full URL; only its origin is comparable with allowed_hosts
+        return normalize_origin(request.headers.get("origin")) or normalize_origin(request.headers.get("referer"))
     
 
     @staticmethod
-    def ensure_origin_allowed(origin: str | None, allowed_hosts: list[str]):
-        if "*" in allowed_hosts:
+    def ensure_origin_allowed(origin: str | None, matcher: OriginMatcher):
+        if not matcher.matches(origin):
+            raise HTTPException(status_code=403, detail="Domain not allowed")
+
+
+    @staticmethod
+    def server_timing(timings: dict) -> str:
+        # durations in ms; a stage dropped at the retrieval deadline is reported without one, text entries as a description
+        return ", ".join(
+            f'{stage};desc="timeout"' if ms is None else f'{stage};desc="{ms}"' if isinstance(ms, str) else f"{stage};dur={ms:.2f}"
+            for stage, ms in timings.items()
+        )
+
+
+    @staticmethod
+    async def sse_events(tokens):
+        try:
+            async for text in tokens:
+                yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+        except HTTPException as e:
+            yield f"event: error\ndata: {json.dumps({'status_code': e.status_code, 'detail': e.detail})}\n\n"
             return
-        
-        if origin in allowed_hosts:
+        yield "event: done\ndata: {}\n\n"
+
+
+    @staticmethod
+    async def ndjson_events(tokens):
+        try:
+            async for text in tokens:
+                yield json.dumps({"type": "token", "text": text}) + "\n"
+        except HTTPException as e:
+            yield json.dumps({"type": "error", "status_code": e.status_code, "detail": e.detail}) + "\n"
             return
-        
-        if origin not in allowed_hosts:
-            raise HTTPException(status_code=403, detail="Domain not allowed")
+        yield json.dumps({"type": "done"}) + "\n"
         
         
 
 
 
+_FENCE = re.compile(r"[ \t]*(```|~~~)")
+_FENCE_PREFIX = re.compile(r"[ \t]*[`~]{0,2}")
+_MARKER_PREFIX = re.compile(r"[ \t]*[#>*+\-_`~\d.)]*[ \t]*")
+_HR = re.compile(r"[ \t]*([-*_])([ \t]*\1){2,}[ \t]*")
+_BLOCK_MARKER = re.compile(r"[ \t]*(?:#{1,6}(?:[ \t]+|$)|>[ \t]?|[-*+][ \t]+|\d{1,9}[.)][ \t]+)")
+_AUTOLINK = re.compile(r"(?:https?://|mailto:)[^\s<>]+")
+_HTML_TAG = re.compile(r"/?[A-Za-z][A-Za-z0-9-]*(?:\s[^<>]*)?/?")
+_ESCAPABLE = set("\\`*_{}[]()#+-.!<>|~")
+
+
+class MarkdownStreamStripper:
+    """
+    Incremental version of strip_markdown for streamed answers.
+    Text is held back only while a later chunk could still change how it
+    renders (an open link, a trailing emphasis run, an undecided line
+    marker), so markers split across chunk boundaries are stripped.
+    """
+
+    MAX_LOOKAHEAD = 256
+
+    def __init__(self) -> None:
+        self._line = ""
+        self._prev = ""
+        self._at_line_start = True
+        self._drop_line = False
+        self._in_code = False
+
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        self._line += chunk
+        while True:
+            newline = self._line.find("\n")
+            if newline == -1:
+                out.append(self._process(final=False))
+                break
+
+            rest = self._line[newline + 1:]
+            self._line = self._line[:newline].rstrip("\r")
+            out.append(self._process(final=True))
+            if not self._drop_line:
+                out.append("\n")
+            self._line = rest
+            self._reset_line()
+
+        return "".join(out)
+
+
+    def flush(self) -> str:
+        out = self._process(final=True)
+        self._line = ""
+        self._reset_line()
+        return out
+
+
+    def _reset_line(self) -> None:
+        self._prev = ""
+        self._at_line_start = True
+        self._drop_line = False
+
+
+    def _process(self, final: bool) -> str:
+        if self._at_line_start and not self._strip_line_prefix(final):
+            return ""
+
+        if self._drop_line:
+            self._line = ""
+            return ""
+
+        if self._in_code:
+            out, self._line = self._line, ""
+            return out
+
+        return self._strip_inline(final)
+
+
+    def _strip_line_prefix(self, final: bool) -> bool:
+        line = self._line
+
+        if self._in_code:
+            if not final and _FENCE_PREFIX.fullmatch(line):
+                return False
+            if _FENCE.match(line):
+                self._in_code = False
+                self._drop_line = True
+            self._at_line_start = False
+            return True
+
+        if not final and _MARKER_PREFIX.fullmatch(line):
+            return False
+
+        self._at_line_start = False
+        if _FENCE.match(line):
+            self._in_code = True
+            self._drop_line = True
+            return True
+
+        if _HR.fullmatch(line):
+            self._drop_line = True
+            return True
+
+        pos = 0
+        while True:
+            match = _BLOCK_MARKER.match(line, pos)
+            if not match or match.end() == pos:
+                break
+            pos = match.end()
+
+        self._line = line[pos:].lstrip(" \t")
+        return True
+
+
+    def _strip_inline(self, final: bool) -> str:
+        s = self._line
+        n = len(s)
+        i = 0
+        out = []
+
+        while i < n:
+            c = s[i]
+
+            if c == "\\":
+                if i + 1 == n:
+                    if not final:
+                        break
+                    out.append(c)
+                    i += 1
+                    continue
+                nxt = s[i + 1]
+                out.append(nxt if nxt in _ESCAPABLE else c + nxt)
+                self._prev = nxt
+                i += 2
+                continue
+
+            if c == "`":
+                i += 1
+                continue
+
+            if c in "*_":
+                j = i
+                while j < n and s[j] == c:
+                    j += 1
+                if j == n and not final:
+                    break
+                before = self._prev
+                after = s[j] if j < n else ""
+                intraword = c == "_" and before.isalnum() and after.isalnum()
+                flanking = (after and not after.isspace()) or (before and not before.isspace())
+                if intraword or not flanking:
+                    out.append(s[i:j])
+                self._prev = c
+                i = j
+                continue
+
+            if c == "!" or c == "[":
+                image = c == "!"
+                start = i + 1 if image else i
+                if image and (start == n or s[start] != "["):
+                    if start == n and not final:
+                        break
+                    out.append(c)
+                    self._prev = c
+                    i += 1
+                    continue
+
+                state, end, text = self._match_link(s, start, final)
+                if state == "hold":
+                    break
+                if state == "literal":
+                    out.append(s[i:start + 1])
+                    self._prev = "["
+                    i = start + 1
+                    continue
+                if not image:
+                    out.append(text)
+                self._prev = ")"
+                i = end
+                continue
+
+            if c == "<":
+                close = s.find(">", i + 1)
+                if close == -1:
+                    if not final and n - i < self.MAX_LOOKAHEAD:
+                        break
+                    out.append(c)
+                    self._prev = c
+                    i += 1
+                    continue
+                inner = s[i + 1:close]
+                if _AUTOLINK.fullmatch(inner):
+                    out.append(inner)
+                elif not _HTML_TAG.fullmatch(inner):
+                    out.append(c)
+                    self._prev = c
+                    i += 1
+                    continue
+                self._prev = ">"
+                i = close + 1
+                continue
+
+            out.append(c)
+            self._prev = c
+            i += 1
+
+        self._line = s[i:]
+        return "".join(out)
+
+
+    def _match_link(self, s: str, start: int, final: bool) -> tuple[str, int, str]:
+        n = len(s)
+        can_wait = not final and n - start < self.MAX_LOOKAHEAD
+
+        depth = 0
+        close = -1
+        for j in range(start, n):
+            if s[j] == "[":
+                depth += 1
+            elif s[j] == "]":
+                depth -= 1
+                if depth == 0:
+                    close = j
+                    break
+
+        if close == -1 or close + 1 == n:
+            return ("hold" if can_wait else "literal"), start, ""
+
+        if s[close + 1] != "(":
+            return "literal", start, ""
+
+        end = s.find(")", close + 2)
+        if end == -1:
+            return ("hold" if can_wait else "literal"), start, ""
+
+        inner = MarkdownStreamStripper()
+        inner._at_line_start = False
+        inner._line = s[start + 1:close]
+        return "link", end + 1, inner._strip_inline(final=True)
 
 
 
@@ -92,13 +353,13 @@ class N8N:
             data["url"] = url
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                resp = await client.post(
-                    settings.n8n_webhook_knowledgebase,
-                    data=data,
-                    files=files,   # None for urls, multipart for file
-                )
-                resp.raise_for_status()
+            client = http_clients.get("n8n")
+            resp = await client.post(
+                settings.n8n_webhook_knowledgebase,
+                data=data,
+                files=files,   # None for urls, multipart for file
+            )
+            resp.raise_for_status()
 
         except httpx.ConnectError:
             raise HTTPException(status_code=502, detail="n8n service is unreachable")
@@ -117,13 +378,65 @@ class N8N:
 
 
 
+    @staticmethod
+    def extract_output(data) -> str | None:
+        if isinstance(data, list) and len(data) > 0:
+            data = data[0]
+        if isinstance(data, dict):
+            return data.get("output")
+        return None
+
+
     @staticmethod 
-    async def send_msg_to_n8n(msg, bot_id):
-        async with httpx.AsyncClient(timeout=httpx.Timeout(60.0)) as client:
+    def chat_payload(msg, bot_id, visitor_id=None, history: list[dict] | None = None, context: str | None = None) -> dict:
+        # payload expected by n8n Chat node; sessionId lets the workflow's own memory node key on the visitor
+        payload = {"message": msg, "bot_id": str(bot_id)}
+        if visitor_id is not None:
+            payload["sessionId"] = f"{bot_id}:{visitor_id}"
+        if history:
+            payload["history"] = history
+        if context is not None:
+            # retrieved locally; the workflow should skip its own vector search
+            payload["context"] = context
+        return payload
+
+
+    @staticmethod
+    def hedge_delay() -> float | None:
+        if not settings.n8n_hedge_enabled or len(n8n_latency) < settings.n8n_hedge_min_samples:
+            return None
+        return max(settings.n8n_hedge_min_delay, n8n_latency.quantile(settings.n8n_hedge_quantile))
+
+
+    @staticmethod
+    async def ask_n8n(msg, bot_id, visitor_id=None, history: list[dict] | None = None, context: str | None = None,
+                      tier: PlanTier = PlanTier.FREE):
+        """
+        send_msg_to_n8n behind the n8n circuit breaker, hedged after the recent p95 latency when enabled.
+        The caller holds an upstream slot; a backup request needs a second one and is skipped when none is free.
+        """
+        def admit():
+            held = upstream_scheduler.try_hold(bot_id, tier)
+            return held.release if held is not None else None
+
+        return await n8n_breaker.call(
+            lambda: hedged(lambda: N8N.send_msg_to_n8n(msg, bot_id, visitor_id, history, context), N8N.hedge_delay(), "n8n", admit)
+        )
+
+
+    @staticmethod
+    async def send_msg_to_n8n(msg, bot_id, visitor_id=None, history: list[dict] | None = None, context: str | None = None):
+        client = http_clients.get("n8n")
+        started = time.monotonic()
+        try:
             response = await client.post(
                 settings.n8n_chat_url,
-                json={"message": msg, "bot_id": str(bot_id)}  # payload expected by n8n Chat node
+                json=N8N.chat_payload(msg, bot_id, visitor_id, history, context),
             )
+        except httpx.ConnectError:
+            raise HTTPException(status_code=502, detail="n8n service is unreachable")
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="n8n request timed out")
 
         if response.status_code != 200:
             raise HTTPException(status_code=response.status_code, detail="n8n request failed")
@@ -133,12 +446,61 @@ class N8N:
             data = response.json()
         except json.JSONDecodeError:
             return {"error": "Invalid JSON returned from n8n", "raw": response.text}
-        
-        print(data)
-        
-        message_text = None
-        if isinstance(data, list) and len(data) > 0:
-            message_text = data[0].get("output")
+
+        n8n_latency.observe(time.monotonic() - started)
+        message_text = N8N.extract_output(data)
 
         return response.status_code, (message_text or "No message found")
 
+
+    @staticmethod
+    async def stream_msg_from_n8n(msg, bot_id, visitor_id=None, history: list[dict] | None = None, context: str | None = None):
+        # n8n streaming webhooks answer with NDJSON events ({"type": "item", "content": ...});
+        # workflows without streaming still return one JSON body, which is relayed as a single chunk.
+        client = http_clients.get("n8n")
+        raw_lines: list[str] = []
+        try:
+            async with client.stream(
+                "POST",
+                settings.n8n_chat_url,
+                json={**N8N.chat_payload(msg, bot_id, visitor_id, history, context), "stream": True},
+            ) as response:
+                if response.status_code != 200:
+                    raise HTTPException(status_code=response.status_code, detail="n8n request failed")
+
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        raw_lines.append(line)
+                        continue
+
+                    if isinstance(event, dict) and "type" in event:
+                        if event["type"] == "item" and event.get("content"):
+                            yield event["content"]
+                        elif event["type"] == "error":
+                            raise HTTPException(status_code=502, detail="n8n stream failed")
+                        continue
+
+                    text = N8N.extract_output(event)
+                    if text:
+                        yield text
+
+        except httpx.ConnectError:
+            raise HTTPException(status_code=502, detail="n8n service is unreachable")
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="n8n request timed out")
+        except httpx.HTTPError:
+            # connection dropped or broken framing mid-stream; the wrappers still owe the client an error event
+            raise HTTPException(status_code=502, detail="n8n stream was interrupted")
+
+        if raw_lines:
+            try:
+                text = N8N.extract_output(json.loads("\n".join(raw_lines)))
+            except json.JSONDecodeError:
+                text = None
+            if text:
+                yield text
+
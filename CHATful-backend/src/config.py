@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
+from typing import Literal
 from pathlib import Path
 
 
@@ -67,6 +68,124 @@ class Settings(BaseSettings):
     n8n_webhook_knowledgebase: str = Field(default=...)
     n8n_chat_url: str = Field(default=...)
 
+
+    #OUTBOUND HTTP
+    http_timeout: float = 10.0
+    http_connect_timeout: float = 5.0
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2_enabled: bool = True
+    n8n_timeout: float = 60.0
+    n8n_max_connections: int = 200
+    n8n_max_keepalive_connections: int = 50
+    oauth_timeout: float = 10.0
+
+
+    #N8N RESILIENCE
+    n8n_breaker_failure_threshold: int = 5
+    n8n_breaker_reset_timeout: float = 30.0
+    n8n_breaker_half_open_max_calls: int = 1
+    n8n_breaker_slow_call_threshold: float = 20.0
+    # opt-in: a call slower than the recent p95 sends a second request to n8n (and its LLM), so a hedged
+    # answer can cost twice; the backup needs its own upstream slot and is skipped when none is free
+    n8n_hedge_enabled: bool = False
+    n8n_hedge_quantile: float = 0.95
+    n8n_hedge_min_delay: float = 1.0
+    n8n_hedge_min_samples: int = 20
+
+
+    #ANSWER CACHE
+    answer_cache_enabled: bool = True
+    answer_cache_ttl: int = 3600
+    answer_cache_max_entries: int = 1000
+    answer_cache_near_duplicates: bool = False
+    answer_cache_simhash_distance: int = 3
+    answer_cache_stale_ttl: int = 86400
+
+
+    #SINGLE-FLIGHT
+    singleflight_enabled: bool = True
+    singleflight_max_waiters: int = 100
+    singleflight_wait_timeout: float = 65.0
+    singleflight_lock_ttl: float = 70.0
+    singleflight_result_ttl: float = 5.0
+
+
+    #CHATBOT SETTINGS CACHE
+    chatbot_settings_cache_size: int = 10000
+    chatbot_settings_local_ttl: float = 30.0
+    chatbot_settings_redis_ttl: int = 3600
+    chatbot_settings_negative_ttl: int = 60
+
+
+    #CONVERSATION HISTORY
+    conversation_enabled: bool = True
+    conversation_max_messages: int = 50
+    conversation_idle_ttl: int = 86400
+    conversation_history_tokens: int = 1500
+    conversation_history_max_messages: int = 20
+
+
+    #CHAT TRANSCRIPTS
+    transcripts_enabled: bool = True
+    transcript_buffer_size: int = 10000
+    transcript_batch_size: int = 500
+    transcript_flush_interval: float = 2.0
+    transcript_enqueue_timeout: float = 0.05
+    transcript_drain_timeout: float = 10.0
+
+
+    #LOCAL RETRIEVAL
+    retrieval_mode: Literal["n8n", "local", "hybrid"] = "n8n"
+    retrieval_data_dir: str = "data/retrieval"
+    retrieval_dim: int = 384
+    retrieval_top_k: int = 6
+    retrieval_min_score: float = 0.05
+    retrieval_context_tokens_free: int = 800
+    retrieval_context_tokens_pro: int = 1500
+    retrieval_context_tokens_vip: int = 3000
+    retrieval_mmr_lambda: float = 0.7
+    retrieval_mmr_candidates: int = 20
+    retrieval_chunk_tokens: int = 300
+    retrieval_chunk_overlap_tokens: int = 60
+    retrieval_embed_batch_size: int = 256
+    retrieval_rrf_k: int = 60
+    retrieval_keyword_weight: float = 1.0
+    retrieval_vector_weight: float = 1.0
+    retrieval_deadline_ms: float = 50.0
+    retrieval_memory_budget_mb: int = 1024
+    retrieval_quantization: Literal["none", "int8", "pq"] = "none"
+    retrieval_pq_subspaces: int = 48
+    retrieval_pq_rerank: int = 10
+    retrieval_ann: Literal["none", "ivf"] = "none"
+    retrieval_ann_min_chunks: int = 20000
+    retrieval_ivf_lists: int = 0
+    retrieval_ivf_nprobe: int = 8
+    retrieval_ivf_retrain_growth: float = 2.0
+    retrieval_refit_growth: float = 2.0
+    retrieval_compaction_ratio: float = 0.2
+    retrieval_dedup_threshold: float = 0.7
+    retrieval_batch_window_ms: float = 0.0
+    retrieval_batch_max: int = 32
+    retrieval_query_cache_size: int = 10000
+    retrieval_query_cache_redis_ttl: int = 0
+
+
+    #UPSTREAM ADMISSION CONTROL
+    upstream_max_concurrency: int = 64
+    upstream_per_bot_concurrency: int = 8
+    upstream_max_queue: int = 256
+    upstream_max_queue_wait: float = 10.0
+    upstream_weight_free: float = 1.0
+    upstream_weight_pro: float = 2.0
+    upstream_weight_vip: float = 4.0
+
+
+    #METRICS
+    metrics_enabled: bool = False
+    metrics_token: str | None = None
+
     model_config = SettingsConfigDict(env_file=".env")
 
 
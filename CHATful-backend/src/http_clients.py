@@ -0,0 +1,116 @@
+import asyncio, importlib.util
+from contextlib import asynccontextmanager
+import httpx
+from src.config import settings
+from src.logging import get_logger
+
+logger = get_logger("http")
+
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class HTTPClientRegistry:
+    """
+    One pooled httpx.AsyncClient per upstream so keep-alive connections
+    (and their TLS sessions) are reused across requests.
+    Opened in main.lifespan, clients are created lazily elsewhere (Celery, tests).
+    A client's connections belong to the event loop it was created on, so
+    clients are kept per loop; code that runs its own loop (a Celery task's
+    asyncio.run) wraps its work in `scoped()` to close them before it ends.
+    """
+
+    def __init__(self) -> None:
+        self._clients: dict[asyncio.AbstractEventLoop | None, dict[str, httpx.AsyncClient]] = {}
+
+
+    def _upstreams(self) -> dict[str, dict]:
+        return {
+            "n8n": {
+                "timeout": settings.n8n_timeout,
+                "max_connections": settings.n8n_max_connections,
+                "max_keepalive_connections": settings.n8n_max_keepalive_connections,
+            },
+            "google": {
+                "timeout": settings.oauth_timeout,
+                "max_connections": settings.http_max_connections,
+                "max_keepalive_connections": settings.http_max_keepalive_connections,
+            },
+            "github": {
+                "timeout": settings.oauth_timeout,
+                "max_connections": settings.http_max_connections,
+                "max_keepalive_connections": settings.http_max_keepalive_connections,
+            },
+            "default": {
+                "timeout": settings.http_timeout,
+                "max_connections": settings.http_max_connections,
+                "max_keepalive_connections": settings.http_max_keepalive_connections,
+            },
+        }
+
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        upstreams = self._upstreams()
+        config = upstreams.get(name, upstreams["default"])
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(config["timeout"], connect=settings.http_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive_connections"],
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+            http2=settings.http2_enabled and HTTP2_AVAILABLE,
+        )
+
+
+    @staticmethod
+    def _running_loop() -> asyncio.AbstractEventLoop | None:
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+
+    def get(self, name: str = "default") -> httpx.AsyncClient:
+        loop = self._running_loop()
+        clients = self._clients.get(loop)
+        if clients is None:
+            self._prune()
+            clients = self._clients[loop] = {}
+
+        client = clients.get(name)
+        if client is None or client.is_closed:
+            client = clients[name] = self._build(name)
+        return client
+
+
+    def _prune(self) -> None:
+        # clients of a loop that ended without aclose can't be closed any more; drop them for the GC
+        for loop in [loop for loop in self._clients if loop is not None and loop.is_closed()]:
+            clients = self._clients.pop(loop)
+            logger.warning(f"HTTP clients outlived their event loop without being closed clients={sorted(clients)}")
+
+
+    def open(self) -> "HTTPClientRegistry":
+        for name in self._upstreams():
+            self.get(name)
+        return self
+
+
+    async def aclose(self) -> None:
+        """Closes the clients of the running loop."""
+        clients = self._clients.pop(self._running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+
+    @asynccontextmanager
+    async def scoped(self):
+        """Closes the clients opened on this loop on exit, before a short-lived loop shuts down."""
+        try:
+            yield self
+        finally:
+            await self.aclose()
+
+
+http_clients = HTTPClientRegistry()
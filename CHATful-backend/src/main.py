@@ -1,6 +1,7 @@
 import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
@@ -16,6 +17,10 @@ from src.billing.router import router as billing_router
 from src.chahtbot.router import router as chatbot_router
 from src.exceptions import validation_exception_handler
 from src.database import engine
+from src.http_clients import http_clients
+from src.chahtbot.settings_cache import chatbot_settings_cache
+from src.chahtbot.transcripts import transcript_writer
+from src.metrics import metrics
 from redis.asyncio import Redis
 from src.config import settings
 
@@ -29,9 +34,16 @@ async def lifespan(app: FastAPI):
         settings.redis_url,
         decode_responses=True,
     )
+    app.state.http_clients = http_clients.open()
+    chatbot_settings_cache.start(app.state.redis)
+    if settings.transcripts_enabled:
+        transcript_writer.start()
 
     yield
     
+    await transcript_writer.stop()
+    await chatbot_settings_cache.stop()
+    await app.state.http_clients.aclose()
     await app.state.redis.close()
     await engine.dispose()
 
@@ -81,12 +93,23 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 app.add_exception_handler(RequestValidationError, validation_exception_handler)  # type: ignore
 
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.metrics_token and request.headers.get("authorization") != f"Bearer {settings.metrics_token}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+
 app.include_router(auth_router, tags=["auth"])
 app.include_router(billing_router)
 app.include_router(chatbot_router, tags=["chatbot"])
@@ -0,0 +1,216 @@
+import asyncio, math, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable
+import httpx
+from fastapi import HTTPException, status
+from src.config import settings
+from src.logging import get_logger
+from src.metrics import metrics
+
+logger = get_logger("http")
+
+
+circuit_state = metrics.gauge("upstream_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).", ("upstream",))
+circuit_transitions = metrics.counter("upstream_circuit_transitions_total", "Circuit breaker state changes.", ("upstream", "state"))
+circuit_rejected = metrics.counter("upstream_circuit_rejected_total", "Calls rejected while the circuit was open.", ("upstream",))
+hedges_total = metrics.counter("upstream_hedged_requests_total", "Backup requests sent after the hedge delay.", ("upstream", "winner"))
+hedges_skipped = metrics.counter("upstream_hedges_skipped_total", "Backup requests not sent because admission control had no free slot.", ("upstream",))
+
+
+class CircuitOpenError(HTTPException):
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{upstream} is temporarily unavailable",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    if isinstance(exc, HTTPException):
+        return exc.status_code >= 500
+    return isinstance(exc, (httpx.HTTPError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    After `failure_threshold` consecutive failures (5xx, transport errors,
+    timeouts, or calls slower than `slow_call_threshold`) the circuit opens
+    and calls fail fast with 503. After `reset_timeout` seconds it goes
+    half-open and lets up to `half_open_max_calls` probes through. A
+    successful probe closes the circuit; a failed one opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, half_open_max_calls: int,
+                 slow_call_threshold: float | None = None) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.slow_call_threshold = slow_call_threshold
+
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        circuit_state.set(0, upstream=name)
+
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+
+    def check(self) -> None:
+        """Fails fast while open, without taking a half-open probe (e.g. before queueing for a slot)."""
+        if self.is_open:
+            circuit_rejected.inc(upstream=self.name)
+            raise CircuitOpenError(self.name, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit {self.name} {self.state} -> {state}")
+        self.state = state
+        circuit_state.set(self._GAUGE[state], upstream=self.name)
+        circuit_transitions.inc(upstream=self.name, state=state)
+
+
+    def _admit(self) -> None:
+        if self.state == self.OPEN:
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                circuit_rejected.inc(upstream=self.name)
+                raise CircuitOpenError(self.name, remaining)
+            self._transition(self.HALF_OPEN)
+            self._probes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                circuit_rejected.inc(upstream=self.name)
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self._probes += 1
+
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._transition(self.CLOSED)
+
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+
+    @asynccontextmanager
+    async def guard(self):
+        self._admit()
+        probing = self.state == self.HALF_OPEN
+        started = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            if is_upstream_failure(e):
+                self.record_failure()
+            raise
+        else:
+            if self.slow_call_threshold and time.monotonic() - started > self.slow_call_threshold:
+                self.record_failure()
+            else:
+                self.record_success()
+        finally:
+            if probing:
+                self._probes = max(0, self._probes - 1)
+
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.guard():
+            return await fn()
+
+
+class LatencyTracker:
+    """Keeps the latest successful call durations to derive a hedge delay from a quantile."""
+
+    def __init__(self, size: int = 256) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+    def quantile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def hedged(fn: Callable[[], Awaitable[Any]], delay: float | None, upstream: str = "upstream",
+                 admit: Callable[[], Callable[[], None] | None] | None = None) -> Any:
+    """
+    Runs `fn`; if it has not finished after `delay` seconds, starts a second
+    attempt and returns whichever succeeds first. The loser is cancelled.
+    With `admit`, the backup only starts if it returns a release callback (a
+    slot was free right away), which is called once the backup finishes.
+    """
+    if delay is None:
+        return await fn()
+
+    async def backup(release: Callable[[], None] | None):
+        try:
+            return await fn()
+        finally:
+            if release is not None:
+                release()
+
+    primary = asyncio.ensure_future(fn())
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            release = admit() if admit is not None else None
+            if admit is None or release is not None:
+                tasks.append(asyncio.ensure_future(backup(release)))
+            else:
+                hedges_skipped.inc(upstream=upstream)
+
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1:
+                        hedges_total.inc(upstream=upstream, winner="primary" if task is primary else "backup")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+n8n_breaker = CircuitBreaker(
+    "n8n",
+    failure_threshold=settings.n8n_breaker_failure_threshold,
+    reset_timeout=settings.n8n_breaker_reset_timeout,
+    half_open_max_calls=settings.n8n_breaker_half_open_max_calls,
+    slow_call_threshold=settings.n8n_breaker_slow_call_threshold,
+)
+n8n_latency = LatencyTracker()
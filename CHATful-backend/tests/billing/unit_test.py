@@ -369,6 +369,10 @@ async def test_upgrade_subscription_no_active():
     assert exc.value.detail == "No active subscription to upgrade."
 
 
+def _bot_repo(*bot_ids):
+    return Mock(my_bots=AsyncMock(return_value=[SimpleNamespace(id=bot_id) for bot_id in bot_ids]))
+
+
 async def test_stripe_webhook_checkout_creates_subscription(monkeypatch, mock_user_subscribe):
     event = {
         "type": "checkout.session.completed",
@@ -382,7 +386,7 @@ async def test_stripe_webhook_checkout_creates_subscription(monkeypatch, mock_us
     plan_repo = Mock()
     payment_repo = Mock()
 
-    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, plan_repo, payment_repo)
+    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, plan_repo, payment_repo, _bot_repo(), Mock())
 
     assert result is None
     mock_user_subscribe.assert_awaited_once_with(event["data"]["object"], sub_repo, plan_repo)
@@ -427,7 +431,7 @@ async def test_stripe_webhook_invoice_payment(monkeypatch, mock_send_update_subs
     sub_repo = Mock()
     payment_repo = Mock()
 
-    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, Mock(), payment_repo)
+    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, Mock(), payment_repo, _bot_repo(), Mock())
 
     assert result is None
     handle_payment_mock.assert_awaited_once_with(invoice, sub_repo)
@@ -459,7 +463,7 @@ async def test_stripe_webhook_invoice_payment_failed(monkeypatch, mock_send_paym
     request = _dummy_request(b"{}")
     sub_repo = Mock()
 
-    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, Mock(), Mock())
+    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, Mock(), Mock(), _bot_repo(), Mock())
 
     assert result is None
     handler.assert_awaited_once_with(invoice, sub_repo)
@@ -482,7 +486,7 @@ async def test_stripe_webhook_invoice_payment_failed_without_subscription(monkey
     request = _dummy_request(b"{}")
     sub_repo = Mock()
 
-    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, Mock(), Mock())
+    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, Mock(), Mock(), _bot_repo(), Mock())
 
     assert result is None
     handler.assert_awaited_once_with(invoice, sub_repo)
@@ -509,20 +513,38 @@ async def test_stripe_webhook_subscription_deleted(monkeypatch, mock_send_cancel
     sub_repo = Mock()
     payment_repo = Mock()
 
-    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, Mock(), payment_repo)
+    result = await SubscriptionService.stripe_webhook(request, "sig", sub_repo, Mock(), payment_repo, _bot_repo(), Mock())
 
     assert result is None
     handler.assert_awaited_once_with(event["data"]["object"], sub_repo)
     mock_send_cancel_subscription_email_task.assert_called_once_with(serialize_subscription(canceled_sub))
 
 
+async def test_stripe_webhook_invalidates_cached_tier_of_owners_bots(monkeypatch):
+    event = {"type": "customer.subscription.deleted", "data": {"object": {"id": "sub_123"}}}
+    monkeypatch.setattr("src.billing.service.run_in_threadpool", AsyncMock(return_value=event))
+    sub = SimpleNamespace(id=uuid4(), user_id=uuid4())
+    monkeypatch.setattr("src.billing.service.StripeGateway.handle_subscription_deleted", AsyncMock(return_value=sub))
+    monkeypatch.setattr("src.billing.service.send_cancel_subscription_email_task", Mock())
+    monkeypatch.setattr("src.billing.service.serialize_subscription", Mock())
+    invalidate = AsyncMock()
+    monkeypatch.setattr("src.billing.service.chatbot_settings_cache.invalidate", invalidate)
+    bot_a, bot_b = uuid4(), uuid4()
+    bot_repo, redis = _bot_repo(bot_a, bot_b), Mock()
+
+    await SubscriptionService.stripe_webhook(_dummy_request(b"{}"), "sig", Mock(), Mock(), Mock(), bot_repo, redis)
+
+    bot_repo.my_bots.assert_awaited_once_with(sub.user_id)
+    assert invalidate.await_args_list == [((bot_a, redis),), ((bot_b, redis),)]
+
+
 async def test_stripe_webhook_invalid_signature(monkeypatch):
     error = Exception("bad signature")
     run_mock = AsyncMock(side_effect=error)
     monkeypatch.setattr("src.billing.service.run_in_threadpool", run_mock)
 
     request = _dummy_request(b"{}")
-    response = await SubscriptionService.stripe_webhook(request, "sig", Mock(), Mock(), Mock())
+    response = await SubscriptionService.stripe_webhook(request, "sig", Mock(), Mock(), Mock(), _bot_repo(), Mock())
 
     assert response == {"error": "bad signature"}
 
@@ -0,0 +1,55 @@
+import json
+import time
+import pytest
+from uuid import uuid4
+from unittest.mock import AsyncMock, Mock, ANY, patch
+
+from src.chahtbot.answer_cache import AnswerCache
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_answer_cache_normalize_folds_case_whitespace_and_punctuation():
+    assert AnswerCache.normalize("  What's   your REFUND policy?? ") == "what s your refund policy"
+    assert AnswerCache.digest(AnswerCache.normalize("Refund policy?")) == AnswerCache.digest(AnswerCache.normalize("refund   POLICY"))
+
+
+async def test_answer_cache_simhash_keeps_near_duplicates_close():
+    base = AnswerCache.simhash(AnswerCache.normalize("how do i reset my account password from the login page"))
+    near = AnswerCache.simhash(AnswerCache.normalize("how do i reset my account password from the login screen"))
+    other = AnswerCache.simhash(AnswerCache.normalize("which payment methods do you accept for yearly plans"))
+
+    assert (base ^ near).bit_count() < (base ^ other).bit_count()
+
+
+async def test_answer_cache_near_duplicate_lookup_reads_only_matching_bands():
+    stored = AnswerCache.simhash(AnswerCache.normalize("how do i reset my account password from the login page"))
+    near = stored ^ (1 << 3 | 1 << 30 | 1 << 60)
+    member = f"{stored:016x}:abc"
+    entry = json.dumps({"answer": "Use the reset link.", "ts": time.time(), "gen": 2})
+    pipe = Mock(execute=AsyncMock(return_value=[{member}, set(), set(), set()]))
+    redis = Mock(pipeline=Mock(return_value=pipe), hget=AsyncMock(return_value=entry), zrange=AsyncMock())
+    keys = AnswerCache._keys(uuid4())
+
+    with patch("src.chahtbot.answer_cache.AnswerCache.simhash", return_value=near):
+        assert await AnswerCache._get_near_duplicate(redis, keys, "reset password", 2) == "Use the reset link."
+
+    # three flipped bits leave at least one of the four 16-bit bands intact
+    assert pipe.smembers.call_count == 4
+    assert len({call.args[0] for call in pipe.smembers.call_args_list} & set(AnswerCache._band_keys(keys, 2, stored))) >= 1
+    redis.hget.assert_awaited_once_with(keys["entries"], "abc")
+    redis.zrange.assert_not_called()
+
+
+async def test_answer_cache_caps_stale_copies_with_the_entries():
+    pipe = Mock(execute=AsyncMock(side_effect=[[0, 0], [None] * 11 + [3, 1], [12], [40, 40]]))
+    redis = Mock(pipeline=Mock(return_value=pipe), zpopmin=AsyncMock(return_value=[("old-a", 1.0), ("old-b", 2.0)]))
+
+    with patch("src.chahtbot.answer_cache.settings.answer_cache_max_entries", 1):
+        await AnswerCache.set(redis, uuid4(), "hi", "hello", 0)
+
+    redis.zpopmin.assert_awaited_once_with(ANY, 2)
+    assert redis.zpopmin.await_args.args[0].endswith(":stale_order")
+    pipe.hdel.assert_called_once_with(ANY, "old-a", "old-b")
+    assert pipe.hdel.call_args.args[0].endswith(":stale")
@@ -0,0 +1,80 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+from src.billing.models import PlanTier
+from src.chahtbot.scheduler import UpstreamScheduler
+from src.chahtbot.settings_cache import ChatbotSettingsCache
+from src.chahtbot.singleflight import SingleFlight
+from src.chahtbot.transcripts import TranscriptWriter
+from src.resilience import CircuitBreaker
+
+
+class FakeSession:
+    """Async session stand-in that records each executemany batch."""
+
+    def __init__(self, batches):
+        self.batches = batches
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows):
+        self.batches.append(list(rows))
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def chat_request():
+    return SimpleNamespace(headers={"origin": "https://shop.example.com"})
+
+
+@pytest.fixture
+def flight():
+    return SingleFlight(prefix="test", max_waiters=10, wait_timeout=1.0, lock_ttl=5.0, result_ttl=1.0)
+
+
+@pytest.fixture
+def settings_cache():
+    return ChatbotSettingsCache(max_entries=10, local_ttl=60, redis_ttl=600, negative_ttl=60)
+
+
+@pytest.fixture
+def settings_pipe():
+    """Pipeline results of a settings load: hset, expire and the version read back."""
+    return Mock(execute=AsyncMock(return_value=[1, True, None]))
+
+
+@pytest.fixture
+def settings_redis(settings_pipe):
+    return Mock(hmget=AsyncMock(return_value=[None, None]), pipeline=Mock(return_value=settings_pipe))
+
+
+@pytest.fixture
+def scheduler():
+    return UpstreamScheduler(
+        max_concurrency=1, per_bot_concurrency=1, max_queue=10, max_wait=1.0,
+        weights={PlanTier.FREE: 1.0, PlanTier.PRO: 2.0, PlanTier.VIP: 4.0},
+    )
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05, half_open_max_calls=1)
+
+
+@pytest.fixture
+def transcript_batches():
+    return []
+
+
+@pytest.fixture
+def transcript_writer(transcript_batches):
+    return TranscriptWriter(
+        max_buffer=100, batch_size=3, flush_interval=0.05, enqueue_timeout=0.01,
+        drain_timeout=1.0, session_factory=lambda: FakeSession(transcript_batches),
+    )
@@ -0,0 +1,44 @@
+import pytest
+from uuid import uuid4
+from unittest.mock import AsyncMock, Mock
+
+from src.chahtbot.conversations import ConversationStore
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_conversation_history_keeps_newest_turns_within_token_budget():
+    entries = [
+        ("3-0", {"role": "assistant", "content": "c" * 40, "tokens": "10"}),
+        ("2-0", {"role": "user", "content": "b" * 40, "tokens": "10"}),
+        ("1-0", {"role": "assistant", "content": "a" * 40, "tokens": "10"}),
+    ]
+    redis = Mock(xrevrange=AsyncMock(return_value=entries))
+
+    history = await ConversationStore.history(redis, uuid4(), uuid4(), token_budget=25)
+
+    assert history == [{"role": "user", "content": "b" * 40}, {"role": "assistant", "content": "c" * 40}]
+
+
+async def test_conversation_history_keeps_latest_exchange_cut_to_budget():
+    entries = [
+        ("2-0", {"role": "assistant", "content": "c" * 8000, "tokens": "2000"}),
+        ("1-0", {"role": "user", "content": "what plans are there?", "tokens": "6"}),
+    ]
+    redis = Mock(xrevrange=AsyncMock(return_value=entries))
+
+    history = await ConversationStore.history(redis, uuid4(), uuid4(), token_budget=100)
+
+    assert history == [{"role": "user", "content": "what plans are there?"}, {"role": "assistant", "content": "c" * 376}]
+
+
+async def test_conversation_append_trims_stream_and_refreshes_idle_ttl():
+    pipe = Mock(execute=AsyncMock(return_value=[]))
+    redis = Mock(pipeline=Mock(return_value=pipe))
+
+    await ConversationStore.append(redis, uuid4(), uuid4(), ("user", "hi"), ("assistant", "hello"))
+
+    assert pipe.xadd.call_count == 2
+    assert pipe.xadd.call_args.kwargs["approximate"] is True
+    pipe.expire.assert_called_once()
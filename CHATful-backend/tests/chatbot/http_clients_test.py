@@ -0,0 +1,54 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+from src.http_clients import HTTPClientRegistry
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_http_client_registry_reuses_pooled_client():
+    registry = HTTPClientRegistry()
+
+    first = registry.get("n8n")
+    second = registry.get("n8n")
+
+    assert first is second
+    assert registry.get("google") is not first
+    await registry.aclose()
+    assert first.is_closed
+
+
+async def test_http_client_registry_open_and_reopen_after_close():
+    registry = HTTPClientRegistry().open()
+    client = registry.get("github")
+
+    await registry.aclose()
+
+    assert client.is_closed
+    assert registry.get("github") is not client
+    await registry.aclose()
+
+
+async def test_http_client_registry_closes_scoped_clients_of_another_event_loop():
+    registry = HTTPClientRegistry()
+
+    async def task():
+        async with registry.scoped():
+            return registry.get("n8n")
+
+    async def unscoped_task():
+        return registry.get("n8n")
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        scoped = pool.submit(asyncio.run, task()).result()
+        assert scoped.is_closed and registry._clients == {}
+        pool.submit(asyncio.run, unscoped_task()).result()
+
+    client = registry.get("n8n")
+    assert client is not scoped and not client.is_closed
+    assert registry.get("n8n") is client
+    assert list(registry._clients) == [asyncio.get_running_loop()]
+    await registry.aclose()
+    assert client.is_closed and registry._clients == {}
@@ -0,0 +1,22 @@
+import pytest
+
+from src.metrics import MetricsRegistry
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_metrics_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests.", ("tier",))
+    histogram = registry.histogram("wait_seconds", "Wait.", buckets=(0.1, 1.0))
+    counter.inc(tier="VIP")
+    histogram.observe(0.5)
+
+    text = registry.render()
+
+    assert 'requests_total{tier="VIP"} 1' in text
+    assert 'wait_seconds_bucket{le="0.1"} 0' in text
+    assert 'wait_seconds_bucket{le="1"} 1' in text
+    assert 'wait_seconds_bucket{le="+Inf"} 1' in text
+    assert "wait_seconds_count 1" in text
@@ -0,0 +1,35 @@
+import pytest
+
+from src.chahtbot.origins import OriginMatcher, normalize_origin
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("https://Shop.Example.com/", "https://shop.example.com"),
+    ("https://shop.example.com/checkout?step=2#top", "https://shop.example.com"),
+    ("https://shop.example.com:443", "https://shop.example.com"),
+    ("http://localhost:3000/page", "http://localhost:3000"),
+    ("null", None),
+    ("ftp://example.com", None),
+    ("https://example.com:notaport", None),
+])
+async def test_normalize_origin(raw, expected):
+    assert normalize_origin(raw) == expected
+
+
+async def test_origin_matcher_exact_and_wildcard_hosts():
+    matcher = OriginMatcher(["https://app.example.com/", "https://*.example.org", "http://*.dev.test:8080"])
+
+    assert matcher.matches("https://app.example.com")
+    assert not matcher.matches("https://other.example.com")
+    assert matcher.matches("https://a.example.org")
+    assert matcher.matches("https://a.b.example.org")
+    assert not matcher.matches("https://example.org")
+    assert not matcher.matches("http://a.example.org")
+    assert not matcher.matches("https://a.notexample.org")
+    assert matcher.matches("http://api.dev.test:8080")
+    assert not matcher.matches("http://api.dev.test")
+    assert not matcher.matches(None)
+    assert OriginMatcher(["*"]).matches(None)
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from fastapi import HTTPException
+
+from src.resilience import CircuitBreaker, CircuitOpenError, hedged
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _failing():
+    raise HTTPException(status_code=502, detail="down")
+
+
+async def test_circuit_breaker_opens_after_consecutive_failures_and_fails_fast(breaker):
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await breaker.call(_failing)
+
+    upstream = AsyncMock()
+    with pytest.raises(CircuitOpenError) as exc:
+        await breaker.call(upstream)
+
+    assert exc.value.status_code == 503 and "Retry-After" in exc.value.headers
+    upstream.assert_not_awaited()
+
+
+async def test_circuit_breaker_half_open_probe_closes_or_reopens(breaker):
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await breaker.call(_failing)
+
+    await asyncio.sleep(0.06)
+    with pytest.raises(HTTPException):
+        await breaker.call(_failing)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    await asyncio.sleep(0.06)
+    assert await breaker.call(AsyncMock(return_value="ok")) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_circuit_breaker_ignores_client_errors(breaker):
+    breaker.failure_threshold = 1
+
+    async def not_found():
+        raise HTTPException(status_code=404, detail="nope")
+
+    with pytest.raises(HTTPException):
+        await breaker.call(not_found)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_hedged_returns_backup_when_primary_is_slow():
+    calls = []
+
+    async def upstream():
+        calls.append(len(calls))
+        await asyncio.sleep(1.0 if len(calls) == 1 else 0.0)
+        return f"attempt {len(calls)}"
+
+    assert await hedged(upstream, delay=0.01) == "attempt 2"
+    assert len(calls) == 2
+
+
+async def test_hedged_backup_needs_a_free_scheduler_slot(scheduler):
+    scheduler.max_concurrency = scheduler.per_bot_concurrency = 2
+    calls = []
+
+    async def upstream():
+        calls.append(len(calls))
+        await asyncio.sleep(0.05 if len(calls) == 1 else 0.0)
+        return f"attempt {len(calls)}"
+
+    def admit():
+        held = scheduler.try_hold("bot")
+        return held.release if held is not None else None
+
+    async with scheduler.slot("bot"), scheduler.slot("other"):
+        assert await hedged(upstream, delay=0.01, admit=admit) == "attempt 1"
+    assert len(calls) == 1
+
+    calls.clear()
+    async with scheduler.slot("bot"):
+        assert await hedged(upstream, delay=0.01, admit=admit) == "attempt 2"
+        assert scheduler._active == 1
+    assert len(calls) == 2
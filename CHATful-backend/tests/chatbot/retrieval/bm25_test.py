@@ -0,0 +1,45 @@
+import pytest
+import numpy as np
+
+from src.chahtbot.retrieval.bm25 import Bm25Index, tokenize
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_bm25_tokenize_keeps_codes_whole_and_by_parts():
+    assert tokenize("Error E-502 on SKU-1234.") == ["error", "e-502", "e", "502", "on", "sku-1234", "sku", "1234"]
+
+
+async def test_bm25_pruned_top_k_matches_exhaustive_ranking():
+    texts = [f"model x{i % 7} manual page {i} " + "setup " * (i % 3) for i in range(600)]
+    texts[123] += " error code ERR-4711 means the fan is blocked"
+    index = Bm25Index.build(texts)
+
+    assert index.search("what is ERR-4711", 1)[0][0] == 123
+    for query in ("x3 setup manual", "page 42 setup", "x1 x2 model"):
+        pruned, exhaustive = index.search(query, 5), index.search(query, len(texts))[:5]
+        assert [score for _, score in pruned] == pytest.approx([score for _, score in exhaustive])
+
+
+async def test_bm25_extend_matches_a_full_build_once_refit():
+    texts = [f"model x{i % 7} manual page {i} " + "setup " * (i % 3) for i in range(300)]
+    texts[250] += " error code ERR-4711 means the fan is blocked"
+    base = Bm25Index.build(texts[:200])
+
+    kept_stats = base.extend(texts[200:])
+    assert kept_stats.fitted_docs == 200 and np.array_equal(kept_stats.idf[:len(base.vocab)], base.idf)
+    assert kept_stats.search("ERR-4711", 1)[0][0] == 250
+
+    refit, full = base.extend(texts[200:], refit=True), Bm25Index.build(texts)
+    for query in ("x3 setup manual", "page 242 setup", "fan blocked"):
+        assert refit.search(query, 5) == pytest.approx(full.search(query, 5))
+
+
+async def test_bm25_term_lookup_resolves_crc32_collisions():
+    # "plumless" and "buckeroo" share a crc32
+    index = Bm25Index.build(["plumless pie", "buckeroo ranch", "plain text"])
+
+    assert [doc for doc, _ in index.search("buckeroo", 3)] == [1]
+    assert [doc for doc, _ in index.search("plumless", 3)] == [0]
+    assert index.term_id("plumles") is None
@@ -0,0 +1,34 @@
+import pytest
+
+from src.chahtbot.retrieval.chunker import estimate_tokens, iter_chunks
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_iter_chunks_breaks_at_headings_and_carries_provenance():
+    markdown = (
+        "<!-- page 1 -->\n\n# Manual\n\n## Setup\n\nPlug the unit in.\n\n- first step\n- second step\n\n"
+        "<!-- page 2 -->\n\n## Network\n\n| Port | Use |\n|---|---|\n| 80 | web |\n"
+    )
+    chunks = list(iter_chunks(markdown, max_tokens=100))
+
+    assert [(chunk.page, chunk.heading) for chunk in chunks] == [(1, "Manual > Setup"), (2, "Manual > Network")]
+    assert chunks[0].text == "# Manual\n\n## Setup\n\nPlug the unit in.\n\n- first step\n\n- second step"
+    assert chunks[1].text.endswith("|---|---|\n| 80 | web |")
+    assert chunks[1].label("manual.pdf") == "manual.pdf, p. 2, Manual > Network"
+
+
+async def test_iter_chunks_packs_to_budget_and_overlaps_long_blocks():
+    long_paragraph = " ".join(f"w{i}" for i in range(100))
+    table = "| a | b |\n|---|---|\n" + "\n".join(f"| {i} | {i * i} |" for i in range(40))
+    chunks = list(iter_chunks(f"one two\n\nthree four\n\n{long_paragraph}\n\n{table}", max_tokens=30, overlap=5))
+
+    assert chunks[0].text == "one two\n\nthree four"
+    assert all(estimate_tokens(chunk.text) <= 30 for chunk in chunks)
+    words = [chunk.text.split() for chunk in chunks if chunk.text.startswith("w")]
+    assert words[1][0] in words[0][1:] and words[0][-1] in words[1]
+    assert words[-1][-1] == "w99"
+    rows = [chunk.text for chunk in chunks if chunk.text.startswith("|")]
+    assert len(rows) > 1 and all(piece.startswith("| a | b |\n|---|---|") for piece in rows)
+    assert rows[-1].endswith("| 39 | 1521 |")
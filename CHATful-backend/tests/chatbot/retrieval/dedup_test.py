@@ -0,0 +1,43 @@
+import pytest
+from uuid import uuid4
+
+from src.chahtbot.retrieval.dedup import MinHasher, near_duplicates
+from src.chahtbot.retrieval.embedder import HashingEmbedder
+from src.chahtbot.retrieval.engine import RetrievalEngine
+from src.chahtbot.retrieval.store import VectorStore
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_minhash_lsh_flags_near_duplicates_only():
+    nav = "Home Products Pricing About Contact Careers Blog Login. Sign up for our newsletter, copyright 2024 Acme Inc, all rights reserved"
+    texts = [nav, "Refunds are issued within 14 days of purchase for annual plans", nav.replace("Blog", "News"), nav + " Privacy"]
+
+    targets = near_duplicates(MinHasher().signatures(texts), 1, threshold=0.7)
+
+    assert targets.tolist() == [1, 0, 0]
+
+
+async def test_ingestion_merges_repeated_blocks_and_keeps_their_provenance(tmp_path):
+    footer = "Acme Inc, 1 Main Street, Springfield. Call us on 555-0100, Monday to Friday 9am to 5pm. All rights reserved."
+    engine = RetrievalEngine(HashingEmbedder(dim=64), VectorStore(str(tmp_path), 64, dedup_threshold=0.7))
+    bot_id, first_page, second_page = uuid4(), uuid4(), uuid4()
+
+    report = engine.index_document(bot_id, f"# Pricing\n\nPlans start at $10 a month.\n\n## Contact\n\n{footer}", "pricing.html", first_page)
+    assert (report.chunks, report.merged) == (2, 0)
+    report = engine.index_document(bot_id, f"# Careers\n\nWe are hiring engineers.\n\n## Contact\n\n{footer}", "careers.html", second_page)
+    assert (report.chunks, report.merged) == (2, 1)
+    assert report.dedup_ratio == 0.5 and report.bytes_saved > 64 * 4
+
+    index = engine.store.get(bot_id)
+    assert len(index) == 3
+    footer_row = next(i for i, text in enumerate(index.texts) if "Springfield" in text)
+    assert index.provenance(footer_row) == ["pricing.html, Pricing > Contact", "careers.html, Careers > Contact"]
+
+    # the footer outlives the page it was first indexed from while the page it was merged from is active
+    engine.archive_file(bot_id, first_page)
+    assert engine.store.compact(bot_id) == 1
+    index = engine.store.get(bot_id)
+    assert sorted(index.sources) == ["careers.html, Careers", "careers.html, Careers > Contact"]
+    assert len(index.alias_rows) == 0
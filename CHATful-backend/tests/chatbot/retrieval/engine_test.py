@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+from uuid import uuid4
+from unittest.mock import Mock
+
+from src.chahtbot.retrieval.bm25 import Bm25Index, tokenize
+from src.chahtbot.retrieval.embedder import HashingEmbedder
+from src.chahtbot.retrieval.engine import RetrievalEngine
+from src.chahtbot.retrieval.store import VectorStore
+from src.chahtbot.retrieval.batching import QueryBatcher
+from src.chahtbot.retrieval.query_cache import QueryCache
+from src.chahtbot.retrieval.filters import ChunkFilter
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_hashing_embedder_is_deterministic_and_normalized():
+    embedder = HashingEmbedder(dim=64)
+    first, second = embedder.embed(["Refund policy for annual plans", "Refund policy for annual plans"])
+
+    assert first.dtype.name == "float32"
+    assert (first == second).all()
+    assert abs(float(first @ first) - 1.0) < 1e-5
+
+
+async def test_retrieval_engine_ranks_relevant_chunk_first(tmp_path):
+    engine = RetrievalEngine(HashingEmbedder(dim=256), VectorStore(str(tmp_path), 256))
+    bot_id = uuid4()
+    engine.index_document(bot_id, "Shipping takes five business days.", "shipping.md")
+    engine.index_document(bot_id, "Refunds are issued within 14 days of purchase.", "refunds.md")
+    engine.index_document(bot_id, "Our office is open Monday to Friday.", "contact.md")
+
+    hits = engine.search(bot_id, "how do refunds work", k=2)
+    assert hits[0].source == "refunds.md"
+    assert engine.search(uuid4(), "refunds", k=2) == []
+
+
+async def test_index_version_announce_tolerates_unusable_redis_url(monkeypatch):
+    from src.chahtbot.retrieval import engine
+    monkeypatch.setattr(engine.settings, "redis_url", "http://localhost")
+    monkeypatch.setattr(engine, "_redis", None)
+    monkeypatch.setattr(engine, "_redis_failed", False)
+
+    engine._announce_version("bot", 3)
+    assert engine._sync_redis() is None
+
+
+async def test_query_cache_reuses_normalized_queries_and_spills_evictions_to_redis():
+    embedder = HashingEmbedder(dim=32)
+    embedded = []
+    embed = embedder.embed
+    embedder.embed = lambda texts: embedded.append(list(texts)) or embed(texts)
+    pipe = Mock()
+    redis = Mock(mget=Mock(side_effect=lambda keys: [None] * len(keys)), pipeline=Mock(return_value=pipe))
+    cache = QueryCache(embedder, max_entries=1, redis=lambda: redis)
+
+    (vector, tokens), = cache.lookup(["Reset the ERR-4711 code"])
+    (again, _), = cache.lookup(["  reset the  err-4711 CODE "])
+    assert embedded == [["reset the err-4711 code"]]
+    assert tokens == tokenize("reset the err-4711 code")
+    assert np.array_equal(again, vector)
+    assert np.allclose(vector, HashingEmbedder(dim=32).embed(["Reset the ERR-4711 code"])[0])
+
+    cache.lookup(["another question"])
+    key, entry = pipe.set.call_args.args
+    assert key.startswith(f"retrieval:query:{embedder.version}:") and entry[:vector.nbytes] == vector.tobytes()
+    pipe.execute.assert_called_once()
+
+
+async def test_keyword_index_is_persisted_with_the_bot_index(tmp_path):
+    engine = RetrievalEngine(HashingEmbedder(dim=64), VectorStore(str(tmp_path), 64))
+    bot_id = uuid4()
+    engine.index_document(bot_id, "Replace filter FLT-220 every six months.", "filters.md")
+    engine.index_document(bot_id, "The warranty covers two years.", "warranty.md")
+
+    reloaded = RetrievalEngine(engine.embedder, VectorStore(str(tmp_path), 64))
+    hits = reloaded.keyword_search(bot_id, "FLT-220", k=3)
+    assert [hit.source for hit in hits] == ["filters.md"]
+    # nothing is rebuilt in the reader's heap, so worker processes share the pages
+    keywords = reloaded.store.get(bot_id).keywords
+    assert all(isinstance(getattr(keywords, name), np.memmap) for name in Bm25Index.ARRAYS + Bm25Index.DERIVED)
+
+
+async def test_archived_file_is_hidden_at_once_and_dropped_by_compaction(tmp_path):
+    engine = RetrievalEngine(HashingEmbedder(dim=64), VectorStore(str(tmp_path), 64))
+    bot_id, old_file, new_file = uuid4(), uuid4(), uuid4()
+    engine.index_document(bot_id, "Returns are accepted within 30 days, code RET-30.", "old.md", old_file)
+    engine.index_document(bot_id, "Returns are accepted within 60 days, code RET-60.", "new.md", new_file)
+    reader = RetrievalEngine(engine.embedder, VectorStore(str(tmp_path), 64))
+    assert {hit.source for hit in reader.search(bot_id, "returns days", k=5)} == {"old.md", "new.md"}
+
+    assert engine.archive_file(bot_id, old_file) == 0.5
+    assert [hit.source for hit in reader.search(bot_id, "returns days", k=5)] == ["new.md"]
+    assert [hit.source for hit in reader.keyword_search(bot_id, "RET-30", k=5)] == ["new.md"]
+
+    assert engine.store.compact(bot_id) == 1
+    index = reader.store.get(bot_id)
+    assert list(index.texts) == ["Returns are accepted within 60 days, code RET-60."]
+    assert index.tombstoned == 0
+    assert engine.store.compact(bot_id) == 0
+
+
+async def test_filtered_search_returns_only_eligible_chunks(tmp_path):
+    engine = RetrievalEngine(HashingEmbedder(dim=128), VectorStore(str(tmp_path), 128))
+    bot_id = uuid4()
+    manual, page, old = str(uuid4()), str(uuid4()), str(uuid4())
+    engine.index_document(bot_id, "Warranty claims need the receipt.", "manual.pdf", manual, source_type="file")
+    engine.index_document(bot_id, "Warranty extensions are sold online.", "shop", page, source_type="webpage")
+    engine.index_document(bot_id, "Warranty used to last one year.", "old.pdf", old, source_type="file")
+    engine.archive_file(bot_id, old)
+
+    def sources(chunk_filter, search=engine.search):
+        return sorted(hit.source for hit in search(bot_id, "warranty", 5, chunk_filter))
+
+    assert sources(None) == ["manual.pdf", "shop"]
+    assert sources(ChunkFilter(source_types=frozenset({"file"}))) == ["manual.pdf"]
+    assert sources(ChunkFilter(files=frozenset({page})), engine.keyword_search) == ["shop"]
+    assert sources(ChunkFilter(statuses=frozenset({"archived"}))) == ["old.pdf"]
+    assert sources(ChunkFilter(files=frozenset({page}), source_types=frozenset({"file"}))) == []
+    assert ChunkFilter.parse({"files": None, "source_types": None, "statuses": ["active"]}) is None
+
+
+async def test_query_batcher_runs_concurrent_callers_as_one_batch():
+    batches = []
+
+    def run(key, items):
+        batches.append((key, list(items)))
+        return [item * 10 for item in items]
+
+    batcher = QueryBatcher(run, window=0.5, max_batch=4)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda item: batcher.submit("bot", item), [1, 2, 3, 4]))
+
+    assert results == [10, 20, 30, 40]
+    assert len(batches) == 1 and sorted(batches[0][1]) == [1, 2, 3, 4]
@@ -0,0 +1,49 @@
+import threading
+import pytest
+from uuid import uuid4
+from types import SimpleNamespace
+
+from src.chahtbot.utils import ChatbotUtils
+from src.chahtbot.retrieval.engine import Hit
+from src.chahtbot.retrieval.hybrid import hybrid_search, rrf_fuse
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_rrf_fuse_rewards_agreement_and_respects_weights():
+    keyword = [Hit(1, 9.0, "a", "s"), Hit(2, 7.0, "b", "s")]
+    vector = [Hit(3, 0.9, "c", "s"), Hit(2, 0.8, "b", "s")]
+
+    assert [hit.chunk_id for hit in rrf_fuse({"keyword": keyword, "vector": vector}, {}, k=3)] == [2, 1, 3]
+    weighted = rrf_fuse({"keyword": keyword, "vector": vector}, {"keyword": 0.0, "vector": 1.0}, k=1)
+    assert weighted[0].chunk_id == 3
+
+
+async def test_hybrid_search_returns_partial_result_when_one_side_misses_deadline():
+    def slow_vector_search(bot_id, query, k, chunk_filter=None):
+        threading.Event().wait(0.3)
+        return [Hit(9, 0.9, "late", "s")]
+
+    engine = SimpleNamespace(keyword_search=lambda bot_id, query, k, chunk_filter=None: [Hit(1, 3.0, "fast", "s")], search=slow_vector_search)
+    timings = {}
+
+    hits = await hybrid_search(engine, uuid4(), "q", 3, {}, deadline=0.05, timings=timings)
+
+    assert [hit.text for hit in hits] == ["fast"]
+    assert timings["vector"] is None and timings["keyword"] >= 0
+    assert ChatbotUtils.server_timing(timings).startswith("keyword;dur=")
+    assert 'vector;desc="timeout"' in ChatbotUtils.server_timing(timings)
+
+
+async def test_hybrid_search_fuses_the_other_side_when_one_side_raises():
+    def broken_vector_search(bot_id, query, k, chunk_filter=None):
+        raise ValueError("index is being remapped")
+
+    engine = SimpleNamespace(keyword_search=lambda bot_id, query, k, chunk_filter=None: [Hit(1, 3.0, "fast", "s")], search=broken_vector_search)
+    timings = {}
+
+    hits = await hybrid_search(engine, uuid4(), "q", 3, {}, deadline=1.0, timings=timings)
+
+    assert [hit.text for hit in hits] == ["fast"]
+    assert 'vector;desc="error"' in ChatbotUtils.server_timing(timings)
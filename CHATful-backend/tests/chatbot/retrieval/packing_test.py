@@ -0,0 +1,39 @@
+import pytest
+import numpy as np
+
+from src.chahtbot.retrieval.engine import Hit
+from src.chahtbot.retrieval.packing import count_tokens, pack_context
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_pack_context_stops_at_token_budget():
+    hits = [Hit(i, 1.0 - i / 10, "word " * 10, "doc.md") for i in range(5)]
+
+    packed = pack_context(hits, token_budget=40)
+
+    assert packed.text.startswith("[1] (doc.md)")
+    assert "[2]" in packed.text and "[3]" not in packed.text
+    assert packed.tokens <= 40 and packed.tokens_saved == packed.candidate_tokens - packed.tokens > 0
+
+
+async def test_pack_context_mmr_skips_near_repeats_of_chosen_passages():
+    rng = np.random.default_rng(3)
+    base, other = rng.standard_normal((2, 32)).astype(np.float32)
+    repeat = base + 0.01 * rng.standard_normal(32).astype(np.float32)
+    hits = [
+        Hit(0, 0.9, "plans and prices", "a.md", base / np.linalg.norm(base)),
+        Hit(1, 0.88, "plans and prices again", "b.md", repeat / np.linalg.norm(repeat)),
+        Hit(2, 0.6, "refund rules", "c.md", other / np.linalg.norm(other)),
+    ]
+
+    packed = pack_context(hits, token_budget=1000, mmr_lambda=0.5, max_passages=2)
+
+    assert packed.text == "[1] (a.md)\nplans and prices\n\n[2] (c.md)\nrefund rules"
+
+
+async def test_count_tokens_approximates_word_pieces():
+    assert count_tokens("Hello, world!") == 4
+    assert count_tokens("Error E-502 on SKU-1234567890.") == count_tokens("Error E - 502 on SKU - 1234567890 .")
+    assert count_tokens("internationalization") > count_tokens("word")
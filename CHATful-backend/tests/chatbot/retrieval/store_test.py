@@ -0,0 +1,216 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+from uuid import uuid4
+from unittest.mock import patch
+
+from src.chahtbot.retrieval.embedder import HashingEmbedder
+from src.chahtbot.retrieval.engine import RetrievalEngine
+from src.chahtbot.retrieval.store import BotIndex, VectorStore
+from src.chahtbot.retrieval.filters import ChunkFilter
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_vector_store_persists_and_reloads_when_manifest_changes(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    writer, reader = VectorStore(str(tmp_path), 64), VectorStore(str(tmp_path), 64)
+    bot_id = uuid4()
+
+    writer.add(bot_id, embedder.embed(["alpha"]), ["alpha"], ["a.md"])
+    assert list(reader.get(bot_id).texts) == ["alpha"]
+
+    writer.add(bot_id, embedder.embed(["beta"]), ["beta"], ["b.md"])
+    index = reader.get(bot_id)
+    assert list(index.texts) == ["alpha", "beta"]
+    assert list(index.sources) == ["a.md", "b.md"]
+    assert reader.get(uuid4()) is None
+
+
+async def test_staged_version_is_published_after_the_last_pending_document(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    published = []
+    writer = VectorStore(str(tmp_path), 64, on_publish=lambda bot, version: published.append(version))
+    reader = VectorStore(str(tmp_path), 64)
+    bot_id = uuid4()
+    writer.add(bot_id, embedder.embed(["old"]), ["old"], ["old.md"])
+    old = reader.get(bot_id)
+
+    writer.expect(bot_id, replace=True)
+    writer.expect(bot_id, replace=True)
+    writer.add(bot_id, embedder.embed(["alpha"]), ["alpha"], ["a.md"], staged=True)
+    writer.finish_staged(bot_id)
+    assert writer.publish(bot_id) is None  # one document still pending
+    assert list(reader.get(bot_id).texts) == ["old"]
+
+    writer.add(bot_id, embedder.embed(["beta"]), ["beta"], ["b.md"], staged=True)
+    version = writer.finish_staged(bot_id)
+    assert published == [1, version]
+    assert list(reader.get(bot_id).texts) == ["alpha", "beta"]
+
+    # the old version was kept while the reader had it mapped; it remapped on its last lookup
+    assert (tmp_path / str(bot_id) / f"v{old.version}").exists()
+    writer.collect(bot_id)
+    assert sorted(path.name for path in (tmp_path / str(bot_id)).glob("v*")) == [f"v{version}"]
+
+
+async def test_vector_store_appends_new_rows_to_fitted_quantizer_and_keywords(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    store = VectorStore(str(tmp_path), 64, quantization="pq", pq_subspaces=8)
+    bot_id = uuid4()
+    first = [f"first batch chunk {i}" for i in range(300)]
+    store.add(bot_id, embedder.embed(first), first, ["a.md"] * 300)
+    centroids = np.array(store.get(bot_id).quantizer.centroids)
+
+    second = [f"second batch chunk {i} ERR-{i}" for i in range(100)]
+    with patch("src.chahtbot.retrieval.quantization.kmeans") as kmeans, \
+         patch("src.chahtbot.retrieval.store.Bm25Index.build") as build:
+        store.add(bot_id, embedder.embed(second), second, ["b.md"] * 100)
+    kmeans.assert_not_called()
+    build.assert_not_called()
+
+    index = VectorStore(str(tmp_path), 64).get(bot_id)
+    assert len(index.quantizer) == 400 and index.quantizer.trained_rows == 300
+    assert np.array_equal(index.quantizer.centroids, centroids)
+    assert index.keywords.search("ERR-42", 1)[0][0] == 342
+    assert index.search(embedder.embed(["second batch chunk 7 ERR-7"])[0], 1)[0][0] == 307
+
+    third = [f"third batch chunk {i}" for i in range(500)]
+    store.add(bot_id, embedder.embed(third), third, ["c.md"] * 500)
+    index = VectorStore(str(tmp_path), 64).get(bot_id)
+    assert index.quantizer.trained_rows == 900 and index.keywords.fitted_docs == 900
+
+
+async def test_vector_store_maps_indexes_and_evicts_least_recently_queried(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    writer = VectorStore(str(tmp_path), 64)
+    bots = [uuid4() for _ in range(3)]
+    for bot_id in bots:
+        writer.add(bot_id, embedder.embed(["some chunk text"] * 100), ["some chunk text"] * 100, ["doc.md"] * 100)
+
+    single = VectorStore(str(tmp_path), 64).get(bots[0]).nbytes
+    store = VectorStore(str(tmp_path), 64, memory_budget=2 * single)
+    first = store.get(bots[0])
+    assert isinstance(first.vectors, np.memmap)
+    assert first.texts[99] == "some chunk text"
+
+    store.get(bots[1])
+    store.get(bots[0])
+    store.get(bots[2])
+
+    assert list(store._indexes) == [str(bots[0]), str(bots[2])]
+    assert store.get(bots[0]) is first
+
+
+@pytest.mark.parametrize("quantization", ["int8", "pq"])
+async def test_quantized_index_is_persisted_and_finds_the_exact_top_hit(tmp_path, quantization):
+    embedder = HashingEmbedder(dim=64)
+    texts = [f"chunk about topic {i} and feature {i % 13}" for i in range(300)]
+    bot_id = uuid4()
+    VectorStore(str(tmp_path), 64, quantization=quantization, pq_subspaces=16).add(
+        bot_id, embedder.embed(texts), texts, ["doc.md"] * len(texts)
+    )
+
+    index = VectorStore(str(tmp_path), 64).get(bot_id)
+    assert index.quantizer.kind == quantization
+    assert index.quantizer.codes.nbytes < index.vectors.nbytes
+
+    query = embedder.embed(["topic 42 and feature 3"])[0]
+    assert index.search(query, 1)[0][0] == int(np.argmax(index.vectors @ query))
+
+
+async def test_ivf_index_probes_lists_and_extends_without_reclustering(tmp_path):
+    rng = np.random.default_rng(1)
+    topics = rng.standard_normal((20, 32)).astype(np.float32)
+
+    def sample(count):
+        vectors = topics[rng.integers(0, 20, count)] + 0.05 * rng.standard_normal((count, 32)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    vectors = sample(2000)
+    store = VectorStore(str(tmp_path), 32, ann="ivf", ann_min_rows=1000, ivf_lists=20)
+    bot_id = uuid4()
+    store.add(bot_id, vectors, ["chunk"] * 2000, ["doc.md"] * 2000)
+
+    index = VectorStore(str(tmp_path), 32).get(bot_id)
+    centroids = np.array(index.ann.centroids)
+    query = vectors[17]
+    assert index.search(query, 1, nprobe=2)[0][0] == 17
+
+    store.add(bot_id, sample(500), ["chunk"] * 500, ["doc.md"] * 500)
+    index = VectorStore(str(tmp_path), 32).get(bot_id)
+    assert len(index.ann) == 2500
+    assert np.array_equal(index.ann.centroids, centroids)
+
+
+async def test_small_bots_fall_back_to_exact_search(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    store = VectorStore(str(tmp_path), 64, ann="ivf", ann_min_rows=1000)
+    bot_id = uuid4()
+    store.add(bot_id, embedder.embed(["a", "b"]), ["a", "b"], ["doc.md"] * 2)
+
+    assert VectorStore(str(tmp_path), 64).get(bot_id).ann is None
+
+
+async def test_search_many_matches_single_query_search(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    texts = [f"chunk about topic {i} and feature {i % 13}" for i in range(300)]
+    index = BotIndex(64)
+    index.add(embedder.embed(texts), texts, ["doc.md"] * len(texts))
+    index.deleted = np.arange(300) % 7 == 0
+    queries = embedder.embed(["topic 42", "feature 3", "topic 7 and feature 7"])
+
+    def scores(results):
+        return [score for hits in results for _, score in hits]
+
+    for quantization in ("none", "int8"):
+        index.quantize(quantization)
+        batched = index.search_many(queries, 5)
+        assert scores(batched) == pytest.approx(scores([index.search(query, 5) for query in queries]), abs=1e-5)
+        assert not any(chunk_id % 7 == 0 for hits in batched for chunk_id, _ in hits)
+
+
+async def test_filter_selections_are_safe_to_cache_from_many_threads(tmp_path):
+    engine = RetrievalEngine(HashingEmbedder(dim=64), VectorStore(str(tmp_path), 64))
+    bot_id = uuid4()
+    files = [str(uuid4()) for _ in range(4)]
+    for i, file_id in enumerate(files):
+        engine.index_document(bot_id, f"Chunk number {i} about warranty.", f"doc{i}", file_id, source_type="file")
+    index = engine.store.get(bot_id)
+    filters = [ChunkFilter(files=frozenset({files[i % 4], str(i)})) for i in range(200)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        selected = list(pool.map(lambda chunk_filter: len(index.select(chunk_filter)[0]), filters * 4))
+
+    assert selected == [1] * 800
+    assert len(index._selections) == 16
+
+
+async def test_selection_racing_tombstones_is_not_cached_past_them(tmp_path):
+    engine = RetrievalEngine(HashingEmbedder(dim=64), VectorStore(str(tmp_path), 64))
+    bot_id = uuid4()
+    kept, archived = str(uuid4()), str(uuid4())
+    engine.index_document(bot_id, "Warranty claims need the receipt.", "kept.pdf", kept, source_type="file")
+    engine.index_document(bot_id, "Warranty used to last one year.", "old.pdf", archived, source_type="file")
+    index = engine.store.get(bot_id)
+    postings, computing, tombstoned = index.owner_postings, threading.Event(), threading.Event()
+
+    def slow_postings():
+        # the query is mid-selection when another thread applies the tombstones
+        computing.set()
+        tombstoned.wait(5)
+        return postings()
+
+    def tombstone():
+        computing.wait(5)
+        index.apply_tombstones({archived})
+        tombstoned.set()
+
+    with patch.object(index, "owner_postings", side_effect=slow_postings), ThreadPoolExecutor(max_workers=2) as pool:
+        racing = pool.submit(index.select, ChunkFilter())
+        pool.submit(tombstone).result()
+        assert len(racing.result()[0]) == 2
+
+    assert len(index.select(ChunkFilter())[0]) == 1
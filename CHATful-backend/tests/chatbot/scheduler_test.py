@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+
+from src.billing.models import PlanTier
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_scheduler_gives_higher_tiers_a_larger_share_of_slots(scheduler):
+    order = []
+    gate = asyncio.Event()
+
+    async def call(bot_id, tier):
+        async with scheduler.slot(bot_id, tier):
+            order.append(tier)
+            await gate.wait()
+
+    blocker = asyncio.create_task(call("blocker", PlanTier.FREE))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(call("free-bot", PlanTier.FREE)) for _ in range(3)]
+    tasks += [asyncio.create_task(call("vip-bot", PlanTier.VIP)) for _ in range(6)]
+    await asyncio.sleep(0)
+
+    gate.set()
+    await asyncio.gather(blocker, *tasks)
+
+    # weights 4:1 -> the VIP bot gets four slots for each FREE one while both are backlogged
+    assert order[1:6].count(PlanTier.VIP) == 4
+    assert order[1:4] == [PlanTier.VIP] * 3
+
+
+async def test_scheduler_per_bot_limit_lets_other_bots_through(scheduler):
+    scheduler.max_concurrency = 2
+    gate = asyncio.Event()
+    started = []
+
+    async def call(bot_id):
+        async with scheduler.slot(bot_id):
+            started.append(bot_id)
+            await gate.wait()
+
+    tasks = [asyncio.create_task(call("busy")), asyncio.create_task(call("busy")), asyncio.create_task(call("quiet"))]
+    await asyncio.sleep(0.01)
+    assert started == ["busy", "quiet"]
+
+    gate.set()
+    await asyncio.gather(*tasks)
+    assert started == ["busy", "quiet", "busy"]
+
+
+async def test_scheduler_sheds_with_retry_after_when_queue_is_full(scheduler):
+    scheduler.max_queue = 1
+    gate = asyncio.Event()
+
+    async def call():
+        async with scheduler.slot("bot"):
+            await gate.wait()
+
+    tasks = [asyncio.create_task(call()), asyncio.create_task(call())]
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc:
+        async with scheduler.slot("other"):
+            pass
+
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+    gate.set()
+    await asyncio.gather(*tasks)
+
+
+async def test_scheduler_sheds_after_max_wait_and_frees_queue_position(scheduler):
+    scheduler.max_wait = 0.01
+    gate = asyncio.Event()
+
+    async def call():
+        async with scheduler.slot("bot"):
+            await gate.wait()
+
+    holder = asyncio.create_task(call())
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc:
+        async with scheduler.slot("bot"):
+            pass
+
+    assert exc.value.status_code == 429
+    assert scheduler._queued == 0
+    gate.set()
+    await holder
+    assert scheduler._active == 0
+
+
+async def test_scheduler_cancelled_waiter_does_not_leak_a_slot(scheduler):
+    gate = asyncio.Event()
+
+    async def call():
+        async with scheduler.slot("bot"):
+            await gate.wait()
+
+    holder = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    gate.set()
+    await holder
+
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler._active == 0 and scheduler._queued == 0
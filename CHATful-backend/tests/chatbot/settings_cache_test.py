@@ -0,0 +1,98 @@
+import json
+import pytest
+from uuid import uuid4
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, ANY
+
+from src.chahtbot.settings_cache import ChatbotSettingsCache
+from src.chahtbot.models import BotStatus
+from src.billing.models import PlanTier
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_settings_cache_serves_repeat_lookups_from_process_memory(settings_cache, settings_redis):
+    cache, redis = settings_cache, settings_redis
+    bot = SimpleNamespace(user_id=uuid4(), allowed_hosts=["https://a.com"], status=BotStatus.ACTIVE, retrieval_weights=None, retrieval_filter=None)
+    repo = Mock(get_chatbot_by_id=AsyncMock(return_value=bot), get_owner_plan_tier=AsyncMock(return_value=PlanTier.PRO))
+    bot_id = uuid4()
+
+    first = await cache.get(bot_id, repo, redis)
+    second = await cache.get(bot_id, repo, redis)
+
+    assert first is second
+    assert first["allowed_hosts"] == ["https://a.com"] and first["status"] == "active"
+    assert first["tier"] == PlanTier.PRO
+    assert first["origin_matcher"].matches("https://a.com")
+    redis.hmget.assert_awaited_once()
+    repo.get_chatbot_by_id.assert_awaited_once()
+
+
+async def test_settings_cache_ignores_redis_data_from_an_older_version(settings_cache, settings_redis, settings_pipe):
+    cache, redis = settings_cache, settings_redis
+    stale = json.dumps({"version": 1, "settings": {"allowed_hosts": ["*"], "status": "active"}})
+    redis.hmget.return_value = ["2", stale]
+    settings_pipe.execute.return_value = [1, True, "2"]
+    bot = SimpleNamespace(user_id=uuid4(), allowed_hosts=["https://new.com"], status=BotStatus.ACTIVE, retrieval_weights=None, retrieval_filter=None)
+    repo = Mock(get_chatbot_by_id=AsyncMock(return_value=bot), get_owner_plan_tier=AsyncMock(return_value=PlanTier.PRO))
+
+    result = await cache.get(uuid4(), repo, redis)
+
+    assert result["allowed_hosts"] == ["https://new.com"]
+    assert json.loads(settings_pipe.hset.call_args.args[2])["version"] == 2
+
+
+async def test_settings_cache_does_not_keep_a_load_that_raced_an_invalidation(settings_cache, settings_redis, settings_pipe):
+    cache, redis = settings_cache, settings_redis
+    redis.hmget.return_value = ["2", None]
+    settings_pipe.execute.return_value = [1, True, "3"]
+    bot = SimpleNamespace(user_id=uuid4(), allowed_hosts=["https://old.com"], status=BotStatus.ACTIVE, retrieval_weights=None, retrieval_filter=None)
+    repo = Mock(get_chatbot_by_id=AsyncMock(return_value=bot), get_owner_plan_tier=AsyncMock(return_value=PlanTier.PRO))
+    bot_id = uuid4()
+
+    result = await cache.get(bot_id, repo, redis)
+
+    assert result["allowed_hosts"] == ["https://old.com"]
+    assert str(bot_id) not in cache._entries
+
+
+async def test_settings_cache_negative_caches_unknown_bots(settings_cache, settings_redis, settings_pipe):
+    cache, redis = settings_cache, settings_redis
+    cache.negative_ttl = 30
+    repo = Mock(get_chatbot_by_id=AsyncMock(return_value=None))
+    bot_id = uuid4()
+
+    assert await cache.get(bot_id, repo, redis) is None
+    assert await cache.get(bot_id, repo, redis) is None
+    repo.get_chatbot_by_id.assert_awaited_once()
+    settings_pipe.expire.assert_called_once_with(ANY, 30)
+
+
+async def test_settings_cache_is_bounded_lru(settings_cache, settings_redis):
+    cache, redis = settings_cache, settings_redis
+    cache.max_entries = 2
+    repo = Mock(
+        get_chatbot_by_id=AsyncMock(return_value=SimpleNamespace(user_id=uuid4(), allowed_hosts=["*"], status=BotStatus.ACTIVE, retrieval_weights=None, retrieval_filter=None)),
+        get_owner_plan_tier=AsyncMock(return_value=PlanTier.FREE),
+    )
+    a, b, c = uuid4(), uuid4(), uuid4()
+
+    await cache.get(a, repo, redis)
+    await cache.get(b, repo, redis)
+    await cache.get(a, repo, redis)
+    await cache.get(c, repo, redis)
+
+    assert list(cache._entries) == [str(a), str(c)]
+
+
+async def test_settings_cache_invalidate_drops_local_copy_and_publishes(settings_cache, settings_redis, settings_pipe):
+    cache, redis = settings_cache, settings_redis
+    bot_id = uuid4()
+    cache._remember(str(bot_id), {"allowed_hosts": ["*"]})
+
+    await cache.invalidate(bot_id, redis)
+
+    assert str(bot_id) not in cache._entries
+    settings_pipe.hincrby.assert_called_once()
+    settings_pipe.publish.assert_called_once_with(ChatbotSettingsCache.CHANNEL, str(bot_id))
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, Mock
+from fastapi import HTTPException
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_singleflight_shares_one_call_between_concurrent_callers(flight):
+    release = asyncio.Event()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await release.wait()
+        return 200, "answer"
+
+    callers = [asyncio.create_task(flight.do("bot:q", fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*callers) == [(200, "answer")] * 5
+    assert len(calls) == 1
+    assert flight._inflight == {}
+
+
+async def test_singleflight_propagates_upstream_errors_to_every_waiter(flight):
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise HTTPException(status_code=502, detail="n8n request failed")
+
+    results = await asyncio.gather(*(flight.do("bot:q", fetch) for _ in range(3)), return_exceptions=True)
+
+    assert [r.status_code for r in results] == [502, 502, 502]
+
+
+async def test_singleflight_sheds_waiters_over_the_bound(flight):
+    flight.max_waiters = 2
+    release = asyncio.Event()
+
+    async def fetch():
+        await release.wait()
+        return "answer"
+
+    callers = [asyncio.create_task(flight.do("bot:q", fetch)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc:
+        await flight.do("bot:q", fetch)
+
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "1"
+    release.set()
+    await asyncio.gather(*callers)
+
+
+async def test_singleflight_waiters_time_out(flight):
+    flight.wait_timeout = 0.01
+
+    async def fetch():
+        await asyncio.sleep(1)
+
+    with pytest.raises(HTTPException) as exc:
+        await flight.do("bot:q", fetch)
+
+    assert exc.value.status_code == 504
+
+
+async def test_singleflight_followers_read_only_their_flights_result(flight):
+    values = {
+        "test:bot:q:lock": "t2",
+        "test:bot:q:result:t1": json.dumps({"token": "t1", "result": "old answer"}),
+        "test:bot:q:result:t2": json.dumps({"token": "t2", "result": "answer"}),
+    }
+    pubsub = Mock(subscribe=AsyncMock(), unsubscribe=AsyncMock(), aclose=AsyncMock())
+    redis = Mock(set=AsyncMock(return_value=False), get=AsyncMock(side_effect=values.get), pubsub=Mock(return_value=pubsub))
+
+    assert await flight.do("bot:q", AsyncMock(), redis) == "answer"
+
+
+async def test_singleflight_relays_errors_live_with_retry_after_and_never_stores_them(flight):
+    messages = [
+        {"token": "t0", "result": "earlier flight"},
+        {"token": "t1", "status_code": 503, "detail": "N8N unavailable", "headers": {"Retry-After": "7"}},
+    ]
+    pubsub = Mock(subscribe=AsyncMock(), unsubscribe=AsyncMock(), aclose=AsyncMock(),
+                  get_message=AsyncMock(side_effect=[{"data": json.dumps(m)} for m in messages]))
+    redis = Mock(set=AsyncMock(return_value=False), get=AsyncMock(side_effect={"test:bot:q:lock": "t1"}.get),
+                 pubsub=Mock(return_value=pubsub))
+
+    with pytest.raises(HTTPException) as exc:
+        await flight.do("bot:q", AsyncMock(), redis)
+
+    assert exc.value.status_code == 503
+    assert exc.value.headers == {"Retry-After": "7"}
+
+    pipe = Mock(execute=AsyncMock())
+    leader = Mock(set=AsyncMock(return_value=True), eval=AsyncMock(), pipeline=Mock(return_value=pipe))
+    fetch = AsyncMock(side_effect=HTTPException(status_code=503, detail="N8N unavailable", headers={"Retry-After": "7"}))
+
+    with pytest.raises(HTTPException):
+        await flight.do("bot:q", fetch, leader)
+
+    pipe.set.assert_not_called()
+    published = json.loads(pipe.publish.call_args.args[1])
+    assert published["headers"] == {"Retry-After": "7"}
+    assert published["token"] == leader.set.call_args.args[1]
@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_transcript_writer_flushes_full_batches_as_one_insert(transcript_writer, transcript_batches):
+    writer, batches = transcript_writer, transcript_batches
+    writer.start()
+
+    for i in range(3):
+        assert await writer.record({"question": f"q{i}"})
+    await asyncio.sleep(0.01)
+
+    assert batches == [[{"question": "q0"}, {"question": "q1"}, {"question": "q2"}]]
+    await writer.stop()
+
+
+async def test_transcript_writer_flushes_partial_batch_after_interval_and_drains_on_stop(transcript_writer, transcript_batches):
+    writer, batches = transcript_writer, transcript_batches
+    writer.batch_size = 100
+    writer.start()
+
+    await writer.record({"question": "early"})
+    await asyncio.sleep(0.1)
+    assert batches == [[{"question": "early"}]]
+
+    await writer.record({"question": "late"})
+    await writer.stop()
+    assert batches[-1] == [{"question": "late"}]
+    assert not await writer.record({"question": "after stop"})
+
+
+async def test_transcript_writer_drops_rows_when_buffer_stays_full(transcript_writer):
+    writer = transcript_writer
+    writer._queue = asyncio.Queue(maxsize=1)  # buffer without a worker draining it
+
+    assert await writer.record({"question": "kept"})
+    assert not await writer.record({"question": "dropped"})
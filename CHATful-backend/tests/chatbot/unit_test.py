@@ -0,0 +1,200 @@
+import pytest
+from uuid import uuid4
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+from fastapi import HTTPException
+
+from src.chahtbot.service import ChatbotService, KnowledgebaseService
+from src.resilience import CircuitOpenError
+from src.chahtbot.origins import OriginMatcher
+from src.chahtbot.retrieval.engine import Hit
+from src.chahtbot.retrieval.store import VectorStore
+from src.chahtbot.tasks import index_file_task
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_send_msg_returns_cached_answer_without_calling_n8n(chat_request):
+    data = SimpleNamespace(bot_id=uuid4(), message="hi", visitor_id=uuid4())
+
+    with patch("src.chahtbot.service.ChatbotUtils.get_chatbot_settings_cached", new=AsyncMock(return_value={"allowed_hosts": ["*"], "origin_matcher": OriginMatcher(["*"])})), \
+         patch("src.chahtbot.service.AnswerCache.get", new=AsyncMock(return_value=("cached", 3))), \
+         patch("src.chahtbot.service.ConversationStore.exists", new=AsyncMock(return_value=False)), \
+         patch("src.chahtbot.service.ConversationStore.append", new=AsyncMock()), \
+         patch("src.chahtbot.service.N8N.send_msg_to_n8n", new=AsyncMock()) as send:
+        status, msg = await ChatbotService.send_msg(data, Mock(), chat_request, Mock())
+
+    assert (status, msg) == (200, "cached")
+    send.assert_not_awaited()
+
+
+async def test_send_msg_caches_upstream_answer_under_lookup_generation(chat_request):
+    data = SimpleNamespace(bot_id=uuid4(), message="hi", visitor_id=uuid4())
+    redis = Mock()
+
+    with patch("src.chahtbot.service.ChatbotUtils.get_chatbot_settings_cached", new=AsyncMock(return_value={"allowed_hosts": ["*"], "origin_matcher": OriginMatcher(["*"])})), \
+         patch("src.chahtbot.service.AnswerCache.get", new=AsyncMock(return_value=(None, 3))), \
+         patch("src.chahtbot.service.ConversationStore.exists", new=AsyncMock(return_value=False)), \
+         patch("src.chahtbot.service.ConversationStore.append", new=AsyncMock()) as append, \
+         patch("src.chahtbot.service.AnswerCache.set", new=AsyncMock()) as cache_set, \
+         patch("src.chahtbot.service.chat_singleflight.do", new=lambda key, fn, redis: fn()), \
+         patch("src.chahtbot.service.N8N.send_msg_to_n8n", new=AsyncMock(return_value=(200, "fresh"))):
+        status, msg = await ChatbotService.send_msg(data, Mock(), chat_request, redis)
+
+    assert (status, msg) == (200, "fresh")
+    cache_set.assert_awaited_once_with(redis, data.bot_id, "hi", "fresh", 3)
+    append.assert_awaited_once_with(redis, data.bot_id, data.visitor_id, ("user", "hi"), ("assistant", "fresh"))
+
+
+async def test_send_msg_follow_up_skips_answer_cache_and_sends_history(chat_request):
+    data = SimpleNamespace(bot_id=uuid4(), message="and the price?", visitor_id=uuid4())
+    history = [{"role": "user", "content": "tell me about plan A"}, {"role": "assistant", "content": "Plan A is ..."}]
+
+    with patch("src.chahtbot.service.ChatbotUtils.get_chatbot_settings_cached", new=AsyncMock(return_value={"allowed_hosts": ["*"], "origin_matcher": OriginMatcher(["*"])})), \
+         patch("src.chahtbot.service.ConversationStore.exists", new=AsyncMock(return_value=True)), \
+         patch("src.chahtbot.service.ConversationStore.history", new=AsyncMock(return_value=history)), \
+         patch("src.chahtbot.service.ConversationStore.append", new=AsyncMock()), \
+         patch("src.chahtbot.service.AnswerCache.get", new=AsyncMock()) as cache_get, \
+         patch("src.chahtbot.service.N8N.send_msg_to_n8n", new=AsyncMock(return_value=(200, "$10"))) as send:
+        status, msg = await ChatbotService.send_msg(data, Mock(), chat_request, Mock())
+
+    assert (status, msg) == (200, "$10")
+    cache_get.assert_not_awaited()
+    send.assert_awaited_once_with("and the price?", data.bot_id, data.visitor_id, history, None)
+
+
+async def test_send_msg_in_local_mode_sends_retrieved_context(chat_request):
+    data = SimpleNamespace(bot_id=uuid4(), message="and the price?", visitor_id=uuid4())
+    history = [{"role": "user", "content": "plan A?"}, {"role": "assistant", "content": "Plan A is ..."}]
+
+    with patch("src.chahtbot.service.ChatbotUtils.get_chatbot_settings_cached", new=AsyncMock(return_value={"allowed_hosts": ["*"], "origin_matcher": OriginMatcher(["*"])})), \
+         patch("src.chahtbot.service.ConversationStore.exists", new=AsyncMock(return_value=True)), \
+         patch("src.chahtbot.service.ConversationStore.history", new=AsyncMock(return_value=history)), \
+         patch("src.chahtbot.service.ConversationStore.append", new=AsyncMock()), \
+         patch("src.chahtbot.service.settings.retrieval_mode", "local"), \
+         patch("src.chahtbot.service.retrieval_engine.search", return_value=[Hit(0, 0.9, "Plan A costs $10.", "pricing.md")]), \
+         patch("src.chahtbot.service.N8N.send_msg_to_n8n", new=AsyncMock(return_value=(200, "$10"))) as send:
+        await ChatbotService.send_msg(data, Mock(), chat_request, Mock())
+
+    send.assert_awaited_once_with("and the price?", data.bot_id, data.visitor_id, history, "[1] (pricing.md)\nPlan A costs $10.")
+
+
+async def test_send_msg_serves_stale_answer_while_circuit_is_open(chat_request):
+    data = SimpleNamespace(bot_id=uuid4(), message="hi", visitor_id=uuid4())
+
+    with patch("src.chahtbot.service.ChatbotUtils.get_chatbot_settings_cached", new=AsyncMock(return_value={"allowed_hosts": ["*"], "origin_matcher": OriginMatcher(["*"])})), \
+         patch("src.chahtbot.service.ConversationStore.exists", new=AsyncMock(return_value=False)), \
+         patch("src.chahtbot.service.ConversationStore.append", new=AsyncMock()), \
+         patch("src.chahtbot.service.AnswerCache.get", new=AsyncMock(return_value=(None, 1))), \
+         patch("src.chahtbot.service.AnswerCache.get_stale", new=AsyncMock(return_value="old answer")), \
+         patch("src.chahtbot.service.chat_singleflight.do", new=lambda key, fn, redis: fn()), \
+         patch("src.chahtbot.service.n8n_breaker.check", side_effect=CircuitOpenError("n8n", 10)), \
+         patch("src.chahtbot.service.N8N.send_msg_to_n8n", new=AsyncMock()) as send:
+        status, msg = await ChatbotService.send_msg(data, Mock(), chat_request, Mock())
+
+    assert (status, msg) == (200, "old answer")
+    send.assert_not_awaited()
+
+
+async def test_stream_msg_sheds_before_the_response_starts_and_frees_unread_bodies(chat_request, scheduler):
+    data = SimpleNamespace(bot_id=uuid4(), message="hi", visitor_id=uuid4())
+    scheduler.max_queue = 0
+
+    with patch("src.chahtbot.service.ChatbotUtils.get_chatbot_settings_cached", new=AsyncMock(return_value={"allowed_hosts": ["*"], "origin_matcher": OriginMatcher(["*"])})), \
+         patch("src.chahtbot.service.ConversationStore.exists", new=AsyncMock(return_value=False)), \
+         patch("src.chahtbot.service.AnswerCache.get", new=AsyncMock(return_value=(None, 1))), \
+         patch("src.chahtbot.service.ChatbotService._local_context", new=AsyncMock(return_value=None)), \
+         patch("src.chahtbot.service.upstream_scheduler", new=scheduler):
+        tokens = await ChatbotService.stream_msg(data, Mock(), chat_request, Mock())
+
+        with pytest.raises(HTTPException) as exc:
+            await ChatbotService.stream_msg(data, Mock(), chat_request, Mock())
+
+        assert exc.value.status_code == 429
+        assert "Retry-After" in exc.value.headers
+
+        del tokens  # the response never started iterating
+        await ChatbotService.stream_msg(data, Mock(), chat_request, Mock())
+
+
+async def test_create_file_chatbot_indexes_locally_in_hybrid_mode_under_its_file_id():
+    bot, kb_file = SimpleNamespace(id=uuid4()), SimpleNamespace(id=uuid4())
+    bot_repo = Mock(create_chatbot=AsyncMock(return_value=bot), add_knowledgebase_file=AsyncMock(return_value=kb_file))
+    file = SimpleNamespace(filename="faq.pdf", content_type="application/pdf", read=AsyncMock(return_value=b"%PDF"))
+    data = SimpleNamespace(source_type="file")
+
+    with patch("src.chahtbot.service.settings.retrieval_mode", "hybrid"), \
+         patch("src.chahtbot.service.pdf_to_markdown") as convert, \
+         patch("src.chahtbot.service.retrieval_engine.store.expect"), \
+         patch("src.chahtbot.service.retrieval_engine.store.save_upload", return_value="/uploads/faq") as save, \
+         patch("src.chahtbot.service.index_file_task.delay") as delay, \
+         patch("src.chahtbot.service.N8N.send_to_n8n", new=AsyncMock()):
+        await ChatbotService.create_chatbot(data, file, bot_repo, SimpleNamespace(id=uuid4()))
+
+    convert.assert_not_called()
+    save.assert_called_once_with(str(kb_file.id), b"%PDF")
+    delay.assert_called_once_with(str(bot.id), "/uploads/faq", "faq.pdf", str(kb_file.id), True, "file")
+
+
+async def test_index_file_task_converts_the_parked_upload_and_removes_it(tmp_path):
+    store = VectorStore(str(tmp_path), 64)
+    path = store.save_upload("file-1", b"%PDF")
+
+    with patch("src.chahtbot.tasks.retrieval_engine.store", new=store), \
+         patch("src.chahtbot.tasks.pdf_to_markdown", return_value="# FAQ") as convert, \
+         patch("src.chahtbot.tasks.retrieval_engine.index_document", return_value=SimpleNamespace(chunks=1, merged=0, dedup_ratio=0.0, bytes_saved=0)) as index:
+        index_file_task("bot-1", path, "faq.pdf", "file-1", True, "file")
+
+    convert.assert_called_once_with(b"%PDF")
+    index.assert_called_once_with("bot-1", "# FAQ", "faq.pdf", "file-1", True, "file")
+    assert not (tmp_path / ".uploads" / "file-1").exists()
+
+
+async def test_ingestion_completed_webhook_invalidates_answer_cache():
+    bot_id = str(uuid4())
+    request = SimpleNamespace(
+        body=AsyncMock(return_value=b"{}"),
+        json=AsyncMock(return_value={"bot_id": bot_id, "type": "chatbot.ingestion.completed"}),
+    )
+    repo = Mock(update_chatbot_status=AsyncMock())
+    redis = Mock()
+
+    with patch("src.chahtbot.service.N8N.verify_sig"), \
+         patch("src.chahtbot.service.retrieval_engine.store.publish") as publish, \
+         patch("src.chahtbot.service.AnswerCache.invalidate", new=AsyncMock()) as invalidate, \
+         patch("src.chahtbot.service.chatbot_settings_cache.invalidate", new=AsyncMock()) as invalidate_settings:
+        assert await ChatbotService.chatbot_webhook(request, "sig", repo, redis) is True
+
+    publish.assert_called_once_with(bot_id)
+    invalidate.assert_awaited_once_with(redis, bot_id)
+    invalidate_settings.assert_awaited_once_with(bot_id, redis)
+
+
+async def test_archive_file_schedules_compaction_past_the_ratio():
+    user, file = SimpleNamespace(id=uuid4()), SimpleNamespace(id=uuid4(), bot_id=uuid4())
+    file.user_id = user.id
+    repo = SimpleNamespace(get_file_by_id=AsyncMock(return_value=file), archive_file=AsyncMock())
+
+    with patch("src.chahtbot.service.settings.retrieval_mode", "local"), \
+         patch("src.chahtbot.service.retrieval_engine.archive_file", return_value=0.5) as archive, \
+         patch("src.chahtbot.service.compact_index_task.delay") as compact:
+        assert await KnowledgebaseService.archive_file(user, file.id, repo) is True
+
+    archive.assert_called_once_with(file.bot_id, file.id)
+    compact.assert_called_once_with(str(file.bot_id))
+
+
+async def test_archive_file_leaves_local_retrieval_alone_in_n8n_mode():
+    user, file = SimpleNamespace(id=uuid4()), SimpleNamespace(id=uuid4(), bot_id=uuid4())
+    file.user_id = user.id
+    repo = SimpleNamespace(get_file_by_id=AsyncMock(return_value=file), archive_file=AsyncMock())
+
+    with patch("src.chahtbot.service.settings.retrieval_mode", "n8n"), \
+         patch("src.chahtbot.service.retrieval_engine.archive_file") as archive, \
+         patch("src.chahtbot.service.compact_index_task.delay") as compact:
+        assert await KnowledgebaseService.archive_file(user, file.id, repo) is True
+
+    repo.archive_file.assert_awaited_once_with(file)
+    archive.assert_not_called()
+    compact.assert_not_called()
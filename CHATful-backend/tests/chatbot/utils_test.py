@@ -0,0 +1,136 @@
+import json
+import pytest
+import httpx
+from uuid import uuid4
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+from fastapi import HTTPException
+
+from src.chahtbot.utils import N8N, ChatbotUtils, MarkdownStreamStripper
+from src.chahtbot.origins import OriginMatcher
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_send_msg_to_n8n_uses_registry_client():
+    response = Mock(status_code=200)
+    response.json.return_value = [{"output": "hello"}]
+    client = SimpleNamespace(post=AsyncMock(return_value=response))
+
+    with patch("src.chahtbot.utils.http_clients.get", return_value=client) as get_client:
+        status, msg = await N8N.send_msg_to_n8n("hi", uuid4())
+
+    get_client.assert_called_once_with("n8n")
+    client.post.assert_awaited_once()
+    assert status == 200
+    assert msg == "hello"
+
+
+async def test_send_msg_to_n8n_upstream_error():
+    response = Mock(status_code=500)
+    client = SimpleNamespace(post=AsyncMock(return_value=response))
+
+    with patch("src.chahtbot.utils.http_clients.get", return_value=client):
+        with pytest.raises(HTTPException) as exc:
+            await N8N.send_msg_to_n8n("hi", uuid4())
+
+    assert exc.value.status_code == 500
+
+
+async def test_n8n_chat_payload_carries_session_and_history():
+    bot_id, visitor_id = uuid4(), uuid4()
+    payload = N8N.chat_payload("hi", bot_id, visitor_id, [{"role": "user", "content": "x"}])
+
+    assert payload["sessionId"] == f"{bot_id}:{visitor_id}"
+    assert payload["history"] == [{"role": "user", "content": "x"}]
+    assert "history" not in N8N.chat_payload("hi", bot_id)
+
+
+def _strip_in_pieces(text: str, cuts: list[int]) -> str:
+    stripper = MarkdownStreamStripper()
+    bounds = [0, *cuts, len(text)]
+    out = [stripper.feed(text[a:b]) for a, b in zip(bounds, bounds[1:])]
+    return "".join(out) + stripper.flush()
+
+
+async def test_markdown_stream_stripper_strips_common_markdown():
+    text = "# Title\n\nSome **bold** and *it* text.\n\n- one\n1. two\n> quote\n```py\ncode *x*\n```\nA [link](http://x.com) 5 * 3 snake_case"
+
+    result = _strip_in_pieces(text, [])
+
+    assert result == "Title\n\nSome bold and it text.\n\none\ntwo\nquote\ncode *x*\nA link 5 * 3 snake_case"
+
+
+async def test_markdown_stream_stripper_is_safe_across_chunk_boundaries():
+    text = "## Plans\n**Pro** costs *$10* — see [pricing](https://x.com/p) or `docs`.\n---\n1. snake_case ok \\*kept\\*"
+    expected = _strip_in_pieces(text, [])
+
+    for cut in range(len(text)):
+        assert _strip_in_pieces(text, [cut]) == expected
+    assert _strip_in_pieces(text, list(range(1, len(text)))) == expected
+
+
+async def test_stream_msg_from_n8n_relays_ndjson_items():
+    body = b'{"type":"begin"}\n{"type":"item","content":"Hel"}\n{"type":"item","content":"lo"}\n{"type":"end"}\n'
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body)))
+
+    with patch("src.chahtbot.utils.http_clients.get", return_value=client):
+        chunks = [chunk async for chunk in N8N.stream_msg_from_n8n("hi", uuid4())]
+
+    assert chunks == ["Hel", "lo"]
+    await client.aclose()
+
+
+async def test_stream_msg_from_n8n_falls_back_to_single_json_body():
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=[{"output": "full answer"}])))
+
+    with patch("src.chahtbot.utils.http_clients.get", return_value=client):
+        chunks = [chunk async for chunk in N8N.stream_msg_from_n8n("hi", uuid4())]
+
+    assert chunks == ["full answer"]
+    await client.aclose()
+
+
+async def test_stream_interrupted_mid_answer_ends_with_error_event():
+    class DroppedStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'{"type":"item","content":"Hel"}\n'
+            raise httpx.RemoteProtocolError("peer closed connection without sending complete message body")
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, stream=DroppedStream())))
+
+    with patch("src.chahtbot.utils.http_clients.get", return_value=client):
+        frames = [frame async for frame in ChatbotUtils.ndjson_events(N8N.stream_msg_from_n8n("hi", uuid4()))]
+
+    assert [json.loads(frame)["type"] for frame in frames] == ["token", "error"]
+    assert json.loads(frames[1])["status_code"] == 502
+    await client.aclose()
+
+
+async def test_sse_events_reports_errors_as_events():
+    async def tokens():
+        yield "Hi"
+        raise HTTPException(status_code=502, detail="n8n stream failed")
+
+    frames = [frame async for frame in ChatbotUtils.sse_events(tokens())]
+
+    assert frames[0] == 'event: token\ndata: {"text": "Hi"}\n\n'
+    assert frames[1].startswith("event: error")
+
+
+async def test_get_chatbot_settings_cached_unknown_bot_is_404():
+    with patch("src.chahtbot.utils.chatbot_settings_cache.get", new=AsyncMock(return_value=None)):
+        with pytest.raises(HTTPException) as exc:
+            await ChatbotUtils.get_chatbot_settings_cached(uuid4(), Mock(), Mock())
+
+    assert exc.value.status_code == 404
+
+
+async def test_extract_origin_reduces_referer_to_origin():
+    request = SimpleNamespace(headers={"referer": "https://shop.example.com/products/1?ref=ad"})
+    assert ChatbotUtils.extract_origin(request) == "https://shop.example.com"
+
+    with pytest.raises(HTTPException) as exc:
+        ChatbotUtils.ensure_origin_allowed(ChatbotUtils.extract_origin(request), OriginMatcher(["https://example.com"]))
+    assert exc.value.status_code == 403